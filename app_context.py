@@ -0,0 +1,145 @@
+import uuid
+
+from utils import BillLogOutbox
+
+
+class Cart:
+    def __init__(self, items=None, on_change=None):
+        self.items = items or []  # รายการสินค้าในรถเข็น
+        self.token = uuid.uuid4().hex  # เปลี่ยนทุกครั้งที่รถเข็นเปลี่ยน ใช้เป็นคีย์กันการชำระเงินซ้ำ
+        self.on_change = on_change  # เรียกด้วย cart หลังรถเข็นเปลี่ยน (เช่น บันทึกลง CartStore)
+
+    def changed(self):
+        self.token = uuid.uuid4().hex
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def add_item(self, product_name, quantity, price, unit):
+        self.items.append({
+            'product_name': product_name,
+            'quantity': quantity,
+            'price': price,
+            'unit': unit
+        })
+        self.changed()
+
+    def clear(self):
+        self.items = []
+        self.changed()
+
+    def get_total(self):
+        return sum(item['price'] * item['quantity'] for item in self.items)
+
+    def get_items(self):
+        return self.items
+
+
+class AppContext:
+    """บริการและสถานะที่ใช้ร่วมกันทั้ง bot: stock manager, คิวล็อกใบเสร็จ, รถเข็น และค่าตั้งค่า
+
+    สร้างครั้งเดียวใน bot.py แล้วส่งให้ view ทุกตัว view จึงไม่ต้อง import bot
+    (เมื่อเริ่มด้วย python bot.py โมดูลหลักชื่อ __main__ การ import bot จะรัน bot.py ซ้ำอีกรอบ
+    ได้ StockManager ตัวที่สองที่ต้องเชื่อมต่อ Google ใหม่ และ user_carts คนละชุดกัน)
+    """
+
+    def __init__(self, stock_manager, bill_history_channel_id=None, create_sales_channel=None, cart_store=None):
+        self.stock_manager = stock_manager
+        self.bill_history_channel_id = bill_history_channel_id
+        self.create_sales_channel = create_sales_channel  # async (guild, user) -> ช่องแชทการขาย
+        self.bill_log = BillLogOutbox()  # ส่งล็อกใบเสร็จไปยังช่องประวัติบิลเบื้องหลัง
+        self.user_carts = {}  # user_id -> Cart (โหลดจาก cart_store เมื่อผู้ใช้เรียกใช้รถเข็นครั้งแรก)
+        self.cart_store = cart_store  # CartStore หรือ None (รถเข็นหายเมื่อรีสตาร์ท)
+        self.pending_image_uploads = {}  # user_id -> ข้อมูลสินค้าที่รอการอัปโหลดรูป
+        self.active_sales = {}
+        self.sales_channels = {}  # user_id -> ID ช่องแชทการขาย
+
+    def checkout_key(self, user_id):
+        """คีย์การขายของรถเข็นในสภาพปัจจุบัน (!checkout และปุ่มชำระเงินที่กดซ้ำจะได้คีย์เดียวกัน)"""
+        return f"cart-{user_id}-{self.get_cart(user_id).token}"
+
+    def get_cart(self, user_id):
+        """รถเข็นของผู้ใช้ (โหลดจาก cart_store หรือสร้างใหม่ถ้ายังไม่มีในหน่วยความจำ)"""
+        if user_id not in self.user_carts:
+            if self.cart_store is None:
+                self.user_carts[user_id] = Cart()
+            else:
+                store = self.cart_store
+                self.user_carts[user_id] = Cart(
+                    store.load(user_id),
+                    on_change=lambda cart: store.save(user_id, cart.items)
+                )
+        return self.user_carts[user_id]
+
+    def close(self):
+        """เขียนรถเข็นที่ค้างอยู่ลงที่เก็บ (เรียกตอนปิด bot)"""
+        if self.cart_store is not None:
+            self.cart_store.close()
+
+    async def add_item_to_cart(self, user_id, product_name, quantity):
+        """เพิ่มสินค้าลงรถเข็นและกันสินค้าไว้ให้ผู้ใช้ คืน dict ผลลัพธ์ (success, error_type, message, ...)"""
+        cart = self.get_cart(user_id)
+
+        # ค้นหาสินค้าผ่าน index ชื่อสินค้า และกันสินค้าไว้ถ้าจำนวนพร้อมขาย (สต็อกหักที่คนอื่นกันไว้) พอ
+        product, available_quantity = await self.stock_manager.hold_stock(user_id, product_name, quantity)
+
+        if product:
+            # ใช้ชื่อสินค้าตามที่บันทึกในชีต
+            product_name = product.get('ชื่อสินค้า', product_name)
+
+            # ตรวจสอบสต็อกเพียงพอหรือไม่
+            if available_quantity < quantity:
+                return {
+                    'success': False,
+                    'error_type': 'insufficient_stock',
+                    'message': f"สินค้า **{product_name}** เหลือเพียง {available_quantity} {product.get('หน่วย', 'ชิ้น')}",
+                    'available_quantity': available_quantity,
+                    'unit': product.get('หน่วย', 'ชิ้น')
+                }
+
+            price = float(product.get('ราคา', 0))
+            unit = product.get('หน่วย', 'ชิ้น')
+            cart.add_item(product_name, quantity, price, unit)
+
+            # แสดงรายการสินค้าในรถเข็นทั้งหมด
+            cart_items = cart.get_items()
+            total_price = cart.get_total()
+
+            # สร้างรายการสินค้าในรถเข็น
+            cart_list = ""
+            for i, item in enumerate(cart_items, 1):
+                item_total = item['price'] * item['quantity']
+                cart_list += f"{i}. **{item['product_name']}** x{item['quantity']} {item['unit']} = {item_total:,.0f} บาท\n"
+
+            return {
+                'success': True,
+                'product_name': product_name,
+                'quantity': quantity,
+                'cart_items': cart_items,
+                'cart_list': cart_list,
+                'total_price': total_price
+            }
+
+        # ไม่พบสินค้า
+        return {
+            'success': False,
+            'error_type': 'product_not_found',
+            'message': f"ไม่พบสินค้า **{product_name}** ในระบบ"
+        }
+
+    async def clear_cart(self, user_id):
+        """ล้างรถเข็นของผู้ใช้และคืนสินค้าที่กันไว้"""
+        self.get_cart(user_id).clear()
+        await self.stock_manager.release_hold(user_id)
+
+    async def cart_stock_errors(self, user_id):
+        """ตรวจสอบสินค้าในรถเข็นทีละรายการ คืนรายการข้อความปัญหา (ใช้หลังขายไม่สำเร็จเพื่อแจ้งผู้ใช้)"""
+        errors = []
+        for item in self.get_cart(user_id).get_items():
+            product = await self.stock_manager.check_stock(item['product_name'])
+            if not product:
+                errors.append(f"❌ {item['product_name']}: ไม่พบสินค้าในระบบ")
+                continue
+            available = await self.stock_manager.available_quantity(product, user_id)
+            if available < item['quantity']:
+                errors.append(f"❌ {item['product_name']}: สต็อกไม่เพียงพอ (มี {available} ต้องการ {item['quantity']})")
+        return errors
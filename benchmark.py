@@ -0,0 +1,459 @@
+"""วัดประสิทธิภาพของคำสั่งและขั้นตอนการขายหลักของ CatBot แบบไม่ใช้เครือข่าย
+
+รันคำสั่งจริงใน bot.py, ui_components.py และ ui/views/product_card_view.py กับ Discord จำลอง
+และ Google Sheets จำลอง (FakeSheetsClient) แล้วรายงานต่อเส้นทาง:
+เวลาที่ใช้ (ครั้งแรกและครั้งถัดไป), จำนวนคำขอ Sheets API, ขนาดข้อมูลที่รับส่ง
+และเวลาที่ event loop ถูกบล็อก ในทุกขนาดของจำนวนสินค้าและจำนวนแถวประวัติที่กำหนด
+
+ตัวอย่าง:
+    python benchmark.py
+    python benchmark.py --products 10 1000 10000 --history 1000 1000000 --latency 0.2
+    python benchmark.py --backend sheets sqlite memory --json bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# ตั้งค่าก่อน import bot: ไม่เชื่อมต่อ Google และเก็บไฟล์ข้อมูลในโฟลเดอร์ชั่วคราว
+DATA_DIR = tempfile.mkdtemp(prefix='catbot-bench-')
+os.environ.update({
+    'STORAGE_BACKEND': 'memory',
+    'CATBOT_DATA_DIR': DATA_DIR,
+    'GOOGLE_SHEETS_ID': 'benchmark'
+})
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import bot
+    import ui_components
+    from storage import MemoryBackend, SheetsBackend, SQLiteBackend
+    from ui.views import product_card_view
+    from utils import BILLS_HEADERS, HISTORY_HEADERS, STOCK_HEADERS, FakeSheetsClient, FakeSpreadsheet
+
+PATHS = ['startup', 'check', 'list', 'products', 'add_to_cart', 'checkout', 'confirm_sale', 'quick_buy', 'bill']
+
+# จำนวนแถวต่อใบเสร็จและจำนวนผู้ขายในข้อมูลตั้งต้น
+BILL_LINES = 2
+SELLERS = 50
+
+
+# ---------- Discord จำลอง ----------
+
+class FakeUser:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f'<@{user_id}>'
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self):
+        self.created_at = datetime.now(timezone.utc)
+
+    async def edit(self, **kwargs):
+        pass
+
+
+class FakeChannel:
+    """ช่องแชทจำลอง เก็บ embed ล่าสุดไว้ตรวจผลลัพธ์"""
+
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+        self.mention = f'<#{channel_id}>'
+        self.sent = 0
+        self.last_embed = None
+
+    async def send(self, content=None, embed=None, **kwargs):
+        self.sent += 1
+        self.last_embed = embed
+        return FakeMessage()
+
+
+class FakeGuild:
+    def __init__(self, channels):
+        self.channels = {channel.id: channel for channel in channels}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+class FakeContext:
+    """ctx ของคำสั่งแบบ prefix (!check, !checkout, ...)"""
+
+    def __init__(self, user, channel, guild):
+        self.author = user
+        self.channel = channel
+        self.guild = guild
+        self.message = FakeMessage()
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeResponse:
+    def __init__(self, channel):
+        self.channel = channel
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        await self.channel.send(content, **kwargs)
+
+
+class FakeInteraction:
+    """interaction ของปุ่มและ modal"""
+
+    def __init__(self, user, channel, guild):
+        self.user = user
+        self.channel = channel
+        self.guild = guild
+        self.client = guild
+        self.created_at = datetime.now(timezone.utc)
+        self.response = FakeResponse(channel)
+        self.followup = channel
+        self.message = FakeMessage()
+
+    async def edit_original_response(self, **kwargs):
+        pass
+
+
+class FakeTextInput:
+    def __init__(self, value):
+        self.value = value
+
+
+class _NoSleepAsyncio:
+    """asyncio ที่ไม่รอ sleep (คำสั่ง !products หน่วง 0.5 วินาทีต่อการ์ดเพื่อกัน spam)"""
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    @staticmethod
+    async def sleep(delay, result=None):
+        await asyncio.sleep(0)
+        return result
+
+
+# ---------- ตัววัดผล ----------
+
+class LoopMonitor:
+    """วัดเวลาที่ event loop ถูกบล็อก จากความล่าช้าของ task ที่ตื่นทุก interval วินาที"""
+
+    def __init__(self, interval=0.001, threshold=0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self.task = None
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def reset(self):
+        self.blocked = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.task
+
+
+class Scenario:
+    """ข้อมูลตั้งต้นและ backend ของการวัดหนึ่งชุด (ขนาดสินค้า x ขนาดประวัติ x ชนิด backend)"""
+
+    def __init__(self, backend, products, history, latency, quota, seed):
+        self.backend_name = backend
+        self.product_count = products
+        self.history_count = history
+        self.latency = latency
+        self.quota = quota
+        self.random = random.Random(seed)
+        self.client = None
+        self.backend = None
+        self.bill_numbers = []
+
+    # ---------- ข้อมูลตั้งต้น ----------
+
+    def product_rows(self):
+        return [
+            [i, f'สินค้า {i:05d}', 1_000_000, 'ชิ้น', 10 + i % 90, 'สินค้าสำหรับทดสอบ', '', '2024-01-01 00:00:00']
+            for i in range(1, self.product_count + 1)
+        ]
+
+    def history_rows(self):
+        row = ['2024-01-01 00:00:00', 'benchmark', 'การขาย', 'สินค้า 00001', 1, 'ใบเสร็จ: 20240101-001, ยอดรวม: 10']
+        return [row] * self.history_count
+
+    def bill_rows(self):
+        """ใบเสร็จละ BILL_LINES แถว วันละ 500 ใบ กระจายผู้ขาย SELLERS คน"""
+        rows = []
+        start = datetime(2024, 1, 1)
+        for n in range(self.history_count // BILL_LINES):
+            day, sequence = divmod(n, 500)
+            bill_number = f"{start + timedelta(days=day):%Y%m%d}-{sequence + 1:03d}"
+            self.bill_numbers.append(bill_number)
+            for line in range(BILL_LINES):
+                last = line == BILL_LINES - 1
+                rows.append([
+                    bill_number, '2024-01-01 00:00:00', f'seller{n % SELLERS}', f'สินค้า {line + 1:05d}',
+                    1, 'ชิ้น', 10, 10, 10 * BILL_LINES if last else '', 'benchmark' if last else ''
+                ])
+        return rows
+
+    # ---------- backend ----------
+
+    def client_factory(self, **options):
+        """คืน FakeSheetsClient ที่เตรียมข้อมูลไว้แล้ว (ใช้โควตาจาก SheetsBackend เมื่อเปิด --quota)"""
+        if self.quota:
+            for name, value in options.items():
+                setattr(self.client, name, value)
+        return self.client
+
+    def build_backend(self):
+        products, history, bills = self.product_rows(), self.history_rows(), self.bill_rows()
+        if self.backend_name == 'memory':
+            backend = MemoryBackend(products=[dict(zip(STOCK_HEADERS, row)) for row in products])
+            backend.history = [dict(zip(HISTORY_HEADERS, row)) for row in history]
+            backend.bill_rows = bills
+            backend.bill_index.load([BILLS_HEADERS] + bills)
+            return backend
+
+        self.client = FakeSheetsClient(latency=self.latency, count_bytes=True)
+        spreadsheet = self.client.spreadsheets['benchmark'] = FakeSpreadsheet(self.client, 'benchmark')
+        spreadsheet.load('Stock', [STOCK_HEADERS] + products)
+        spreadsheet.load('History', [HISTORY_HEADERS] + history)
+        spreadsheet.load('Bills', [BILLS_HEADERS] + bills)
+        sheets = SheetsBackend(
+            sheets_id='benchmark',
+            cache_ttl=bot.STOCK_CACHE_TTL,
+            history_flush_interval=0,  # เขียน History ทันที เพื่อนับคำขอให้กับเส้นทางที่ทำให้เกิด
+            reads_per_minute=bot.SHEETS_READS_PER_MINUTE,
+            writes_per_minute=bot.SHEETS_WRITES_PER_MINUTE,
+            max_retries=bot.SHEETS_MAX_RETRIES,
+            client_factory=self.client_factory
+        )
+        if self.backend_name == 'sqlite':
+            # ส่งข้อมูลไปยังชีตเองตอนท้าย (ไม่ให้ thread เบื้องหลังปนกับการวัด)
+            return SQLiteBackend(os.path.join(DATA_DIR, f'bench-{id(self)}.db'), mirror=sheets, sync_interval=3600)
+        return sheets
+
+    def api_counts(self):
+        """(อ่าน, เขียน, ไบต์) ที่ส่งไปยัง Sheets จำลองแล้วทั้งหมด"""
+        if self.client is None:
+            return 0, 0, 0
+        return self.client.read_count, self.client.write_count, self.client.bytes_sent + self.client.bytes_received
+
+    def product_name(self):
+        return f'สินค้า {self.random.randint(1, self.product_count):05d}'
+
+
+# ---------- เส้นทางที่วัด ----------
+
+async def run_path(name, scenario, user, channel, guild):
+    """เตรียมข้อมูลของเส้นทาง (ไม่จับเวลา) แล้วคืน coroutine function ที่จะถูกจับเวลา"""
+    app = bot.app
+    if name == 'check':
+        product_name = scenario.product_name()
+        return lambda: bot.check_stock.callback(FakeContext(user, channel, guild), product_name)
+    if name == 'list':
+        return lambda: bot.list_stock.callback(FakeContext(user, channel, guild))
+    if name == 'products':
+        return lambda: bot.show_products.callback(FakeContext(user, channel, guild))
+    if name == 'add_to_cart':
+        product_name = scenario.product_name()
+        await app.clear_cart(str(user.id))
+        return lambda: app.add_item_to_cart(str(user.id), product_name, 1)
+    if name == 'checkout':
+        cart = bot.user_carts[str(user.id)] = bot.Cart()
+        for _ in range(3):
+            cart.add_item(scenario.product_name(), 1, 10, 'ชิ้น')
+        return lambda: bot.checkout.callback(FakeContext(user, channel, guild))
+    if name == 'confirm_sale':
+        items = [{'name': scenario.product_name(), 'quantity': 1, 'price': 10, 'unit': 'ชิ้น'} for _ in range(3)]
+        view = ui_components.SalesConfirmView(app, items, 'benchmark')
+        return lambda: view.confirm_sale.callback(FakeInteraction(user, channel, guild))
+    if name == 'quick_buy':
+        product = await app.stock_manager.check_stock(scenario.product_name())
+        modal = product_card_view.QuickBuyModal(product, app)
+        modal.quantity = FakeTextInput('1')
+        modal.notes = FakeTextInput('')
+        return lambda: modal.on_submit(FakeInteraction(user, channel, guild))
+    if name == 'bill':
+        bill_number = scenario.random.choice(scenario.bill_numbers) if scenario.bill_numbers else '20240101-001'
+        return lambda: bot.view_bill.callback(FakeContext(user, channel, guild), bill_number)
+    raise ValueError(name)
+
+
+def summarize(name, samples):
+    """สรุปผลของเส้นทาง: ครั้งแรก (cold) และค่ากลาง/p95 ของครั้งถัดไป"""
+    times = [sample['seconds'] for sample in samples]
+    warm = times[1:] or times
+    total = lambda key: sum(sample[key] for sample in samples)
+    return {
+        'path': name,
+        'runs': len(samples),
+        'cold_ms': times[0] * 1000,
+        'median_ms': statistics.median(warm) * 1000,
+        'p95_ms': sorted(warm)[math.ceil(len(warm) * 0.95) - 1] * 1000,
+        'reads': total('reads') / len(samples),
+        'writes': total('writes') / len(samples),
+        'kb': total('bytes') / len(samples) / 1024,
+        'blocked_ms': total('blocked') / len(samples) * 1000,
+        'max_block_ms': max(sample['max_block'] for sample in samples) * 1000,
+        'errors': total('errors')
+    }
+
+
+async def run_scenario(scenario, paths, iterations):
+    user = FakeUser(1001, 'benchmark-user')
+    channel = FakeChannel(2001, 'benchmark')
+    log_channel = FakeChannel(bot.BILL_HISTORY_CHANNEL_ID, 'bill-log')
+    guild = FakeGuild([channel, log_channel])
+    monitor = LoopMonitor()
+    monitor.start()
+    results = []
+
+    async def measure(func):
+        reads, writes, transferred = scenario.api_counts()
+        monitor.reset()
+        channel.last_embed = None
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await func()
+        seconds = time.perf_counter() - start
+        await asyncio.sleep(0)
+        after_reads, after_writes, after_transferred = scenario.api_counts()
+        failed = channel.last_embed is not None and str(channel.last_embed.title).startswith('❌')
+        return {
+            'seconds': seconds,
+            'reads': after_reads - reads,
+            'writes': after_writes - writes,
+            'bytes': after_transferred - transferred,
+            'blocked': monitor.blocked,
+            'max_block': monitor.max_lag,
+            'errors': int(failed)
+        }
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            scenario.backend = scenario.build_backend()
+        counter_file = os.path.join(DATA_DIR, 'bill_counter.json')
+        if os.path.exists(counter_file):
+            os.remove(counter_file)
+
+        async def startup():
+            manager = bot.StockManager(scenario.backend)
+            bot.stock_manager = bot.AsyncStockManager(manager, max_workers=bot.SHEETS_MAX_WORKERS)
+            bot.app.stock_manager = bot.stock_manager
+            await bot.stock_manager.start()
+
+        results.append(summarize('startup', [await measure(startup)]))
+
+        for name in paths:
+            if name == 'startup':
+                continue
+            runs = min(iterations, 3) if name == 'products' else iterations
+            samples = []
+            for _ in range(runs):
+                func = await run_path(name, scenario, user, channel, guild)
+                samples.append(await measure(func))
+            results.append(summarize(name, samples))
+
+        if scenario.backend_name == 'sqlite' and scenario.backend.replicator.thread is not None:
+            results.append(summarize('sheets_sync', [await measure(
+                lambda: asyncio.to_thread(scenario.backend.replicator.sync)
+            )]))
+    finally:
+        await monitor.stop()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if isinstance(bot.stock_manager, bot.AsyncStockManager):
+                await asyncio.to_thread(bot.stock_manager.close)
+    return results
+
+
+def print_results(scenario, results):
+    print(f"\n📊 backend={scenario.backend_name} สินค้า={scenario.product_count:,} "
+          f"ประวัติ={scenario.history_count:,} แถว (ใบเสร็จ {len(scenario.bill_numbers):,} ใบ) "
+          f"latency={scenario.latency}s")
+    header = f"{'path':<13}{'runs':>5}{'cold ms':>10}{'median ms':>11}{'p95 ms':>9}" \
+             f"{'reads':>7}{'writes':>7}{'KB':>10}{'blocked ms':>12}{'max blk ms':>12}{'errors':>7}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['path']:<13}{r['runs']:>5}{r['cold_ms']:>10.1f}{r['median_ms']:>11.1f}{r['p95_ms']:>9.1f}"
+              f"{r['reads']:>7.1f}{r['writes']:>7.1f}{r['kb']:>10.1f}{r['blocked_ms']:>12.1f}"
+              f"{r['max_block_ms']:>12.1f}{r['errors']:>7}")
+
+
+async def main(args):
+    bot.asyncio = _NoSleepAsyncio()
+    report = []
+    for backend in args.backend:
+        for products in args.products:
+            for history in args.history:
+                scenario = Scenario(backend, products, history, args.latency, args.quota, args.seed)
+                results = await run_scenario(scenario, args.paths, args.iterations)
+                print_results(scenario, results)
+                report.append({
+                    'backend': backend,
+                    'products': products,
+                    'history': history,
+                    'latency': args.latency,
+                    'results': results
+                })
+                sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': datetime.now().isoformat(timespec='seconds'), 'runs': report},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n✅ บันทึกผลลัพธ์ลง {args.json}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='วัดประสิทธิภาพคำสั่งและขั้นตอนการขายของ CatBot')
+    parser.add_argument('--backend', nargs='+', default=['sheets'], choices=['sheets', 'sqlite', 'memory'])
+    parser.add_argument('--products', nargs='+', type=int, default=[10, 1000, 10000], help='จำนวนสินค้าในชีต Stock')
+    parser.add_argument('--history', nargs='+', type=int, default=[1000, 100000, 1000000],
+                        help='จำนวนแถวในชีต History และ Bills')
+    parser.add_argument('--iterations', type=int, default=20, help='จำนวนครั้งต่อเส้นทาง (!products สูงสุด 3 ครั้ง)')
+    parser.add_argument('--latency', type=float, default=0.0, help='เวลาหน่วงต่อคำขอ Sheets API (วินาที)')
+    parser.add_argument('--quota', action='store_true', help='จำกัดคำขอตาม SHEETS_READS/WRITES_PER_MINUTE')
+    parser.add_argument('--paths', nargs='+', default=PATHS, choices=PATHS)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='บันทึกผลลัพธ์เป็นไฟล์ JSON เพื่อเทียบกับครั้งก่อน')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -2,14 +2,21 @@ import discord
 from discord.ext import commands
 from discord.ui import View, Button, Modal, TextInput, Select
 import asyncio
+import atexit
+import functools
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
-from ui.views.product_card_view import ProductCardView
+from ui.views import ProductCardView, add_bill_pending_field, storage_not_ready_embed
 from ui_components import *
+from app_context import AppContext, Cart
+from storage import BillNotWritten, MemoryBackend, SheetsBackend, SQLiteBackend, StorageNotReady
+from utils import (
+    BillJournal, BillNumberAllocator, CartStore, FakeSheetsClient, IdempotencyCache, InsufficientStock, ProductLocks, ReservationLedger, normalize_product_name
+)
 
 # ฟังก์ชันช่วยสำหรับการลบห้องหลังแสดงใบเสร็จการขาย
 async def remove_seller_permission(ctx, seller_user):
@@ -69,52 +76,212 @@ SCOPE = [
 # ตั้งค่าการแจ้งเตือน
 LOW_STOCK_THRESHOLD = 5
 
-# Dictionary เก็บข้อมูลผู้ใช้ที่กำลังรอการอัปโหลดรูป
-pending_image_uploads = {}
+# อายุสูงสุดของแคตตาล็อกสินค้าในหน่วยความจำ (วินาที) ก่อนโหลดชีต Stock ใหม่ทั้งชีต
+STOCK_CACHE_TTL = int(os.getenv('STOCK_CACHE_TTL', '60'))
 
-# Dictionary เก็บข้อมูลการขายที่กำลังดำเนินการ
-active_sales = {}
+# ตรวจเวลาแก้ไขล่าสุดของ Google Sheets (Drive modifiedTime) ไม่เกินทุกกี่วินาที
+# เพื่อโหลดชีต Stock ใหม่เฉพาะเมื่อมีคนแก้ไขชีตด้วยมือ (0 = ไม่ตรวจ ใช้อายุ STOCK_CACHE_TTL อย่างเดียว)
+SHEETS_CHANGE_CHECK_INTERVAL = float(os.getenv('SHEETS_CHANGE_CHECK_INTERVAL', '5'))
 
-# Dictionary เก็บช่องแชทการขายสำหรับแต่ละผู้ใช้
-sales_channels = {}
+# แสดงจำนวน Google Sheets API call ของแต่ละการทำรายการใน console
+SHEETS_DEBUG = os.getenv('SHEETS_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# การเขียนชีต History แบบรวมหลายแถว: เขียนทุกกี่วินาที หรือเมื่อครบกี่แถว
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '2'))
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', '20'))
+
+# โควตา Google Sheets API ต่อนาที (คำขอที่เกินจะรอคิว) และจำนวนครั้งที่ลองใหม่เมื่อโดน 429/5xx
+SHEETS_READS_PER_MINUTE = int(os.getenv('SHEETS_READS_PER_MINUTE', '60'))
+SHEETS_WRITES_PER_MINUTE = int(os.getenv('SHEETS_WRITES_PER_MINUTE', '60'))
+SHEETS_MAX_RETRIES = int(os.getenv('SHEETS_MAX_RETRIES', '5'))
+
+# จำนวน thread สูงสุดที่ใช้เรียก Google Sheets (แยกจาก event loop ของ Discord)
+SHEETS_MAX_WORKERS = int(os.getenv('SHEETS_MAX_WORKERS', '4'))
+
+# โฟลเดอร์เก็บข้อมูลภายในเครื่องของ bot (เช่น เลขที่ใบเสร็จล่าสุด)
+DATA_DIR = os.getenv('CATBOT_DATA_DIR', 'data')
+
+# ที่เก็บข้อมูลหลัก: 'sheets' (Google Sheets โดยตรง), 'sqlite' (SQLite ในเครื่อง และส่งสำเนาไป Google Sheets เบื้องหลัง)
+# หรือ 'memory' (เก็บในหน่วยความจำ ข้อมูลหายเมื่อปิด bot ใช้สำหรับทดสอบ)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sheets').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(DATA_DIR, 'catbot.db'))
+SHEETS_SYNC_INTERVAL = float(os.getenv('SHEETS_SYNC_INTERVAL', '5'))
+
+# ไฟล์ snapshot ของแคตตาล็อกสินค้าและ index ใบเสร็จ (ใช้กับ STORAGE_BACKEND=sheets) บันทึกทุกกี่วินาที
+# ตอนเริ่มต้นจะโหลดจากไฟล์ทันทีแล้วโหลดข้อมูลจริงจากชีตเบื้องหลัง (SNAPSHOT_PATH ว่าง = ไม่ใช้)
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join(DATA_DIR, 'snapshot.json.gz'))
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', '60'))
+
+# ไฟล์บันทึกการขายล่วงหน้า (write-ahead journal) ใช้กู้คืนใบเสร็จที่เขียนไม่ครบเมื่อ bot ปิดตัวระหว่างขาย
+# (ใช้กับ STORAGE_BACKEND=sheets ว่าง = ไม่ใช้)
+BILL_JOURNAL_PATH = os.getenv('BILL_JOURNAL_PATH', os.path.join(DATA_DIR, 'bill_journal.jsonl'))
+# ลองกู้คืนการขายที่ค้างใน journal (เช่น Google Sheets ล่มระหว่างขาย) ทุกกี่วินาที (0 = เฉพาะตอนเริ่มต้น)
+BILL_RECOVERY_INTERVAL = float(os.getenv('BILL_RECOVERY_INTERVAL', '60'))
+
+# ใช้ Google Sheets จำลองในหน่วยความจำแทนของจริง (สำหรับทดสอบโหลดโดยไม่ใช้โควตา Google)
+# พร้อมหน่วงเวลาต่อคำขอ (วินาที) และสัดส่วนคำขอที่ตอบ 429
+SHEETS_FAKE = os.getenv('SHEETS_FAKE', '').lower() in ('1', 'true', 'yes')
+SHEETS_FAKE_LATENCY = float(os.getenv('SHEETS_FAKE_LATENCY', '0'))
+SHEETS_FAKE_ERROR_RATE = float(os.getenv('SHEETS_FAKE_ERROR_RATE', '0'))
+
+# ไฟล์ SQLite เก็บรถเข็นของผู้ใช้ให้อยู่รอดหลังรีสตาร์ท (ว่าง = เก็บในหน่วยความจำเท่านั้น)
+CART_STORE_PATH = os.getenv('CART_STORE_PATH', os.path.join(DATA_DIR, 'carts.db'))
+
+# เวลาที่สินค้าในรถเข็นถูกกันไว้ให้ผู้ซื้อ (นาที นับจากการเพิ่มสินค้าครั้งล่าสุด) เมื่อหมดเวลาสินค้าจะกลับไปขายให้คนอื่นได้
+CART_HOLD_MINUTES = float(os.getenv('CART_HOLD_MINUTES', '15'))
+
+# เวลาที่จำผลการขายไว้ (วินาที) การกดยืนยันซ้ำหรือ Discord ส่ง interaction ซ้ำภายในเวลานี้จะได้ใบเสร็จเดิม
+SALE_DEDUPE_SECONDS = float(os.getenv('SALE_DEDUPE_SECONDS', '600'))
 
 # ID ของช่องประวัติบิล
 BILL_HISTORY_CHANNEL_ID = 1393184006748635156
 
+class BillPending(Exception):
+    """สินค้ามีใบเสร็จที่ยังรอบันทึกลงที่เก็บข้อมูล (ค้างใน journal) ห้ามเขียนจนกว่าจะกู้คืนเสร็จ"""
+
+    def __init__(self, bill_number):
+        super().__init__(f"สินค้านี้มีใบเสร็จ {bill_number} ที่กำลังรอบันทึกลง Google Sheets กรุณาลองใหม่อีกครั้งในอีกสักครู่")
+        self.bill_number = bill_number
+
+
 class StockManager:
-    def __init__(self):
-        self.credentials = None
-        self.gc = None
-        self.spreadsheet = None
-        self.setup_google_sheets()
-    
-    def setup_google_sheets(self):
-        """ตั้งค่าการเชื่อมต่อ Google Sheets"""
+    """จัดการสต๊อก ประวัติ และใบเสร็จ ผ่าน storage backend
+
+    backend คือที่เก็บข้อมูลจริง (StorageBackend เช่น SheetsBackend, SQLiteBackend หรือ MemoryBackend) ส่วนคลาสนี้ดูแล
+    กติกาของการทำรายการ เช่น การรวมจำนวนสินค้า การออกเลขที่ใบเสร็จ และการบันทึกประวัติ
+
+    การสร้าง instance ไม่เชื่อมต่อที่เก็บข้อมูล ต้องเรียก connect() ก่อนใช้งาน (bot เรียกเบื้องหลังหลัง on_ready)
+
+    ถ้ามี journal (BillJournal) ทุกการขายจะถูกบันทึกลงไฟล์ก่อนเขียนลงที่เก็บข้อมูล การขายที่ยังเขียนไม่ครบ
+    จะถูกทำซ้ำตอน connect() และทุกครั้งที่เรียก recover_bills() (bot เรียกเป็นระยะ) ระหว่างนั้นสินค้าในใบเสร็จ
+    ที่ค้างจะถูกกันไม่ให้เขียน (ดู pending_bill_for) สต็อกในที่เก็บข้อมูลจึงเปลี่ยนได้จากการขายนั้นเท่านั้น
+    """
+    
+    def __init__(self, backend, journal=None):
+        self.backend = backend
+        self.journal = journal
+        self.bill_numbers = BillNumberAllocator(
+            os.path.join(DATA_DIR, 'bill_counter.json'),
+            self.backend.max_bill_sequence
+        )
+        self.startup_times = {}  # ขั้นตอนการเริ่มต้น -> วินาที
+        # จำนวนสินค้าที่กำลังถูกตัดสต็อกและที่กันไว้ในรถเข็น (กันการขายเกินเมื่อมีผู้ซื้อพร้อมกันหลายคน)
+        self.reservations = ReservationLedger(hold_ttl=CART_HOLD_MINUTES * 60)
+    
+    def connect(self):
+        """เชื่อมต่อที่เก็บข้อมูลและอ่านเลขที่ใบเสร็จล่าสุดของวัน คืน True ถ้าสำเร็จ
+
+        บันทึกเวลาที่ใช้ในแต่ละขั้นตอนไว้ใน startup_times และแสดงใน console
+        """
+        started = time.perf_counter()
+        connected = self.backend.connect()
+        self.startup_times = self.backend.connect_times()
+        if connected:
+            # อ่านเลขที่ใบเสร็จล่าสุดของวันครั้งเดียวตอนเริ่มต้น
+            seeded = time.perf_counter()
+            self.bill_numbers.seed()
+            self.startup_times['bill_numbers'] = time.perf_counter() - seeded
+            if self.journal is not None:
+                recovered = time.perf_counter()
+                self.journal.load()
+                self.recover_bills()
+                self.startup_times['journal'] = time.perf_counter() - recovered
+        self.startup_times['total'] = time.perf_counter() - started
+        print("⏱️ เวลาเริ่มต้นที่เก็บข้อมูล: " + ", ".join(
+            f"{name} {seconds:.2f}s" for name, seconds in self.startup_times.items()
+        ))
+        return connected
+    
+    def close(self):
+        """เขียนข้อมูลที่ค้างอยู่ทั้งหมดก่อนปิด bot"""
+        self.backend.close()
+        if self.journal is not None:
+            self.journal.close()
+    
+    def recover_bills(self):
+        """ทำซ้ำการขายใน journal ที่ยังเขียนลงที่เก็บข้อมูลไม่ครบ (เช่น bot ปิดตัวหรือ Google Sheets ล่มระหว่างขาย)
+
+        ต้องไม่มีการเขียนอื่นทำงานพร้อมกัน (bot เรียกผ่าน AsyncStockManager.recover_bills ที่ถือ lock ทุกสินค้า)
+        รายการที่กู้คืนไม่สำเร็จจะยังค้างใน journal และลองใหม่ในรอบถัดไป
+        """
+        entries = self.journal.pending()
+        if not entries:
+            return
+        print(f"🔄 พบการขายที่ยังไม่เสร็จใน journal {len(entries)} รายการ กำลังกู้คืน")
         try:
-            # ใช้ credentials.json file
-            if os.path.exists('credentials.json'):
-                self.credentials = Credentials.from_service_account_file(
-                    'credentials.json', scopes=SCOPE)
-            else:
-                print("❌ ไม่พบไฟล์ credentials.json")
-                return
-            
-            self.gc = gspread.authorize(self.credentials)
-            
-            # เปิด Google Sheets
-            sheets_id = os.getenv('GOOGLE_SHEETS_ID')
-            if sheets_id:
-                self.spreadsheet = self.gc.open_by_key(sheets_id)
-            else:
-                sheet_name = os.getenv('GOOGLE_SHEET_NAME', 'CatBot-Stock-Management')
-                self.spreadsheet = self.gc.open(sheet_name)
-            
-            # สร้างชีตหากยังไม่มี
-            self.setup_sheets()
-            print("✅ เชื่อมต่อ Google Sheets สำเร็จ")
-            
+            self.backend.refresh()
         except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการเชื่อมต่อ Google Sheets: {e}")
+            print(f"❌ ไม่สามารถโหลดข้อมูลล่าสุดก่อนกู้คืนการขายได้: {e}")
+            return
+        
+        for entry in entries:
+            bill_number = entry['bill_number']
+            try:
+                if self.recover_bill(entry):
+                    print(f"✅ กู้คืนใบเสร็จ {bill_number} สำเร็จ")
+                else:
+                    print(f"✅ ใบเสร็จ {bill_number} บันทึกครบแล้ว")
+                # การขายที่ค้างยังไม่ได้บันทึกประวัติ (create_bill บันทึกหลังเขียนใบเสร็จครบเท่านั้น)
+                self.backend.append_history(entry['history'])
+                self.journal.done(bill_number)
+            except BillNotWritten as e:
+                print(f"⚠️ ยกเลิกการขาย {bill_number} ที่ค้างใน journal: {e}")
+                self.journal.done(bill_number)
+            except Exception as e:
+                print(f"❌ ไม่สามารถกู้คืนใบเสร็จ {bill_number} ได้: {e}")
+    
+    def recover_bill(self, entry):
+        """ทำให้การขายหนึ่งรายการใน journal เขียนครบ (ต้องโหลดข้อมูลล่าสุดจากที่เก็บข้อมูลก่อน)
+
+        สินค้าในใบเสร็จที่ค้างไม่ถูกเขียนโดยคำสั่งอื่น สต็อกแต่ละสินค้าจึงเท่ากับสต็อกหลังขายที่บันทึกไว้ (ตัดแล้ว)
+        หรือสต็อกก่อนขาย (ยังไม่ตัด ตัดเต็มจำนวน) ถ้าไม่ตรงกับทั้งสองค่า (มีคนแก้ชีตระหว่างนั้น) จะถือว่ายังไม่ตัด
+        เพื่อไม่ให้ขายเกินสต็อกจริง แล้วเขียนใบเสร็จถ้ายังไม่มี
+        คืน True ถ้าเขียนใบเสร็จในครั้งนี้ หรือ False ถ้าใบเสร็จมีอยู่แล้ว
+        ส่ง BillNotWritten ถ้าทำการขายต่อไม่ได้ (เช่น สต็อกไม่พอแล้ว) exception อื่นหมายถึงยังไม่รู้ผล
+        """
+        current = {}
+        remaining = {}
+        for name, sold in entry['sold'].items():
+            product = self.backend.find_product(name)
+            current[name] = int(product.get('จำนวน', 0)) if product else 0
+            stock_after = entry['stock_after'][name]
+            if sold and current[name] == stock_after:
+                remaining[name] = 0
+                continue
+            if current[name] != stock_after + sold:
+                print(f"⚠️ สต็อก {name} ({current[name]}) ไม่ตรงกับก่อนหรือหลังการขาย {entry['bill_number']} "
+                      f"({stock_after + sold}/{stock_after}) ถือว่ายังไม่ได้ตัดสต็อก กรุณาตรวจสอบชีต")
+            remaining[name] = sold
+        
+        if self.backend.get_bill(entry['bill_number']):
+            # ใบเสร็จมีแล้ว แต่สต็อกอาจถูกคืนค่าหลังเขียนใบเสร็จโดยไม่ได้รับคำตอบ
+            for name, quantity in remaining.items():
+                if quantity:
+                    self.backend.update_product(name, {
+                        'จำนวน': current[name] - quantity,
+                        'วันที่อัปเดตล่าสุด': entry['updated_at']
+                    })
+            return False
+        
+        self.backend.commit_bill(entry['bill_number'], entry['bill_rows'], remaining, entry['updated_at'])
+        return True
+    
+    def pending_bill_for(self, product_names):
+        """เลขที่ใบเสร็จที่ค้างใน journal ซึ่งมีสินค้าใน product_names (None ถ้าไม่มี)
+
+        ต้องเรียกขณะถือ lock ของสินค้าเหล่านั้น (การขายที่กำลังเขียนอยู่จึงไม่ถูกนับ)
+        """
+        if self.journal is None:
+            return None
+        keys = {normalize_product_name(name) for name in product_names}
+        for entry in self.journal.pending():
+            if any(normalize_product_name(name) in keys for name in entry['sold']):
+                return entry['bill_number']
+        return None
+    
+    def is_bill_pending(self, bill_number):
+        """ใบเสร็จยังรอบันทึกลงที่เก็บข้อมูล (ค้างใน journal) หรือไม่"""
+        return self.journal is not None and self.journal.is_open(bill_number)
     
     async def upload_image_to_drive(self, image_url, filename):
         """ใช้ Discord CDN สำหรับเก็บรูปภาพ"""
@@ -131,174 +298,60 @@ class StockManager:
             print(f"❌ เกิดข้อผิดพลาดในการจัดการรูปภาพ: {e}")
             return image_url
     
-    def setup_sheets(self):
-        """สร้างชีตและตั้งค่าหัวตาราง"""
-        try:
-            # ตรวจสอบและสร้างชีต Stock
-            try:
-                stock_sheet = self.spreadsheet.worksheet('Stock')
-                print("✅ พบชีต Stock แล้ว")
-                
-                # ตรวจสอบว่าชีตมีหัวตารางหรือไม่
-                try:
-                    first_row = stock_sheet.row_values(1)
-                    if not first_row or len(first_row) < 8 or first_row[0] != 'ID':
-                        print("⚠️ หัวตารางของชีต Stock ไม่ถูกต้อง กำลังแก้ไข...")
-                        stock_sheet.update(
-                            range_name='A1:H1',
-                            values=[['ID', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคา', 'คำอธิบาย', 'รูปภาพURL', 'วันที่อัปเดตล่าสุด']]
-                        )
-                        print("✅ แก้ไขหัวตารางชีต Stock เรียบร้อย")
-                except Exception as e:
-                    print(f"⚠️ ไม่สามารถตรวจสอบหัวตารางชีต Stock ได้: {e}")
-                    
-            except gspread.WorksheetNotFound:
-                print("⚠️ ไม่พบชีต Stock กำลังสร้างใหม่...")
-                stock_sheet = self.spreadsheet.add_worksheet(title='Stock', rows=1000, cols=8)
-                # ตั้งค่าหัวตาราง
-                stock_sheet.update(
-                    range_name='A1:H1',
-                    values=[['ID', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคา', 'คำอธิบาย', 'รูปภาพURL', 'วันที่อัปเดตล่าสุด']]
-                )
-                print("✅ สร้างชีต Stock เรียบร้อย")
-            
-            # ตรวจสอบและสร้างชีต History
-            try:
-                history_sheet = self.spreadsheet.worksheet('History')
-                print("✅ พบชีต History แล้ว")
-                
-                # ตรวจสอบว่าชีตมีหัวตารางหรือไม่
-                try:
-                    first_row = history_sheet.row_values(1)
-                    if not first_row or len(first_row) < 6 or first_row[0] != 'วันที่':
-                        print("⚠️ หัวตารางของชีต History ไม่ถูกต้อง กำลังแก้ไข...")
-                        history_sheet.update(
-                            range_name='A1:F1',
-                            values=[['วันที่', 'ชื่อผู้ใช้', 'การทำรายการ', 'ชื่อสินค้า', 'จำนวน', 'หมายเหตุ']]
-                        )
-                        print("✅ แก้ไขหัวตารางชีต History เรียบร้อย")
-                except Exception as e:
-                    print(f"⚠️ ไม่สามารถตรวจสอบหัวตารางชีต History ได้: {e}")
-                    
-            except gspread.WorksheetNotFound:
-                print("⚠️ ไม่พบชีต History กำลังสร้างใหม่...")
-                history_sheet = self.spreadsheet.add_worksheet(title='History', rows=1000, cols=6)
-                # ตั้งค่าหัวตาราง
-                history_sheet.update(
-                    range_name='A1:F1',
-                    values=[['วันที่', 'ชื่อผู้ใช้', 'การทำรายการ', 'ชื่อสินค้า', 'จำนวน', 'หมายเหตุ']]
-                )
-                print("✅ สร้างชีต History เรียบร้อย")
-            
-            # ตรวจสอบและสร้างชีต Bills (ใบเสร็จ)
-            try:
-                bills_sheet = self.spreadsheet.worksheet('Bills')
-                print("✅ พบชีต Bills แล้ว")
-                
-                # ตรวจสอบว่าชีตมีหัวตารางหรือไม่
-                try:
-                    first_row = bills_sheet.row_values(1)
-                    if not first_row or len(first_row) < 10 or first_row[0] != 'เลขที่ใบเสร็จ':
-                        print("⚠️ หัวตารางของชีต Bills ไม่ถูกต้อง กำลังแก้ไข...")
-                        bills_sheet.update(
-                            range_name='A1:J1',
-                            values=[['เลขที่ใบเสร็จ', 'วันที่', 'ผู้ขาย', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคาต่อหน่วย', 'ราคารวม', 'ยอดรวม', 'หมายเหตุ']]
-                        )
-                        print("✅ แก้ไขหัวตารางชีต Bills เรียบร้อย")
-                except Exception as e:
-                    print(f"⚠️ ไม่สามารถตรวจสอบหัวตารางชีต Bills ได้: {e}")
-                    
-            except gspread.WorksheetNotFound:
-                print("⚠️ ไม่พบชีต Bills กำลังสร้างใหม่...")
-                bills_sheet = self.spreadsheet.add_worksheet(title='Bills', rows=1000, cols=10)
-                # ตั้งค่าหัวตาราง
-                bills_sheet.update(
-                    range_name='A1:J1',
-                    values=[['เลขที่ใบเสร็จ', 'วันที่', 'ผู้ขาย', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคาต่อหน่วย', 'ราคารวม', 'ยอดรวม', 'หมายเหตุ']]
-                )
-                print("✅ สร้างชีต Bills เรียบร้อย")
-                
-        except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการสร้างชีต: {e}")
+    def api_call_counts(self):
+        """จำนวนคำขอ Sheets API (อ่าน, เขียน) ที่ส่งไปแล้วทั้งหมด"""
+        return self.backend.api_call_counts()
+    
+    def log_api_calls(self, operation, counts_before):
+        """แสดงจำนวน API call ที่ใช้ในการทำรายการหนึ่งครั้ง (เมื่อเปิด SHEETS_DEBUG)"""
+        if not SHEETS_DEBUG:
+            return
+        reads_before, writes_before = counts_before
+        reads, writes = self.api_call_counts()
+        print(f"🐞 {operation}: ใช้ Sheets API {reads - reads_before + writes - writes_before} ครั้ง "
+              f"(อ่าน {reads - reads_before}, เขียน {writes - writes_before})")
+        throttle_stats = self.backend.throttle_stats()
+        if throttle_stats:
+            print(f"🐞 สถิติโควตา Sheets API: {throttle_stats}")
     
     def add_stock(self, product_name, quantity, unit, user, price=0, description="", image_url=""):
         """เพิ่มสินค้าเข้าสต๊อก"""
+        api_counts = self.api_call_counts()
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            
-            # ตรวจสอบว่าชีตมีข้อมูลหรือไม่
-            try:
-                existing_products = stock_sheet.get_all_records()
-            except Exception as e:
-                print(f"⚠️ ไม่สามารถอ่านข้อมูลจากชีตได้: {e}")
-                existing_products = []
-            
-            # ตรวจสอบว่าชีตมีหัวตารางหรือไม่
-            if not existing_products:
-                # ตรวจสอบว่าแถวแรกมีหัวตารางหรือไม่
-                try:
-                    first_row = stock_sheet.row_values(1)
-                    if not first_row or first_row[0] != 'ID':
-                        # ตั้งค่าหัวตารางใหม่
-                        stock_sheet.clear()
-                        stock_sheet.update(
-                            range_name='A1:H1',
-                            values=[['ID', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคา', 'คำอธิบาย', 'รูปภาพURL', 'วันที่อัปเดตล่าสุด']]
-                        )
-                        print("✅ ตั้งค่าหัวตารางใหม่สำเร็จ")
-                except Exception as e:
-                    print(f"⚠️ ไม่สามารถตั้งค่าหัวตารางได้: {e}")
-                    return False
-            
-            # ค้นหาสินค้าที่มีอยู่
-            product_found = False
+            product = self.backend.find_product(product_name)
+            current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            for i, product in enumerate(existing_products):
+            if product is not None:
                 try:
-                    if product.get('ชื่อสินค้า', '').lower() == product_name.lower():
-                        # อัปเดตจำนวนสินค้าที่มีอยู่
-                        current_quantity = int(product.get('จำนวน', 0))
-                        new_quantity = current_quantity + int(quantity)
-                        
-                        # อัปเดตข้อมูลในชีต
-                        row_number = i + 2  # +2 เพราะเริ่มจากแถวที่ 2 (แถว 1 เป็นหัวตาราง)
-                        stock_sheet.update(f'C{row_number}', new_quantity)
-                        stock_sheet.update(f'H{row_number}', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                        
-                        # อัปเดตข้อมูลอื่นๆ ถ้ามีการใส่ข้อมูลใหม่
-                        if price > 0:
-                            stock_sheet.update(f'E{row_number}', price)
-                        if description:
-                            stock_sheet.update(f'F{row_number}', description)
-                        if image_url:
-                            stock_sheet.update(f'G{row_number}', image_url)
-                        
-                        product_found = True
-                        print(f"✅ อัปเดตสินค้า {product_name} สำเร็จ")
-                        break
+                    # อัปเดตจำนวนสินค้าที่มีอยู่
+                    new_quantity = int(product.get('จำนวน', 0)) + int(quantity)
+                    changes = {'จำนวน': new_quantity, 'วันที่อัปเดตล่าสุด': current_date}
+                    
+                    # อัปเดตข้อมูลอื่นๆ ถ้ามีการใส่ข้อมูลใหม่
+                    if price > 0:
+                        changes['ราคา'] = price
+                    if description:
+                        changes['คำอธิบาย'] = description
+                    if image_url:
+                        changes['รูปภาพURL'] = image_url
+                    
+                    self.backend.update_product(product_name, changes)
+                    print(f"✅ อัปเดตสินค้า {product_name} สำเร็จ")
                 except Exception as e:
                     print(f"⚠️ เกิดข้อผิดพลาดในการอัปเดตสินค้า: {e}")
-                    continue
-            
-            if not product_found:
+                    return False
+            else:
                 try:
                     # เพิ่มสินค้าใหม่
-                    next_row = len(existing_products) + 2
-                    new_id = len(existing_products) + 1
-                    
-                    stock_sheet.update(
-                        range_name=f'A{next_row}:H{next_row}',
-                        values=[[
-                            new_id,
-                            product_name,
-                            quantity,
-                            unit,
-                            price,
-                            description,
-                            image_url,
-                            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        ]]
-                    )
+                    self.backend.add_product({
+                        'ชื่อสินค้า': product_name,
+                        'จำนวน': quantity,
+                        'หน่วย': unit,
+                        'ราคา': price,
+                        'คำอธิบาย': description,
+                        'รูปภาพURL': image_url,
+                        'วันที่อัปเดตล่าสุด': current_date
+                    })
                     print(f"✅ เพิ่มสินค้าใหม่ {product_name} สำเร็จ")
                 except Exception as e:
                     print(f"⚠️ เกิดข้อผิดพลาดในการเพิ่มสินค้าใหม่: {e}")
@@ -310,6 +363,7 @@ class StockManager:
             except Exception as e:
                 print(f"⚠️ เกิดข้อผิดพลาดในการบันทึกประวัติ: {e}")
             
+            self.log_api_calls('add_stock', api_counts)
             return True
             
         except Exception as e:
@@ -318,22 +372,20 @@ class StockManager:
     
     def remove_stock(self, product_name, quantity, user):
         """ลดสินค้าจากสต๊อก"""
+        api_counts = self.api_call_counts()
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            existing_products = stock_sheet.get_all_records()
+            product = self.backend.find_product(product_name)
             
-            for i, product in enumerate(existing_products):
-                if product['ชื่อสินค้า'].lower() == product_name.lower():
-                    current_quantity = int(product['จำนวน'])
-                    new_quantity = max(0, current_quantity - int(quantity))
-                    
-                    stock_sheet.update(f'C{i+2}', new_quantity)
-                    stock_sheet.update(f'H{i+2}', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                    
-                    # บันทึกประวัติ
-                    self.add_history(user, 'ลดสินค้า', product_name, quantity, f'คงเหลือ: {new_quantity}')
-                    
-                    return True, new_quantity
+            if product is not None:
+                new_quantity = max(0, int(product['จำนวน']) - int(quantity))
+                current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                self.backend.update_product(product_name, {'จำนวน': new_quantity, 'วันที่อัปเดตล่าสุด': current_date})
+                
+                # บันทึกประวัติ
+                self.add_history(user, 'ลดสินค้า', product_name, quantity, f'คงเหลือ: {new_quantity}')
+                
+                self.log_api_calls('remove_stock', api_counts)
+                return True, new_quantity
             
             return False, 0
             
@@ -344,24 +396,48 @@ class StockManager:
     def check_stock(self, product_name):
         """ตรวจสอบจำนวนสินค้า"""
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            existing_products = stock_sheet.get_all_records()
-            
-            for product in existing_products:
-                if product['ชื่อสินค้า'].lower() == product_name.lower():
-                    return product
-            
-            return None
+            return self.backend.find_product(product_name)
             
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการตรวจสอบสินค้า: {e}")
             return None
     
+    def hold_stock(self, owner, product_name, quantity):
+        """กันสินค้าไว้ในรถเข็นของ owner คืนค่า (ข้อมูลสินค้า, จำนวนที่พร้อมขายก่อนกัน)
+
+        ข้อมูลสินค้าเป็น None ถ้าไม่พบสินค้า และจะกันสินค้าเฉพาะเมื่อจำนวนที่พร้อมขายพอ
+        """
+        try:
+            product = self.backend.find_product(product_name)
+            if product is None:
+                return None, 0
+            name = product['ชื่อสินค้า']
+            stock_quantity = int(product.get('จำนวน', 0))
+            try:
+                return product, self.reservations.hold(owner, name, quantity, stock_quantity)
+            except InsufficientStock as e:
+                return product, e.available
+            
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการกันสินค้าในรถเข็น: {e}")
+            return None, 0
+    
+    def release_hold(self, owner):
+        """คืนสินค้าทั้งหมดที่กันไว้ในรถเข็นของ owner"""
+        self.reservations.release_hold(owner)
+    
+    def available_quantity(self, product, owner=None):
+        """จำนวนที่พร้อมขายของสินค้า (สต็อกหักที่ถูกจองหรือกันไว้ โดยนับที่ owner กันไว้เป็นของ owner)"""
+        name = product['ชื่อสินค้า']
+        available = self.reservations.available(name, product.get('จำนวน', 0))
+        if owner is not None:
+            available += self.reservations.held_quantity(owner, name)
+        return available
+    
     def get_all_stock(self):
         """ดึงรายการสินค้าทั้งหมด"""
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            return stock_sheet.get_all_records()
+            return self.backend.get_products()
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการดึงรายการสินค้า: {e}")
             return []
@@ -369,9 +445,7 @@ class StockManager:
     def get_history(self, limit=10):
         """ดึงประวัติการทำรายการ"""
         try:
-            history_sheet = self.spreadsheet.worksheet('History')
-            records = history_sheet.get_all_records()
-            return records[-limit:] if len(records) > limit else records
+            return self.backend.get_history(limit)
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการดึงประวัติ: {e}")
             return []
@@ -379,43 +453,14 @@ class StockManager:
     def add_history(self, user, action, product_name, quantity, note):
         """เพิ่มประวัติการทำรายการ"""
         try:
-            history_sheet = self.spreadsheet.worksheet('History')
-            
-            # ตรวจสอบว่าชีตมีข้อมูลหรือไม่
-            try:
-                existing_records = history_sheet.get_all_records()
-                next_row = len(existing_records) + 2
-            except Exception as e:
-                print(f"⚠️ ไม่สามารถอ่านข้อมูลจากชีต History ได้: {e}")
-                # ตรวจสอบว่าชีตมีหัวตารางหรือไม่
-                try:
-                    first_row = history_sheet.row_values(1)
-                    if not first_row or first_row[0] != 'วันที่':
-                        # ตั้งค่าหัวตารางใหม่
-                        history_sheet.clear()
-                        history_sheet.update(
-                            range_name='A1:F1',
-                            values=[['วันที่', 'ชื่อผู้ใช้', 'การทำรายการ', 'ชื่อสินค้า', 'จำนวน', 'หมายเหตุ']]
-                        )
-                        next_row = 2
-                    else:
-                        next_row = 2
-                except Exception as e2:
-                    print(f"⚠️ ไม่สามารถตั้งค่าหัวตาราง History ได้: {e2}")
-                    return
-            
-            # เพิ่มข้อมูลใหม่
-            history_sheet.update(
-                range_name=f'A{next_row}:F{next_row}',
-                values=[[
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    str(user),
-                    action,
-                    product_name,
-                    quantity,
-                    note
-                ]]
-            )
+            self.backend.append_history([
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                str(user),
+                action,
+                product_name,
+                quantity,
+                note
+            ])
             print(f"✅ บันทึกประวัติสำเร็จ: {action} {product_name}")
             
         except Exception as e:
@@ -424,104 +469,145 @@ class StockManager:
     def check_low_stock(self):
         """ตรวจสอบสินค้าที่มีจำนวนต่ำ"""
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            existing_products = stock_sheet.get_all_records()
-            
-            low_stock_items = []
-            for product in existing_products:
-                if int(product['จำนวน']) < LOW_STOCK_THRESHOLD:
-                    low_stock_items.append(product)
-            
-            return low_stock_items
+            return [
+                product for product in self.backend.get_products()
+                if int(product['จำนวน']) < LOW_STOCK_THRESHOLD
+            ]
             
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการตรวจสอบสินค้าต่ำ: {e}")
             return []
     
     def generate_bill_number(self):
-        """สร้างเลขที่ใบเสร็จ"""
+        """สร้างเลขที่ใบเสร็จในรูปแบบ YYYYMMDD-XXX (ไม่อ่านข้อมูล ยกเว้นตอนขึ้นวันใหม่)"""
+        return self.bill_numbers.next_number()
+    
+    def create_bill(self, seller, items, notes="", hold_owner=None):
+        """สร้างใบเสร็จ
+
+        จองสินค้าทุกรายการใน ReservationLedger ก่อนออกเลขที่ใบเสร็จ (ปฏิเสธถ้าจำนวนพร้อมขายไม่พอ)
+        แล้วให้ backend ตัดสต็อกและบันทึกใบเสร็จทั้งใบในครั้งเดียว (backend จะตรวจสอบสต็อกซ้ำ
+        และไม่เขียนอะไรถ้าไม่สำเร็จ) การจองจะถูกยกเลิกเมื่อเสร็จไม่ว่าสำเร็จหรือไม่
+
+        การขายถูกบันทึกใน journal ก่อนเขียน และบันทึกว่าเสร็จหลังเขียนใบเสร็จและประวัติ หรือเมื่อ backend
+        ยืนยันว่าไม่ได้เขียนอะไร (BillNotWritten) ถ้าไม่รู้ผลจะตรวจกับที่เก็บข้อมูลแล้วเขียนต่อให้ครบทันที
+        (ยังถือ lock ของสินค้าในใบเสร็จอยู่) ถ้ายังไม่สำเร็จรายการจะค้างใน journal ให้ recover_bills() ทำซ้ำ
+        และคืนเลขที่ใบเสร็จตามปกติ (การขายถูกรับแล้ว is_bill_pending() บอกว่ายังรอบันทึก) คำขอซ้ำจึงได้ใบเสร็จเดิม
+
+        hold_owner คือเจ้าของรถเข็น สินค้าที่กันไว้ในรถเข็นนับเป็นของผู้ซื้อแล้ว และจะถูกคืนเมื่อขายสำเร็จ
+        (ถ้าไม่สำเร็จ สินค้ายังกันไว้ให้ลองใหม่ได้)
+        """
+        api_counts = self.api_call_counts()
+        reservation = None
         try:
-            bills_sheet = self.spreadsheet.worksheet('Bills')
-            records = bills_sheet.get_all_records()
-            
-            # สร้างเลขที่ใบเสร็จในรูปแบบ YYYYMMDD-XXX
-            today = datetime.now().strftime('%Y%m%d')
-            today_bills = [record for record in records if record['เลขที่ใบเสร็จ'].startswith(today)]
-            
-            next_number = len(today_bills) + 1
-            bill_number = f"{today}-{next_number:03d}"
+            # รวมจำนวนที่ขายของแต่ละสินค้า (รถเข็นอาจมีสินค้าเดียวกันหลายบรรทัด)
+            sold_quantities = {}
+            stock = {}
+            for item in items:
+                product = self.backend.find_product(item['name'])
+                if product is None:
+                    print(f"❌ ไม่พบสินค้า {item['name']}")
+                    return None, 0
+                name = product['ชื่อสินค้า']
+                sold_quantities[name] = sold_quantities.get(name, 0) + int(item['quantity'])
+                stock[name] = int(product.get('จำนวน', 0))
             
-            return bill_number
+            try:
+                reservation = self.reservations.reserve(sold_quantities, stock, owner=hold_owner)
+            except InsufficientStock as e:
+                print(f"❌ {e}")
+                return None, 0
             
-        except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการสร้างเลขที่ใบเสร็จ: {e}")
-            return f"{datetime.now().strftime('%Y%m%d')}-001"
-    
-    def create_bill(self, seller, items, notes=""):
-        """สร้างใบเสร็จ"""
-        try:
-            bills_sheet = self.spreadsheet.worksheet('Bills')
             bill_number = self.generate_bill_number()
-            
-            total_amount = 0
             current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            total_amount = sum(item['quantity'] * item['price'] for item in items)
+            
+            # เตรียมรายการสินค้าในใบเสร็จ
+            bill_rows = []
+            for n, item in enumerate(items):
+                is_last = n == len(items) - 1
+                bill_rows.append([
+                    bill_number,
+                    current_date,
+                    str(seller),
+                    item['name'],
+                    item['quantity'],
+                    item['unit'],
+                    item['price'],
+                    item['quantity'] * item['price'],
+                    total_amount if is_last else "",  # แสดงยอดรวมเฉพาะบรรทัดสุดท้าย
+                    notes if is_last else ""  # แสดงหมายเหตุเฉพาะบรรทัดสุดท้าย
+                ])
             
-            # เพิ่มรายการสินค้าในใบเสร็จ
-            for item in items:
-                product_name = item['name']
-                quantity = item['quantity']
-                unit_price = item['price']
-                unit = item['unit']
-                item_total = quantity * unit_price
-                total_amount += item_total
-                
-                # ลดสต็อกสินค้า
-                self.remove_stock(product_name, quantity, seller)
-                
-                # เพิ่มรายการในชีต Bills
+            item_names = [item['name'] for item in items]
+            history_note = f'ใบเสร็จ: {bill_number}, ยอดรวม: {total_amount:,.0f}'
+            
+            entry = {
+                'bill_number': bill_number,
+                'bill_rows': bill_rows,
+                'sold': sold_quantities,
+                'stock_after': {name: stock[name] - sold for name, sold in sold_quantities.items()},
+                'updated_at': current_date,
+                'history': [current_date, str(seller), 'การขาย', ', '.join(item_names), len(items), history_note]
+            }
+            if self.journal is not None:
+                self.journal.begin(bill_number, entry)
+            try:
+                self.backend.commit_bill(bill_number, bill_rows, sold_quantities, current_date)
+            except BillNotWritten:
+                if self.journal is not None:
+                    self.journal.done(bill_number)
+                raise
+            except Exception as e:
+                if self.journal is None:
+                    raise
+                print(f"⚠️ ไม่ทราบผลการเขียนใบเสร็จ {bill_number} ({e}) กำลังตรวจสอบกับที่เก็บข้อมูล")
                 try:
-                    existing_records = bills_sheet.get_all_records()
-                    next_row = len(existing_records) + 2
-                except:
-                    next_row = 2
-                
-                bills_sheet.update(
-                    range_name=f'A{next_row}:J{next_row}',
-                    values=[[
-                        bill_number,
-                        current_date,
-                        str(seller),
-                        product_name,
-                        quantity,
-                        unit,
-                        unit_price,
-                        item_total,
-                        total_amount if item == items[-1] else "",  # แสดงยอดรวมเฉพาะบรรทัดสุดท้าย
-                        notes if item == items[-1] else ""  # แสดงหมายเหตุเฉพาะบรรทัดสุดท้าย
-                    ]]
-                )
+                    self.backend.refresh()
+                    self.recover_bill(entry)
+                except BillNotWritten:
+                    self.journal.done(bill_number)
+                    raise
+                except Exception as e:
+                    # รายการค้างใน journal: recover_bills() จะเขียนใบเสร็จและประวัติให้ครบ
+                    # สินค้าในใบเสร็จถูกกันไม่ให้เขียนจนกว่าจะกู้คืนเสร็จ จึงไม่ถูกขายซ้ำ
+                    print(f"⚠️ ใบเสร็จ {bill_number} รอบันทึกลงที่เก็บข้อมูล จะบันทึกให้อัตโนมัติ: {e}")
+                    if hold_owner is not None:
+                        self.reservations.release_hold(hold_owner)
+                    self.log_api_calls('create_bill', api_counts)
+                    return bill_number, total_amount
+            if hold_owner is not None:
+                self.reservations.release_hold(hold_owner)
             
             # บันทึกประวัติการขาย
-            item_names = [item['name'] for item in items]
-            self.add_history(seller, 'การขาย', ', '.join(item_names), len(items), f'ใบเสร็จ: {bill_number}, ยอดรวม: {total_amount:,.0f}')
+            self.add_history(seller, 'การขาย', ', '.join(item_names), len(items), history_note)
+            if self.journal is not None:
+                self.journal.done(bill_number)
             
+            self.log_api_calls('create_bill', api_counts)
             return bill_number, total_amount
             
         except Exception as e:
             print(f"❌ เกิดข้อผิดพลาดในการสร้างใบเสร็จ: {e}")
             return None, 0
+        finally:
+            if reservation is not None:
+                self.reservations.release(reservation)
+    
+    def get_seller_bills(self, seller, offset=0, limit=5):
+        """ดึงสรุปใบเสร็จของผู้ขาย (ใหม่ไปเก่า) คืนค่า (รายการ, จำนวนใบทั้งหมด)"""
+        try:
+            return self.backend.get_seller_bills(seller, offset, limit)
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการดึงประวัติการขาย: {e}")
+            return [], 0
     
     def get_bill_details(self, bill_number):
         """ดึงรายละเอียดใบเสร็จ"""
+        api_counts = self.api_call_counts()
         try:
-            bills_sheet = self.spreadsheet.worksheet('Bills')
-            records = bills_sheet.get_all_records()
-            
-            bill_items = []
-            for record in records:
-                if record['เลขที่ใบเสร็จ'] == bill_number:
-                    bill_items.append(record)
-            
+            bill_items = self.backend.get_bill(bill_number)
+            self.log_api_calls('get_bill_details', api_counts)
             return bill_items
             
         except Exception as e:
@@ -530,37 +616,31 @@ class StockManager:
     
     def update_product(self, original_name, new_name, new_quantity, new_unit, new_price, new_description, user):
         """อัปเดตข้อมูลสินค้า"""
+        api_counts = self.api_call_counts()
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            existing_products = stock_sheet.get_all_records()
+            current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            product = self.backend.update_product(original_name, {
+                'ชื่อสินค้า': new_name,
+                'จำนวน': new_quantity,
+                'หน่วย': new_unit,
+                'ราคา': new_price,
+                'คำอธิบาย': new_description,
+                'วันที่อัปเดตล่าสุด': current_date
+            })
             
-            # ค้นหาสินค้าที่ต้องการอัปเดต
-            for i, product in enumerate(existing_products):
-                if product['ชื่อสินค้า'].lower() == original_name.lower():
-                    row_num = i + 2  # +2 เพราะ index เริ่มจาก 0 และมีหัวตาราง
-                    
-                    # อัปเดตข้อมูล
-                    current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    # อัปเดตทีละคอลัมน์
-                    stock_sheet.update(f'B{row_num}', new_name)  # ชื่อสินค้า
-                    stock_sheet.update(f'C{row_num}', new_quantity)  # จำนวน
-                    stock_sheet.update(f'D{row_num}', new_unit)  # หน่วย
-                    stock_sheet.update(f'E{row_num}', new_price)  # ราคา
-                    stock_sheet.update(f'F{row_num}', new_description)  # คำอธิบาย
-                    stock_sheet.update(f'H{row_num}', current_date)  # วันที่อัปเดต
-                    
-                    # เพิ่มประวัติการอัปเดต
-                    self.add_history(
-                        user, 
-                        'แก้ไขข้อมูล', 
-                        new_name, 
-                        new_quantity, 
-                        f'อัปเดตจาก: {original_name} -> {new_name}'
-                    )
-                    
-                    print(f"✅ อัปเดตสินค้า {original_name} -> {new_name} สำเร็จ")
-                    return True
+            if product is not None:
+                # เพิ่มประวัติการอัปเดต
+                self.add_history(
+                    user, 
+                    'แก้ไขข้อมูล', 
+                    new_name, 
+                    new_quantity, 
+                    f'อัปเดตจาก: {original_name} -> {new_name}'
+                )
+                
+                print(f"✅ อัปเดตสินค้า {original_name} -> {new_name} สำเร็จ")
+                self.log_api_calls('update_product', api_counts)
+                return True
             
             print(f"❌ ไม่พบสินค้า {original_name}")
             return False
@@ -571,29 +651,23 @@ class StockManager:
     
     def delete_product(self, product_name, user):
         """ลบสินค้า"""
+        api_counts = self.api_call_counts()
         try:
-            stock_sheet = self.spreadsheet.worksheet('Stock')
-            existing_products = stock_sheet.get_all_records()
-            
-            # ค้นหาสินค้าที่ต้องการลบ
-            for i, product in enumerate(existing_products):
-                if product['ชื่อสินค้า'].lower() == product_name.lower():
-                    row_num = i + 2  # +2 เพราะ index เริ่มจาก 0 และมีหัวตาราง
-                    
-                    # ลบแถว
-                    stock_sheet.delete_rows(row_num)
-                    
-                    # เพิ่มประวัติการลบ
-                    self.add_history(
-                        user, 
-                        'ลบสินค้า', 
-                        product_name, 
-                        product.get('จำนวน', 0), 
-                        'ลบสินค้าออกจากระบบ'
-                    )
-                    
-                    print(f"✅ ลบสินค้า {product_name} สำเร็จ")
-                    return True
+            product = self.backend.delete_product(product_name)
+            
+            if product is not None:
+                # เพิ่มประวัติการลบ
+                self.add_history(
+                    user, 
+                    'ลบสินค้า', 
+                    product_name, 
+                    product.get('จำนวน', 0), 
+                    'ลบสินค้าออกจากระบบ'
+                )
+                
+                print(f"✅ ลบสินค้า {product_name} สำเร็จ")
+                self.log_api_calls('delete_product', api_counts)
+                return True
             
             print(f"❌ ไม่พบสินค้า {product_name}")
             return False
@@ -602,51 +676,306 @@ class StockManager:
             print(f"❌ เกิดข้อผิดพลาดในการลบสินค้า: {e}")
             return False
     
+    def update_product_image(self, product_name, image_url):
+        """อัปเดต URL รูปภาพของสินค้า"""
+        api_counts = self.api_call_counts()
+        try:
+            if self.backend.update_product(product_name, {'รูปภาพURL': image_url}) is None:
+                print(f"❌ ไม่พบสินค้า {product_name}")
+                return False
+            
+            print(f"✅ อัปเดตรูปภาพสินค้า {product_name} สำเร็จ")
+            self.log_api_calls('update_product_image', api_counts)
+            return True
+            
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการอัปเดตรูปภาพสินค้า: {e}")
+            return False
+    
 
-class Cart:
-    def __init__(self):
-        self.items = []  # รายการสินค้าในรถเข็น
+class AsyncStockManager:
+    """ตัวหุ้ม StockManager สำหรับเรียกจาก command และ view (ใช้ await ทุกเมธอด)
 
-    def add_item(self, product_name, quantity, price, unit):
-        self.items.append({
-            'product_name': product_name,
-            'quantity': quantity,
-            'price': price,
-            'unit': unit
-        })
+    เมธอดของ StockManager เรียก Google Sheets แบบบล็อก จึงถูกส่งไปรันบน thread pool
+    ขนาดจำกัด เพื่อไม่ให้ event loop ของ Discord หยุดรอ การเขียนข้อมูลใช้ lock แยกตามสินค้า
+    (product_locks) คำสั่งที่แก้สินค้าเดียวกันจะทำทีละคำสั่ง ส่วนสินค้าต่างกันทำพร้อมกันได้
+    การเพิ่ม ลบ หรือเปลี่ยนชื่อสินค้าจะรอให้การเขียนอื่นเสร็จก่อน (แถวในชีตเลื่อน)
 
-    def clear(self):
-        self.items = []
+    การเชื่อมต่อที่เก็บข้อมูลทำเบื้องหลังผ่าน start() ระหว่างนั้นการอ่านจะใช้ข้อมูลจาก snapshot
+    ถ้ามี ส่วนคำสั่งอื่นจะรอไม่เกิน ready_timeout วินาทีแล้วส่ง StorageNotReady
 
-    def get_total(self):
-        return sum(item['price'] * item['quantity'] for item in self.items)
+    create_bill_once() ใช้ตาราง completed_sales กันการสร้างใบเสร็จซ้ำจากการกดซ้ำหรือ interaction ที่ถูกส่งซ้ำ
 
-    def get_items(self):
-        return self.items
+    สินค้าที่มีใบเสร็จค้างใน journal จะเขียนไม่ได้ (BillPending) จนกว่า recover_bills() จะบันทึกใบเสร็จนั้นครบ
+    """
+    
+    def __init__(self, manager, max_workers=4, ready_timeout=3.0, sale_dedupe_seconds=600):
+        self.manager = manager
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sheets')
+        self.product_locks = ProductLocks()
+        # คีย์การขาย -> (เลขที่ใบเสร็จ, ยอดรวม) จำเฉพาะการขายที่สำเร็จ
+        self.completed_sales = IdempotencyCache(sale_dedupe_seconds, is_success=lambda result: result[0] is not None)
+        self.ready = asyncio.Event()
+        self.ready_timeout = ready_timeout
+        self.starting = False
+    
+    async def start(self, retry_delay=5.0, max_retry_delay=300.0):
+        """เชื่อมต่อที่เก็บข้อมูลบน thread pool (ลองใหม่จนสำเร็จ) เรียกซ้ำได้โดยไม่เชื่อมต่อซ้ำ"""
+        if self.starting or self.ready.is_set():
+            return
+        self.starting = True
+        try:
+            loop = asyncio.get_running_loop()
+            delay = retry_delay
+            while True:
+                try:
+                    connected = await loop.run_in_executor(self.executor, self.manager.connect)
+                except Exception as e:
+                    print(f"❌ เกิดข้อผิดพลาดในการเชื่อมต่อที่เก็บข้อมูล: {e}")
+                    connected = False
+                if connected:
+                    break
+                print(f"⚠️ เชื่อมต่อที่เก็บข้อมูลไม่สำเร็จ จะลองใหม่ในอีก {delay:.0f} วินาที")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_retry_delay)
+            self.ready.set()
+        finally:
+            # ถูกยกเลิกหรือเกิดข้อผิดพลาดที่ไม่คาดคิด: เรียก start() ใหม่ได้
+            self.starting = False
+    
+    async def wait_ready(self, write=False):
+        """รอให้เชื่อมต่อเสร็จ (การอ่านไม่ต้องรอถ้ามีข้อมูลจาก snapshot แล้ว)"""
+        if self.ready.is_set() or (not write and self.manager.backend.has_cached_data()):
+            return
+        try:
+            await asyncio.wait_for(self.ready.wait(), self.ready_timeout)
+        except asyncio.TimeoutError:
+            raise StorageNotReady() from None
+    
+    async def run(self, func, *args, **kwargs):
+        """รันฟังก์ชันที่บล็อกบน thread pool แล้วรอผลลัพธ์"""
+        await self.wait_ready()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    async def run_write(self, product_names, func, *args, **kwargs):
+        """รันการเขียนที่แก้ไขเฉพาะสินค้า product_names บน thread pool (ถือ lock ของสินค้าเหล่านั้น)"""
+        await self.wait_ready(write=True)
+        async with self.product_locks.hold(product_names):
+            self.check_pending(product_names)
+            return await self.run(func, *args, **kwargs)
+    
+    async def run_exclusive(self, func, *args, product_names=(), **kwargs):
+        """รันการเขียนที่เปลี่ยนโครงสร้างแคตตาล็อก หลังการเขียนอื่นทั้งหมดเสร็จ
+
+        product_names คือสินค้าที่การเขียนนี้แก้ไข (ต้องไม่มีใบเสร็จค้างใน journal)
+        """
+        await self.wait_ready(write=True)
+        async with self.product_locks.exclusive():
+            self.check_pending(product_names)
+            return await self.run(func, *args, **kwargs)
+    
+    def check_pending(self, product_names):
+        """ส่ง BillPending ถ้าสินค้ามีใบเสร็จที่ค้างใน journal (ต้องถือ lock ของสินค้าเหล่านั้น)
+
+        recover_bill เทียบสต็อกปัจจุบันกับสต็อกก่อนและหลังขายของใบเสร็จที่ค้าง การเขียนอื่นจึงต้องรอให้กู้คืนเสร็จ
+        """
+        if not product_names:
+            return
+        bill_number = self.manager.pending_bill_for(product_names)
+        if bill_number is not None:
+            raise BillPending(bill_number)
+    
+    def is_bill_pending(self, bill_number):
+        return self.manager.is_bill_pending(bill_number)
+    
+    def close(self):
+        """เขียนข้อมูลที่ค้างอยู่และปิด thread pool"""
+        self.manager.close()
+        self.executor.shutdown(wait=True)
+    
+    async def upload_image_to_drive(self, image_url, filename):
+        return await self.manager.upload_image_to_drive(image_url, filename)
+    
+    async def check_stock(self, product_name):
+        return await self.run(self.manager.check_stock, product_name)
+    
+    async def get_all_stock(self):
+        return await self.run(self.manager.get_all_stock)
+    
+    async def check_low_stock(self):
+        return await self.run(self.manager.check_low_stock)
+    
+    async def get_history(self, limit=10):
+        return await self.run(self.manager.get_history, limit)
+    
+    async def get_bill_details(self, bill_number):
+        return await self.run(self.manager.get_bill_details, bill_number)
+    
+    async def get_seller_bills(self, seller, offset=0, limit=5):
+        return await self.run(self.manager.get_seller_bills, seller, offset, limit)
+    
+    async def add_stock(self, product_name, quantity, unit, user, price=0, description="", image_url=""):
+        args = (product_name, quantity, unit, user, price, description, image_url)
+        if await self.check_stock(product_name) is not None:
+            return await self.run_write([product_name], self.manager.add_stock, *args)
+        # สินค้าใหม่: เพิ่มแถวต่อท้ายชีต
+        return await self.run_exclusive(self.manager.add_stock, *args)
+    
+    async def remove_stock(self, product_name, quantity, user):
+        return await self.run_write([product_name], self.manager.remove_stock, product_name, quantity, user)
+    
+    async def hold_stock(self, owner, product_name, quantity):
+        return await self.run(self.manager.hold_stock, owner, product_name, quantity)
+    
+    async def release_hold(self, owner):
+        # ตารางการกันสินค้าอยู่ในหน่วยความจำ ไม่ต้องรอที่เก็บข้อมูล
+        self.manager.release_hold(owner)
+    
+    async def available_quantity(self, product, owner=None):
+        return self.manager.available_quantity(product, owner)
+    
+    async def create_bill(self, seller, items, notes="", hold_owner=None):
+        return await self.run_write([item['name'] for item in items], self.manager.create_bill, seller, items, notes, hold_owner)
+    
+    async def recover_bills(self):
+        """กู้คืนการขายที่ค้างใน journal (ถือ lock ทุกสินค้า เพื่อไม่ให้การขายอื่นเปลี่ยนสต็อกระหว่างเทียบ)"""
+        if self.manager.journal is None or not self.ready.is_set() or not self.manager.journal.pending():
+            return
+        await self.run_exclusive(self.manager.recover_bills)
+    
+    async def create_bill_once(self, sale_key, seller, items, notes="", hold_owner=None):
+        """create_bill ที่ทำครั้งเดียวต่อ sale_key คืนค่า (เลขที่ใบเสร็จ, ยอดรวม, เป็นคำขอซ้ำหรือไม่)
 
-user_carts = {}
+        คำขอซ้ำจะได้ใบเสร็จเดิมโดยไม่เขียนข้อมูลอีก ผู้เรียกควรแสดงใบเสร็จอีกครั้งแต่ไม่ส่งล็อกหรือทำขั้นตอนหลังขายซ้ำ
+        ใบเสร็จที่ยังรอบันทึก (is_bill_pending) ถูกจำเหมือนการขายที่สำเร็จ คำขอซ้ำจึงไม่ขายซ้ำ
+        """
+        (bill_number, total_amount), replayed = await self.completed_sales.run(
+            sale_key, lambda: self.create_bill(seller, items, notes, hold_owner)
+        )
+        if replayed and bill_number:
+            print(f"🔄 คำขอขายซ้ำ ใช้ใบเสร็จเดิม {bill_number}")
+        return bill_number, total_amount, replayed
+    
+    async def update_product(self, original_name, new_name, new_quantity, new_unit, new_price, new_description, user):
+        args = (original_name, new_name, new_quantity, new_unit, new_price, new_description, user)
+        if normalize_product_name(new_name) == normalize_product_name(original_name):
+            return await self.run_write([original_name], self.manager.update_product, *args)
+        # เปลี่ยนชื่อสินค้า: index ชื่อสินค้าถูกสร้างใหม่
+        return await self.run_exclusive(self.manager.update_product, *args, product_names=[original_name])
+    
+    async def update_product_image(self, product_name, image_url):
+        return await self.run_write([product_name], self.manager.update_product_image, product_name, image_url)
+    
+    async def delete_product(self, product_name, user):
+        return await self.run_exclusive(self.manager.delete_product, product_name, user, product_names=[product_name])
 
-# สร้าง instance ของ StockManager
-stock_manager = StockManager()
+def create_storage_backend():
+    """สร้าง storage backend ตาม STORAGE_BACKEND"""
+    if STORAGE_BACKEND == 'memory':
+        print("⚠️ ใช้ที่เก็บข้อมูลในหน่วยความจำ ข้อมูลจะหายเมื่อปิด bot")
+        return MemoryBackend()
+    if STORAGE_BACKEND not in ('sheets', 'sqlite'):
+        print(f"⚠️ ไม่รู้จัก STORAGE_BACKEND={STORAGE_BACKEND} ใช้ Google Sheets แทน")
+    sheets = SheetsBackend(
+        credentials_file='credentials.json',
+        scopes=SCOPE,
+        sheets_id=os.getenv('GOOGLE_SHEETS_ID'),
+        sheet_name=os.getenv('GOOGLE_SHEET_NAME', 'CatBot-Stock-Management'),
+        cache_ttl=STOCK_CACHE_TTL,
+        history_flush_interval=HISTORY_FLUSH_INTERVAL,
+        history_batch_size=HISTORY_BATCH_SIZE,
+        reads_per_minute=SHEETS_READS_PER_MINUTE,
+        writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+        max_retries=SHEETS_MAX_RETRIES,
+        # SQLite ไม่โหลดข้อมูลจากชีตหลังนำเข้าครั้งแรก จึงไม่ต้องตรวจการแก้ไขชีต
+        change_check_interval=SHEETS_CHANGE_CHECK_INTERVAL if STORAGE_BACKEND != 'sqlite' else 0,
+        client_factory=functools.partial(
+            FakeSheetsClient, latency=SHEETS_FAKE_LATENCY, error_rate=SHEETS_FAKE_ERROR_RATE
+        ) if SHEETS_FAKE else None,
+        # SQLite เก็บข้อมูลในเครื่องอยู่แล้ว ใช้ snapshot เฉพาะเมื่อ Google Sheets เป็นที่เก็บหลัก
+        snapshot_path=SNAPSHOT_PATH if STORAGE_BACKEND != 'sqlite' else None,
+        snapshot_interval=SNAPSHOT_INTERVAL
+    )
+    if STORAGE_BACKEND == 'sqlite':
+        return SQLiteBackend(SQLITE_PATH, mirror=sheets, sync_interval=SHEETS_SYNC_INTERVAL)
+    return sheets
+
+def create_bill_journal():
+    """สร้าง journal การขายตาม BILL_JOURNAL_PATH
+
+    ใช้เฉพาะ STORAGE_BACKEND=sheets: SQLite บันทึกใบเสร็จและสต็อกใน transaction เดียว (WAL) อยู่แล้ว
+    ส่วน memory ข้อมูลหายเมื่อปิด bot อยู่แล้ว
+    """
+    if not BILL_JOURNAL_PATH or STORAGE_BACKEND != 'sheets':
+        return None
+    return BillJournal(BILL_JOURNAL_PATH)
+
+# สร้าง instance ของ StockManager (command และ view เรียกผ่านตัวหุ้มแบบ async)
+# ยังไม่เชื่อมต่อ Google Sheets จนกว่า bot จะออนไลน์ (ดู on_ready)
+stock_manager = AsyncStockManager(
+    StockManager(create_storage_backend(), journal=create_bill_journal()),
+    max_workers=SHEETS_MAX_WORKERS,
+    sale_dedupe_seconds=SALE_DEDUPE_SECONDS
+)
+
+# บริการและสถานะที่ใช้ร่วมกัน (ส่งให้ view ทุกตัว แทนการ import bot ภายใน view)
+app = AppContext(
+    stock_manager,
+    bill_history_channel_id=BILL_HISTORY_CHANNEL_ID,
+    cart_store=CartStore(CART_STORE_PATH) if CART_STORE_PATH else None
+)
+
+# Dictionary เก็บรถเข็นของผู้ใช้แต่ละคน
+user_carts = app.user_carts
+
+# Dictionary เก็บข้อมูลผู้ใช้ที่กำลังรอการอัปโหลดรูป
+pending_image_uploads = app.pending_image_uploads
+
+# Dictionary เก็บข้อมูลการขายที่กำลังดำเนินการ
+active_sales = app.active_sales
+
+# Dictionary เก็บช่องแชทการขายสำหรับแต่ละผู้ใช้
+sales_channels = app.sales_channels
+
+# เขียนประวัติและรถเข็นที่ค้างอยู่ก่อนโปรแกรมจบการทำงาน
+atexit.register(stock_manager.close)
+atexit.register(app.close)
 
 @bot.event
 async def on_ready():
     print(f'✅ Bot {bot.user} เชื่อมต่อสำเร็จ!')
     print(f'🔗 เชื่อมต่อกับ Google Sheets: {os.getenv("GOOGLE_SHEET_NAME")}')
     
+    # เชื่อมต่อที่เก็บข้อมูลเบื้องหลัง เพื่อไม่ให้ Google Sheets ที่ช้าหรือล่มทำให้ bot ออนไลน์ช้า
+    bot.loop.create_task(stock_manager.start())
+    
     # ตรวจสอบสินค้าใกล้หมดทุก 30 นาที
     bot.loop.create_task(low_stock_checker())
     
+    # กู้คืนการขายที่ค้างใน journal เป็นระยะ
+    if BILL_RECOVERY_INTERVAL > 0:
+        bot.loop.create_task(bill_recovery_checker())
+    
     # ลบช่องแชทการขายที่ไม่ใช้งานแล้ว
     bot.loop.create_task(cleanup_sales_channels())
 
+async def bill_recovery_checker():
+    """ลองกู้คืนการขายที่เขียนลงที่เก็บข้อมูลไม่ครบทุก BILL_RECOVERY_INTERVAL วินาที"""
+    while True:
+        try:
+            await asyncio.sleep(BILL_RECOVERY_INTERVAL)
+            await stock_manager.recover_bills()
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการกู้คืนการขาย: {e}")
+
 async def low_stock_checker():
     """ตรวจสอบสินค้าใกล้หมดและแจ้งเตือนอัตโนมัติ"""
     while True:
         try:
             await asyncio.sleep(1800)  # 30 นาที
             
-            low_stock_items = stock_manager.check_low_stock()
+            low_stock_items = await stock_manager.check_low_stock()
             
             if low_stock_items:
                 for guild in bot.guilds:
@@ -724,7 +1053,7 @@ async def create_sales_channel(guild, user):
             inline=False
         )
         
-        await channel.send(embed=embed, view=SalesChannelView(stock_manager))
+        await channel.send(embed=embed, view=SalesChannelView(app))
         
         return channel
         
@@ -732,6 +1061,9 @@ async def create_sales_channel(guild, user):
         print(f"❌ เกิดข้อผิดพลาดในการสร้างช่องแชทการขาย: {e}")
         return None
 
+# ให้ view สร้างช่องแชทการขายผ่าน AppContext
+app.create_sales_channel = create_sales_channel
+
 async def cleanup_sales_channels():
     """ลบช่องแชทการขายที่ไม่ใช้งานแล้ว"""
     while True:
@@ -764,7 +1096,7 @@ async def cleanup_sales_channels():
 @bot.command(name='add')
 async def add_stock(ctx, product_name: str, quantity: int, unit: str, price: float = 0):
     """เพิ่มสินค้าเข้าสต๊อก"""
-    if stock_manager.add_stock(product_name, quantity, unit, ctx.author, price, "", ""):
+    if await stock_manager.add_stock(product_name, quantity, unit, ctx.author, price, "", ""):
         embed = discord.Embed(
             title="✅ เพิ่มสินค้าสำเร็จ",
             description=f"เพิ่ม **{product_name}** จำนวน **{quantity} {unit}** แล้ว",
@@ -773,7 +1105,7 @@ async def add_stock(ctx, product_name: str, quantity: int, unit: str, price: flo
         if price > 0:
             embed.add_field(name="💰 ราคา", value=f"{price:,.0f}", inline=True)
         embed.set_footer(text=f"ดำเนินการโดย {ctx.author}")
-        await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+        await ctx.send(embed=embed, view=AdvancedStockView(app))
     else:
         embed = discord.Embed(
             title="❌ เกิดข้อผิดพลาด",
@@ -785,7 +1117,7 @@ async def add_stock(ctx, product_name: str, quantity: int, unit: str, price: flo
 @bot.command(name='remove')
 async def remove_stock(ctx, product_name: str, quantity: int):
     """ลดสินค้าจากสต๊อก"""
-    success, remaining = stock_manager.remove_stock(product_name, quantity, ctx.author)
+    success, remaining = await stock_manager.remove_stock(product_name, quantity, ctx.author)
     
     if success:
         embed = discord.Embed(
@@ -802,7 +1134,7 @@ async def remove_stock(ctx, product_name: str, quantity: int):
             )
         
         embed.set_footer(text=f"ดำเนินการโดย {ctx.author}")
-        await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+        await ctx.send(embed=embed, view=AdvancedStockView(app))
     else:
         embed = discord.Embed(
             title="❌ เกิดข้อผิดพลาด",
@@ -814,7 +1146,7 @@ async def remove_stock(ctx, product_name: str, quantity: int):
 @bot.command(name='check')
 async def check_stock(ctx, product_name: str):
     """ตรวจสอบจำนวนสินค้า"""
-    product = stock_manager.check_stock(product_name)
+    product = await stock_manager.check_stock(product_name)
     
     if product:
         quantity = int(product.get('จำนวน', 0))
@@ -844,7 +1176,7 @@ async def check_stock(ctx, product_name: str):
                 inline=False
             )
         
-        await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+        await ctx.send(embed=embed, view=AdvancedStockView(app))
     else:
         embed = discord.Embed(
             title="❌ ไม่พบสินค้า",
@@ -856,7 +1188,7 @@ async def check_stock(ctx, product_name: str):
 @bot.command(name='list')
 async def list_stock(ctx):
     """แสดงรายการสินค้าทั้งหมด"""
-    products = stock_manager.get_all_stock()
+    products = await stock_manager.get_all_stock()
     
     if not products:
         embed = discord.Embed(
@@ -886,12 +1218,12 @@ async def list_stock(ctx):
                 inline=True
             )
     
-    await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+    await ctx.send(embed=embed, view=AdvancedStockView(app))
 
 @bot.command(name='history')
 async def show_history(ctx):
     """แสดงประวัติการทำรายการ"""
-    history = stock_manager.get_history(10)
+    history = await stock_manager.get_history(10)
     
     if not history:
         embed = discord.Embed(
@@ -912,12 +1244,12 @@ async def show_history(ctx):
                 inline=False
             )
     
-    await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+    await ctx.send(embed=embed, view=AdvancedStockView(app))
 
 @bot.command(name='products')
 async def show_products(ctx):
     """แสดงสินค้าทั้งหมดเป็น card"""
-    products = stock_manager.get_all_stock()
+    products = await stock_manager.get_all_stock()
     
     if not products:
         embed = discord.Embed(
@@ -996,7 +1328,7 @@ async def show_products(ctx):
             embed.color = 0x95a5a6
         
         # ส่งเป็น card พร้อมปุ่ม
-        await ctx.send(embed=embed, view=ProductCardView(product, stock_manager))
+        await ctx.send(embed=embed, view=ProductCardView(product, app))
         
         # รอเล็กน้อยเพื่อไม่ให้ spam
         await asyncio.sleep(0.5)
@@ -1004,7 +1336,7 @@ async def show_products(ctx):
 @bot.command(name='product')
 async def show_product(ctx, *, product_name: str):
     """แสดงสินค้าแต่ละรายการเป็น card"""
-    product = stock_manager.check_stock(product_name)
+    product = await stock_manager.check_stock(product_name)
     
     if not product:
         embed = discord.Embed(
@@ -1081,7 +1413,7 @@ async def show_product(ctx, *, product_name: str):
         embed.color = 0x95a5a6
     
     # ส่งเป็น card พร้อมปุ่ม
-    await ctx.send(embed=embed, view=ProductCardView(product, stock_manager))
+    await ctx.send(embed=embed, view=ProductCardView(product, app))
 
 @bot.command(name='stock')
 async def stock_menu(ctx):
@@ -1126,7 +1458,7 @@ async def stock_menu(ctx):
     
     embed.set_footer(text="ใช้ปุ่มด้านล่างเพื่อเข้าใช้งานอย่างรวดเร็ว")
     
-    await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+    await ctx.send(embed=embed, view=AdvancedStockView(app))
 
 # Error handling
 @bot.event
@@ -1145,6 +1477,8 @@ async def on_command_error(ctx, error):
             color=0xe74c3c
         )
         await ctx.send(embed=embed)
+    elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, StorageNotReady):
+        await ctx.send(embed=storage_not_ready_embed(error.original))
     else:
         print(f"Error: {error}")
 
@@ -1217,7 +1551,7 @@ async def help_command(ctx):
     
     embed.set_footer(text="ระบบจะแจ้งเตือนอัตโนมัติเมื่อสินค้าเหลือน้อยกว่า 5 ชิ้น")
     
-    await ctx.send(embed=embed, view=AdvancedStockView(stock_manager))
+    await ctx.send(embed=embed, view=AdvancedStockView(app))
 
 @bot.command(name='upload_help')
 async def upload_help(ctx):
@@ -1278,7 +1612,7 @@ async def upload_help(ctx):
 async def view_bill(ctx, bill_number: str):
     """ดูรายละเอียดใบเสร็จ"""
     try:
-        bill_items = stock_manager.get_bill_details(bill_number)
+        bill_items = await stock_manager.get_bill_details(bill_number)
         
         if not bill_items:
             embed = discord.Embed(
@@ -1435,65 +1769,12 @@ async def sales_menu(ctx):
     
     await ctx.send(embed=embed, view=view)
 
-async def add_item_to_cart_helper(user_id: str, product_name: str, quantity: int):
-    """Helper function to add items to cart with validation and return result"""
-    if user_id not in user_carts:
-        user_carts[user_id] = Cart()
-    
-    # ค้นหาสินค้าในสต็อก
-    products = stock_manager.get_all_stock()
-    product_found = False
-    
-    for product in products:
-        if product['ชื่อสินค้า'].lower() == product_name.lower():
-            # ตรวจสอบสต็อกเพียงพอหรือไม่
-            available_quantity = int(product.get('จำนวน', 0))
-            if available_quantity < quantity:
-                return {
-                    'success': False,
-                    'error_type': 'insufficient_stock',
-                    'message': f"สินค้า **{product_name}** เหลือเพียง {available_quantity} {product.get('หน่วย', 'ชิ้น')}",
-                    'available_quantity': available_quantity,
-                    'unit': product.get('หน่วย', 'ชิ้น')
-                }
-            
-            price = float(product.get('ราคา', 0))
-            unit = product.get('หน่วย', 'ชิ้น')
-            user_carts[user_id].add_item(product_name, quantity, price, unit)
-            
-            # แสดงรายการสินค้าในรถเข็นทั้งหมด
-            cart = user_carts[user_id]
-            cart_items = cart.get_items()
-            total_price = cart.get_total()
-            
-            # สร้างรายการสินค้าในรถเข็น
-            cart_list = ""
-            for i, item in enumerate(cart_items, 1):
-                item_total = item['price'] * item['quantity']
-                cart_list += f"{i}. **{item['product_name']}** x{item['quantity']} {item['unit']} = {item_total:,.0f} บาท\n"
-            
-            return {
-                'success': True,
-                'product_name': product_name,
-                'quantity': quantity,
-                'cart_items': cart_items,
-                'cart_list': cart_list,
-                'total_price': total_price
-            }
-    
-    # ไม่พบสินค้า
-    return {
-        'success': False,
-        'error_type': 'product_not_found',
-        'message': f"ไม่พบสินค้า **{product_name}** ในระบบ"
-    }
-
 @bot.command()
 async def add_to_cart(ctx, product_name: str, quantity: int):
     """เพิ่มสินค้าเข้ารถเข็นของผู้ใช้"""
     user_id = str(ctx.author.id)
     
-    result = await add_item_to_cart_helper(user_id, product_name, quantity)
+    result = await app.add_item_to_cart(user_id, product_name, quantity)
     
     if result['success']:
         cart_items = result['cart_items']
@@ -1560,7 +1841,7 @@ async def add_to_cart(ctx, product_name: str, quantity: int):
 async def checkout(ctx):
     """ออกใบเสร็จและเคลียร์รถเข็น"""
     user_id = str(ctx.author.id)
-    if user_id not in user_carts or not user_carts[user_id].get_items():
+    if not app.get_cart(user_id).get_items():
         embed = discord.Embed(
             title="❌ รถเข็นว่างเปล่า",
             description="ไม่มีสินค้าในรถเข็นของคุณ",
@@ -1574,36 +1855,11 @@ async def checkout(ctx):
         await ctx.send(embed=embed)
         return
     
-    cart = user_carts[user_id]
+    cart = app.get_cart(user_id)
     items = cart.get_items()
     
     try:
-        # ตรวจสอบสต็อกก่อนขาย
-        stock_errors = []
-        for item in items:
-            product = stock_manager.check_stock(item['product_name'])
-            if product:
-                available_quantity = int(product.get('จำนวน', 0))
-                if available_quantity < item['quantity']:
-                    stock_errors.append(f"❌ {item['product_name']}: สต็อกไม่เพียงพอ (มี {available_quantity} ต้องการ {item['quantity']})")
-            else:
-                stock_errors.append(f"❌ {item['product_name']}: ไม่พบสินค้าในระบบ")
-        
-        if stock_errors:
-            embed = discord.Embed(
-                title="❌ พบข้อผิดพลาด",
-                description="ไม่สามารถชำระเงินได้เนื่องจากมีปัญหากับสต็อก",
-                color=0xe74c3c
-            )
-            embed.add_field(
-                name="รายการปัญหา",
-                value="\n".join(stock_errors),
-                inline=False
-            )
-            await ctx.send(embed=embed)
-            return
-        
-        # แปลงข้อมูลสำหรับสร้างใบเสร็จ
+        # แปลงข้อมูลสำหรับสร้างใบเสร็จ (สินค้าถูกกันไว้ตั้งแต่เพิ่มลงรถเข็น จึงไม่ต้องตรวจสต็อกทีละรายการก่อน)
         bill_items = []
         for item in items:
             bill_items.append({
@@ -1613,14 +1869,21 @@ async def checkout(ctx):
                 'unit': item['unit']
             })
         
-        # สร้างใบเสร็จ
-        bill_number, total_amount = stock_manager.create_bill(
+        # สร้างใบเสร็จ (ครั้งเดียวต่อสภาพรถเข็น !checkout ที่ส่งซ้ำระหว่างรอจะได้ใบเสร็จเดิม)
+        bill_number, total_amount, replayed = await stock_manager.create_bill_once(
+            app.checkout_key(user_id),
             ctx.author,
             bill_items,
-            f"ชำระผ่านรถเข็น - {len(items)} รายการ"
+            f"ชำระผ่านรถเข็น - {len(items)} รายการ",
+            hold_owner=user_id
         )
         
         if bill_number:
+            # เคลียร์รถเข็นและคืนสินค้าที่กันไว้ทันทีหลังขายสำเร็จ ก่อนขั้นตอนลบสิทธิ์ที่ต้องรอ
+            # (คำขอซ้ำไม่ต้องล้าง เพราะคำขอแรกล้างไปแล้ว)
+            if not replayed:
+                await app.clear_cart(user_id)
+            
             # สร้าง embed ใบเสร็จ
             embed = discord.Embed(
                 title="🧾 ใบเสร็จการขาย",
@@ -1658,11 +1921,16 @@ async def checkout(ctx):
                 inline=False
             )
             
+            add_bill_pending_field(embed, stock_manager, bill_number)
             embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
             
             await ctx.send(embed=embed)
             
-            # ส่งล็อกไปยังช่องประวัติบิลถ้ามี
+            # คำขอซ้ำ: ขั้นตอนหลังขายทำไปแล้วโดยคำขอแรก
+            if replayed:
+                return
+            
+            # ส่งล็อกไปยังช่องประวัติบิลถ้ามี (เข้าคิวส่งเบื้องหลัง ไม่รอช่องล็อก)
             try:
                 bill_history_channel = ctx.guild.get_channel(BILL_HISTORY_CHANNEL_ID)
                 if bill_history_channel:
@@ -1703,22 +1971,33 @@ async def checkout(ctx):
                     )
                     log_embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                     
-                    await bill_history_channel.send(embed=log_embed)
+                    app.bill_log.publish(bill_history_channel, log_embed)
             except Exception as e:
                 print(f"❌ ไม่สามารถส่งล็อกไปยังช่องประวัติบิลได้: {e}")
             
             # ลบสิทธิ์ผู้ขายออกจากห้องหลังแสดงใบเสร็จการขาย
             await remove_seller_permission(ctx, ctx.author)
             
-            # เคลียร์รถเข็น
-            cart.clear()
-            
         else:
-            embed = discord.Embed(
-                title="❌ เกิดข้อผิดพลาด",
-                description="ไม่สามารถสร้างใบเสร็จได้",
-                color=0xe74c3c
-            )
+            # ขายไม่สำเร็จ (เช่น การกันสินค้าหมดอายุแล้วมีคนซื้อไปก่อน) ตรวจทีละรายการเพื่อแจ้งปัญหา
+            stock_errors = await app.cart_stock_errors(user_id)
+            if stock_errors:
+                embed = discord.Embed(
+                    title="❌ พบข้อผิดพลาด",
+                    description="ไม่สามารถชำระเงินได้เนื่องจากมีปัญหากับสต็อก",
+                    color=0xe74c3c
+                )
+                embed.add_field(
+                    name="รายการปัญหา",
+                    value="\n".join(stock_errors),
+                    inline=False
+                )
+            else:
+                embed = discord.Embed(
+                    title="❌ เกิดข้อผิดพลาด",
+                    description="ไม่สามารถสร้างใบเสร็จได้",
+                    color=0xe74c3c
+                )
             await ctx.send(embed=embed)
             
     except Exception as e:
@@ -1733,7 +2012,7 @@ async def checkout(ctx):
 async def cart(ctx):
     """ดูรถเข็นสินค้าของผู้ใช้"""
     user_id = str(ctx.author.id)
-    if user_id not in user_carts or not user_carts[user_id].get_items():
+    if not app.get_cart(user_id).get_items():
         embed = discord.Embed(
             title="🛒 รถเข็นของคุณ",
             description="รถเข็นว่างเปล่า",
@@ -1747,7 +2026,7 @@ async def cart(ctx):
         await ctx.send(embed=embed)
         return
     
-    cart = user_carts[user_id]
+    cart = app.get_cart(user_id)
     items = cart.get_items()
     total = cart.get_total()
     
@@ -1783,7 +2062,7 @@ async def cart(ctx):
 async def clear_cart(ctx):
     """เคลียร์รถเข็นสินค้าของผู้ใช้"""
     user_id = str(ctx.author.id)
-    if user_id not in user_carts or not user_carts[user_id].get_items():
+    if not app.get_cart(user_id).get_items():
         embed = discord.Embed(
             title="🛒 รถเข็นของคุณ",
             description="รถเข็นว่างเปล่าอยู่แล้ว",
@@ -1792,7 +2071,7 @@ async def clear_cart(ctx):
         await ctx.send(embed=embed)
         return
     
-    user_carts[user_id].clear()
+    await app.clear_cart(user_id)
     embed = discord.Embed(
         title="✅ เคลียร์รถเข็นสำเร็จ",
         description="รถเข็นของคุณถูกล้างแล้ว",
@@ -1823,32 +2102,23 @@ async def on_message(message):
                             image_url = await stock_manager.upload_image_to_drive(attachment.url, filename)
                             
                             if image_url:
-                                # อัปเดตข้อมูลสินค้าด้วย URL รูปภาพ
-                                products = stock_manager.get_all_stock()
-                                for product in products:
-                                    if product['ชื่อสินค้า'].lower() == product_name.lower():
-                                        # อัปเดต URL รูปภาพในชีต
-                                        stock_sheet = stock_manager.spreadsheet.worksheet('Stock')
-                                        existing_products = stock_sheet.get_all_records()
-                                        
-                                        for i, p in enumerate(existing_products):
-                                            if p['ชื่อสินค้า'].lower() == product_name.lower():
-                                                stock_sheet.update(f'G{i+2}', image_url)
-                                                break
-                                        
-                                        embed = discord.Embed(
-                                            title="✅ อัปโหลดรูปภาพสำเร็จ",
-                                            description=f"อัปโหลดรูปภาพสำหรับสินค้า **{product_name}** เรียบร้อยแล้ว",
-                                            color=0x2ecc71
-                                        )
-                                        embed.add_field(
-                                            name="ℹ️ ระบบจัดเก็บ",
-                                            value="ใช้ Discord CDN สำหรับความเร็วและเสถียรภาพ",
-                                            inline=False
-                                        )
-                                        embed.set_image(url=image_url)
-                                        await message.reply(embed=embed)
-                                        break
+                                # อัปเดตข้อมูลสินค้าด้วย URL รูปภาพ (ค้นหาผ่าน index ชื่อสินค้า)
+                                if await stock_manager.check_stock(product_name):
+                                    if not await stock_manager.update_product_image(product_name, image_url):
+                                        raise Exception("ไม่สามารถบันทึก URL รูปภาพลงชีตได้")
+                                    
+                                    embed = discord.Embed(
+                                        title="✅ อัปโหลดรูปภาพสำเร็จ",
+                                        description=f"อัปโหลดรูปภาพสำหรับสินค้า **{product_name}** เรียบร้อยแล้ว",
+                                        color=0x2ecc71
+                                    )
+                                    embed.add_field(
+                                        name="ℹ️ ระบบจัดเก็บ",
+                                        value="ใช้ Discord CDN สำหรับความเร็วและเสถียรภาพ",
+                                        inline=False
+                                    )
+                                    embed.set_image(url=image_url)
+                                    await message.reply(embed=embed)
                                 else:
                                     embed = discord.Embed(
                                         title="❌ ไม่พบสินค้า",
@@ -1890,7 +2160,7 @@ async def on_message(message):
                         
                         if image_url:
                             # สร้างสินค้าใหม่พร้อมรูปภาพ
-                            success = stock_manager.add_stock(
+                            success = await stock_manager.add_stock(
                                 product_name,
                                 product_data['quantity'],
                                 product_data['unit'],
@@ -1980,4 +2250,7 @@ async def on_message(message):
 
 # รัน bot
 if __name__ == "__main__":
-    bot.run(os.getenv('DISCORD_TOKEN'))
+    try:
+        bot.run(os.getenv('DISCORD_TOKEN'))
+    finally:
+        stock_manager.close()
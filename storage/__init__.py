@@ -0,0 +1,5 @@
+from .base import BillNotWritten, StorageBackend, StorageNotReady
+from .memory_backend import MemoryBackend
+from .sheets_backend import SHEET_HEADERS, SheetsBackend
+from .sheets_replicator import SheetsReplicator
+from .sqlite_backend import SQLiteBackend
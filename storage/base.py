@@ -0,0 +1,98 @@
+class StorageNotReady(Exception):
+    """ที่เก็บข้อมูลยังเชื่อมต่อไม่เสร็จ (bot เพิ่งเริ่มทำงาน หรือ Google Sheets ไม่ตอบสนอง)"""
+
+    def __init__(self):
+        super().__init__("ระบบกำลังเชื่อมต่อ Google Sheets กรุณาลองใหม่อีกครั้งในอีกสักครู่")
+
+
+class BillNotWritten(Exception):
+    """commit_bill ไม่ได้เขียนอะไรลงที่เก็บข้อมูล (เช่น สต็อกไม่พอ หรือเขียนไม่สำเร็จและคืนค่าเดิมครบแล้ว)"""
+
+
+class StorageBackend:
+    """ส่วนติดต่อของที่เก็บข้อมูลที่ StockManager ใช้
+
+    ข้อมูลสินค้าเป็น dict ที่ใช้ชื่อหัวตารางของชีต Stock เป็นคีย์ (เช่น 'ชื่อสินค้า', 'จำนวน')
+    แถวประวัติและแถวใบเสร็จเป็น list ตามลำดับคอลัมน์ของชีต History และ Bills
+    การค้นหาสินค้าด้วยชื่อต้องใช้ normalize_product_name เหมือนกันทุก backend
+    """
+
+    def connect(self):
+        """เตรียมที่เก็บข้อมูล คืน True ถ้าพร้อมใช้งาน"""
+        return True
+
+    def close(self):
+        """เขียนข้อมูลที่ค้างอยู่และปิดการเชื่อมต่อ"""
+
+    def api_call_counts(self):
+        """จำนวนคำขอ Sheets API (อ่าน, เขียน) ที่ส่งไปแล้วทั้งหมด"""
+        return 0, 0
+
+    def throttle_stats(self):
+        """สถิติการรอคิวโควตาและการลองใหม่ของ Sheets API"""
+        return {}
+
+    def connect_times(self):
+        """เวลาที่ใช้ในแต่ละขั้นตอนของ connect() (ชื่อขั้นตอน -> วินาที)"""
+        return {}
+
+    def has_cached_data(self):
+        """อ่านข้อมูลสินค้าและใบเสร็จได้แล้วหรือไม่ ก่อน connect() เสร็จ (เช่น จาก snapshot)"""
+        return False
+
+    def refresh(self):
+        """โหลดข้อมูลสินค้าและใบเสร็จล่าสุดจากที่เก็บจริง (ใช้ก่อนกู้คืนการขายที่ค้างใน journal)"""
+
+    # ---------- สินค้า ----------
+
+    def get_products(self):
+        """รายการสินค้าทั้งหมด (สำเนา)"""
+        raise NotImplementedError
+
+    def find_product(self, product_name):
+        """ค้นหาสินค้าตามชื่อ คืนสำเนาข้อมูลสินค้าหรือ None"""
+        raise NotImplementedError
+
+    def add_product(self, product):
+        """เพิ่มสินค้าใหม่ (กำหนด ID ให้) คืนข้อมูลสินค้าที่เพิ่ม"""
+        raise NotImplementedError
+
+    def update_product(self, product_name, fields):
+        """แก้ไขข้อมูลสินค้า คืนข้อมูลหลังแก้ไข หรือ None ถ้าไม่พบสินค้า"""
+        raise NotImplementedError
+
+    def delete_product(self, product_name):
+        """ลบสินค้า คืนข้อมูลสินค้าที่ลบ หรือ None ถ้าไม่พบ"""
+        raise NotImplementedError
+
+    # ---------- ประวัติ ----------
+
+    def append_history(self, row):
+        """เพิ่มประวัติหนึ่งแถว"""
+        raise NotImplementedError
+
+    def get_history(self, limit=10):
+        """ประวัติล่าสุด limit รายการ (เก่าไปใหม่)"""
+        raise NotImplementedError
+
+    # ---------- ใบเสร็จ ----------
+
+    def max_bill_sequence(self, date_prefix):
+        """ลำดับใบเสร็จสูงสุดของวันที่ระบุ (YYYYMMDD)"""
+        raise NotImplementedError
+
+    def commit_bill(self, bill_number, bill_rows, sold_quantities, updated_at):
+        """ตัดสต็อกตาม sold_quantities (ชื่อสินค้า -> จำนวน) และบันทึกแถวของใบเสร็จ
+
+        ส่ง BillNotWritten ถ้าสต็อกไม่พอหรือบันทึกไม่สำเร็จโดยแน่ใจว่าไม่มีอะไรถูกเขียน
+        exception อื่นหมายถึงไม่รู้ผล (อาจเขียนไปบางส่วน) ผู้เรียกต้องตรวจสอบกับที่เก็บข้อมูลก่อนถือว่าไม่สำเร็จ
+        """
+        raise NotImplementedError
+
+    def get_bill(self, bill_number):
+        """รายการในใบเสร็จ ([] ถ้าไม่พบ)"""
+        raise NotImplementedError
+
+    def get_seller_bills(self, seller, offset=0, limit=5):
+        """สรุปใบเสร็จของผู้ขาย (ใหม่ไปเก่า) คืนค่า (รายการ, จำนวนใบทั้งหมด)"""
+        raise NotImplementedError
@@ -0,0 +1,102 @@
+import threading
+
+from utils import HISTORY_HEADERS, BillIndex, ProductCatalog, bill_records
+
+from .base import BillNotWritten, StorageBackend
+
+
+class MemoryBackend(StorageBackend):
+    """ที่เก็บข้อมูลในหน่วยความจำ (ข้อมูลหายเมื่อปิด bot)
+
+    ใช้ทดสอบหรือวัดประสิทธิภาพของ StockManager โดยไม่ต้องมีบัญชี Google
+    สินค้าเก็บใน ProductCatalog และใบเสร็จเก็บเป็นแถวเรียงกันพร้อม BillIndex เหมือนชีต Bills
+    """
+
+    def __init__(self, products=None):
+        self.catalog = ProductCatalog(ttl=float('inf'))
+        self.catalog.load(products or [])
+        self.history = []
+        self.bill_rows = []  # แถวของชีต Bills (ไม่รวมหัวตาราง)
+        self.bill_index = BillIndex()
+        self.bill_index.load([[]])
+        self.lock = threading.RLock()
+
+    def has_cached_data(self):
+        return True
+
+    # ---------- สินค้า ----------
+
+    def get_products(self):
+        with self.lock:
+            return self.catalog.get_all()
+
+    def find_product(self, product_name):
+        with self.lock:
+            i, product = self.catalog.find(product_name)
+            return dict(product) if product is not None else None
+
+    def add_product(self, product):
+        with self.lock:
+            product = dict(product, ID=self.catalog.next_id())
+            self.catalog.append(product)
+            return dict(product)
+
+    def update_product(self, product_name, fields):
+        with self.lock:
+            i, product = self.catalog.find(product_name)
+            if product is None:
+                return None
+            self.catalog.update(i, fields)
+            return dict(self.catalog.products[i])
+
+    def delete_product(self, product_name):
+        with self.lock:
+            i, product = self.catalog.find(product_name)
+            if product is None:
+                return None
+            self.catalog.remove(i)
+            return dict(product)
+
+    # ---------- ประวัติ ----------
+
+    def append_history(self, row):
+        with self.lock:
+            self.history.append(dict(zip(HISTORY_HEADERS, row)))
+
+    def get_history(self, limit=10):
+        with self.lock:
+            return [dict(record) for record in self.history[-limit:]]
+
+    # ---------- ใบเสร็จ ----------
+
+    def max_bill_sequence(self, date_prefix):
+        return self.bill_index.max_sequence(date_prefix)
+
+    def commit_bill(self, bill_number, bill_rows, sold_quantities, updated_at):
+        with self.lock:
+            stock = []
+            for product_name, sold in sold_quantities.items():
+                i, product = self.catalog.find(product_name)
+                if product is None:
+                    raise BillNotWritten(f"ไม่พบสินค้า {product_name}")
+                available_quantity = int(product.get('จำนวน', 0))
+                if available_quantity < sold:
+                    raise BillNotWritten(f"สต็อก {product_name} ไม่เพียงพอ (มี {available_quantity} ต้องการ {sold})")
+                stock.append((i, available_quantity - sold))
+
+            for i, quantity in stock:
+                self.catalog.update(i, {'จำนวน': quantity, 'วันที่อัปเดตล่าสุด': updated_at})
+            first_row = ProductCatalog.row_number(len(self.bill_rows))
+            self.bill_rows.extend(list(row) for row in bill_rows)
+            self.bill_index.add(bill_number, first_row, first_row + len(bill_rows) - 1, bill_records(bill_rows))
+
+    def get_bill(self, bill_number):
+        with self.lock:
+            rows = self.bill_index.get_rows(bill_number)
+            if rows is None:
+                return []
+            first_row, last_row = rows
+            return bill_records(self.bill_rows[first_row - 2:last_row - 1])
+
+    def get_seller_bills(self, seller, offset=0, limit=5):
+        return self.bill_index.get_seller_bills(seller, offset, limit)
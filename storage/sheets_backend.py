@@ -0,0 +1,514 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import gspread
+from google.oauth2.service_account import Credentials
+from gspread.utils import ValueRenderOption
+
+from utils import (
+    BILLS_HEADERS, HISTORY_HEADERS, STOCK_HEADERS, BillIndex, ChangeProbe, HistoryWriter, ProductCatalog,
+    SheetsClient, SnapshotWriter, TokenBucket, WorksheetCache, bill_records, parse_updated_rows
+)
+
+from .base import BillNotWritten, StorageBackend
+
+# หัวตารางของแต่ละชีตใน Google Sheets
+SHEET_HEADERS = {
+    'Stock': STOCK_HEADERS,
+    'History': HISTORY_HEADERS,
+    'Bills': BILLS_HEADERS
+}
+
+# คอลัมน์ของแต่ละข้อมูลในชีต Stock
+STOCK_COLUMNS = dict(zip(STOCK_HEADERS, 'ABCDEFGH'))
+
+
+def request_rejected(error):
+    """Google Sheets ตอบกลับว่าปฏิเสธคำขอ (4xx) จึงแน่ใจว่าคำขอไม่ถูกบันทึก
+
+    5xx หรือการเชื่อมต่อขาดระหว่างรอคำตอบ คำขออาจถูกบันทึกไปแล้ว
+    """
+    status = getattr(getattr(error, 'response', None), 'status_code', 0) or 0
+    return isinstance(error, gspread.exceptions.APIError) and 400 <= status < 500
+
+
+class SheetsBackend(StorageBackend):
+    """ที่เก็บข้อมูลบน Google Sheets (ชีต Stock, History และ Bills)
+
+    อ่านสินค้าจากแคตตาล็อกในหน่วยความจำ (โหลดชีต Stock ใหม่เมื่อหมดอายุ หรือเมื่อ ChangeProbe
+    พบว่ามีคนแก้ไขชีต), เขียนประวัติแบบต่อท้ายผ่าน HistoryWriter และค้นหาใบเสร็จผ่าน BillIndex
+
+    ถ้ากำหนด snapshot_path จะบันทึกแคตตาล็อกและ index ใบเสร็จลงไฟล์ทุก snapshot_interval วินาที
+    ตอนเริ่มต้นจะโหลดจากไฟล์ทันทีแล้วโหลดข้อมูลจริงจากชีตเบื้องหลัง คำสั่งแรกหลังรีสตาร์ทจึงตอบจากหน่วยความจำ
+    """
+
+    def __init__(self, credentials_file='credentials.json', scopes=None, sheets_id=None,
+                 sheet_name='CatBot-Stock-Management', cache_ttl=60, history_flush_interval=2.0,
+                 history_batch_size=20, reads_per_minute=60, writes_per_minute=60, max_retries=5,
+                 client_factory=None, change_check_interval=5.0, snapshot_path=None, snapshot_interval=60.0):
+        self.credentials_file = credentials_file
+        self.scopes = scopes
+        self.sheets_id = sheets_id
+        self.sheet_name = sheet_name
+        self.reads_per_minute = reads_per_minute
+        self.writes_per_minute = writes_per_minute
+        self.max_retries = max_retries
+        self.client_factory = client_factory  # เช่น FakeSheetsClient (ไม่ต้องใช้ credentials)
+        self.credentials = None
+        self.gc = None
+        self.spreadsheet = None
+        self.sheets = WorksheetCache(lambda: self.spreadsheet)
+        self.catalog = ProductCatalog(ttl=cache_ttl)
+        self.change_probe = ChangeProbe(
+            lambda: self.gc.file_version(self.spreadsheet.id),
+            interval=change_check_interval
+        ) if change_check_interval > 0 else None
+        self.history_writer = HistoryWriter(
+            lambda: self.worksheet('History'),
+            flush_interval=history_flush_interval,
+            batch_size=history_batch_size
+        )
+        self.bill_index = BillIndex()
+        # lock ของการโหลดข้อมูลจากชีตและการเขียน (กันการโหลดเบื้องหลังทับข้อมูลที่เพิ่งเขียน)
+        self.lock = threading.RLock()
+        self.data_version = 0  # เพิ่มขึ้นทุกครั้งที่ข้อมูลในหน่วยความจำเปลี่ยน
+        self.reconciling = threading.Event()
+        self.snapshot = SnapshotWriter(
+            snapshot_path, self.snapshot_data, interval=snapshot_interval
+        ) if snapshot_path else None
+        self.phase_times = {}  # ขั้นตอนของ connect() -> วินาที
+
+    def connect(self):
+        """ตั้งค่าการเชื่อมต่อ Google Sheets คืน True ถ้าสำเร็จ"""
+        self.history_writer.start()
+        started = time.perf_counter()
+        restored = self.catalog.loaded_at is None and self.restore_snapshot()
+        started = self.record_phase('snapshot', started)
+        try:
+            client_options = {
+                'read_limiter': TokenBucket(self.reads_per_minute),
+                'write_limiter': TokenBucket(self.writes_per_minute),
+                'max_retries': self.max_retries
+            }
+            if self.client_factory is not None:
+                self.gc = self.client_factory(**client_options)
+                print("⚠️ ใช้ Google Sheets จำลองในหน่วยความจำ")
+            # ใช้ credentials.json file
+            elif os.path.exists(self.credentials_file):
+                self.credentials = Credentials.from_service_account_file(
+                    self.credentials_file, scopes=self.scopes)
+                self.gc = SheetsClient(auth=self.credentials, **client_options)
+            else:
+                print(f"❌ ไม่พบไฟล์ {self.credentials_file}")
+                return False
+            started = self.record_phase('credentials', started)
+
+            # แท็บถูกลบหรือเปลี่ยนชื่อ: ดึงรายการ worksheet ใหม่ในครั้งถัดไป
+            self.gc.on_missing_range = self.sheets.invalidate
+
+            # เปิด Google Sheets
+            if self.sheets_id:
+                self.spreadsheet = self.gc.open_by_key(self.sheets_id)
+            else:
+                self.spreadsheet = self.gc.open(self.sheet_name)
+            started = self.record_phase('open_spreadsheet', started)
+
+            # แยกการเขียนของ bot ออกจากการแก้ไขชีตด้วยมือ
+            if self.change_probe is not None:
+                self.gc.write_observer = self.change_probe
+
+            # สร้างชีตหากยังไม่มี
+            self.setup_sheets()
+            self.record_phase('setup_sheets', started)
+            print("✅ เชื่อมต่อ Google Sheets สำเร็จ")
+
+            if restored:
+                self.reconciling.set()
+                threading.Thread(target=self.reconcile, name='sheets-reconcile', daemon=True).start()
+            if self.snapshot is not None:
+                self.snapshot.start()
+            return True
+
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการเชื่อมต่อ Google Sheets: {e}")
+            return False
+
+    def record_phase(self, name, started):
+        """บันทึกเวลาที่ใช้ในขั้นตอน name ตั้งแต่ started แล้วคืนเวลาปัจจุบัน (เริ่มขั้นตอนถัดไป)"""
+        now = time.perf_counter()
+        self.phase_times[name] = now - started
+        return now
+
+    def connect_times(self):
+        return dict(self.phase_times)
+
+    def has_cached_data(self):
+        return self.catalog.loaded_at is not None and self.bill_index.loaded
+
+    def close(self):
+        """เขียนประวัติที่ค้างอยู่ทั้งหมดลงชีต และบันทึก snapshot ล่าสุด"""
+        self.history_writer.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    # ---------- snapshot ----------
+
+    def snapshot_key(self):
+        return self.sheets_id or self.sheet_name
+
+    def snapshot_data(self):
+        """คืน (version, ข้อมูล) สำหรับ SnapshotWriter (None ถ้ายังโหลดข้อมูลจากชีตไม่ครบ)"""
+        with self.lock:
+            if self.catalog.loaded_at is None or not self.bill_index.loaded:
+                return self.data_version, None
+            return self.data_version, {
+                'key': self.snapshot_key(),
+                'products': self.catalog.get_all(),
+                'bills': self.bill_index.to_snapshot()
+            }
+
+    def restore_snapshot(self):
+        """โหลดแคตตาล็อกและ index ใบเสร็จจาก snapshot คืน True ถ้าโหลดสำเร็จ"""
+        if self.snapshot is None:
+            return False
+        data = self.snapshot.load()
+        if data is None or data.get('key') != self.snapshot_key():
+            return False
+        try:
+            with self.lock:
+                self.catalog.load(data['products'])
+                self.bill_index.restore(data['bills'])
+                self.snapshot.saved_version = self.data_version
+            print(f"✅ โหลด snapshot สำเร็จ (สินค้า {len(self.catalog)} รายการ, ใบเสร็จ {len(self.bill_index.rows)} ใบ)")
+            return True
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถโหลด snapshot ได้: {e}")
+            self.catalog.invalidate()
+            self.bill_index.invalidate()
+            return False
+
+    def refresh(self):
+        """โหลดแคตตาล็อกและ index ใบเสร็จจากชีตทันที (ข้อมูลจาก snapshot อาจไม่มีการขายล่าสุดก่อนปิด bot)"""
+        self.load_catalog()
+        self.load_bill_index()
+
+    def reconcile(self):
+        """โหลดข้อมูลจริงจากชีตมาแทนข้อมูลจาก snapshot (ทำงานเบื้องหลังหลังเริ่มต้น)"""
+        try:
+            self.load_catalog()
+            self.load_bill_index()
+            print("✅ ตรวจสอบข้อมูล snapshot กับ Google Sheets เรียบร้อย")
+        except Exception as e:
+            # โหลดไม่สำเร็จ: ใช้ข้อมูลจาก snapshot ต่อไปจนกว่าจะหมดอายุหรือพบการแก้ไข
+            print(f"⚠️ ไม่สามารถโหลดข้อมูลจาก Google Sheets เบื้องหลังได้: {e}")
+        finally:
+            self.reconciling.clear()
+
+    def setup_sheets(self):
+        """สร้างชีตและตั้งค่าหัวตาราง
+
+        ดึง worksheet ทุกแท็บด้วยคำขอเดียว และอ่านหัวตารางของทุกชีตด้วย values_batch_get ครั้งเดียว
+        """
+        try:
+            self.sheets.refresh()
+
+            # สร้างชีตที่ยังไม่มี พร้อมหัวตาราง
+            existing_titles = []
+            for title, headers in SHEET_HEADERS.items():
+                if self.sheets.find(title) is not None:
+                    print(f"✅ พบชีต {title} แล้ว")
+                    existing_titles.append(title)
+                    continue
+
+                print(f"⚠️ ไม่พบชีต {title} กำลังสร้างใหม่...")
+                sheet = self.spreadsheet.add_worksheet(title=title, rows=1000, cols=len(headers))
+                sheet.update(range_name=f'A1:{chr(64 + len(headers))}1', values=[headers])
+                self.sheets.add(sheet)
+                print(f"✅ สร้างชีต {title} เรียบร้อย")
+
+            # ตรวจสอบหัวตารางของชีตที่มีอยู่แล้วในคำขอเดียว
+            if not existing_titles:
+                return
+            try:
+                response = self.spreadsheet.values_batch_get([f"'{title}'!1:1" for title in existing_titles])
+                value_ranges = response.get('valueRanges', [])
+                for title, value_range in zip(existing_titles, value_ranges):
+                    headers = SHEET_HEADERS[title]
+                    first_row = (value_range.get('values') or [[]])[0]
+                    if not first_row or len(first_row) < len(headers) or first_row[0] != headers[0]:
+                        print(f"⚠️ หัวตารางของชีต {title} ไม่ถูกต้อง กำลังแก้ไข...")
+                        self.sheets.get(title).update(range_name=f'A1:{chr(64 + len(headers))}1', values=[headers])
+                        print(f"✅ แก้ไขหัวตารางชีต {title} เรียบร้อย")
+            except Exception as e:
+                print(f"⚠️ ไม่สามารถตรวจสอบหัวตารางได้: {e}")
+
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการสร้างชีต: {e}")
+
+    def worksheet(self, title):
+        """คืน worksheet จาก cache (ไม่ต้องอ่าน metadata ของ spreadsheet ทุกครั้ง)"""
+        return self.sheets.get(title)
+
+    def api_call_counts(self):
+        """จำนวนคำขอ Sheets API (อ่าน, เขียน) ที่ส่งไปแล้วทั้งหมด"""
+        return getattr(self.gc, 'read_count', 0), getattr(self.gc, 'write_count', 0)
+
+    def throttle_stats(self):
+        """สถิติการรอคิวโควตาและการลองใหม่ของ Sheets API"""
+        return self.gc.throttle_stats() if hasattr(self.gc, 'throttle_stats') else {}
+
+    # ---------- สินค้า (ชีต Stock) ----------
+
+    def get_catalog(self):
+        """ดึงแคตตาล็อกสินค้า (โหลดจากชีต Stock เมื่อยังไม่มี หมดอายุ หรือชีตถูกแก้ไขจากภายนอก)"""
+        if self.catalog.is_stale():
+            self.load_catalog()
+        elif self.change_probe is not None and self.spreadsheet is not None and not self.reconciling.is_set():
+            try:
+                changed = self.change_probe.changed()
+            except Exception as e:
+                print(f"⚠️ ไม่สามารถตรวจสอบการแก้ไขชีตได้: {e}")
+                changed = False
+            if changed:
+                print("🔄 พบการแก้ไข Google Sheets จากภายนอก")
+                self.load_catalog()
+        return self.catalog
+
+    def load_catalog(self):
+        """โหลดแคตตาล็อกสินค้าใหม่ทั้งหมดจากชีต Stock"""
+        with self.lock:
+            if self.change_probe is not None:
+                # อ่านเวลาแก้ไขก่อนโหลด เพื่อให้การแก้ไขระหว่างโหลดถูกตรวจพบในรอบถัดไป
+                try:
+                    self.change_probe.reset()
+                except Exception as e:
+                    print(f"⚠️ ไม่สามารถอ่านเวลาแก้ไขของ Google Sheets ได้: {e}")
+            stock_sheet = self.worksheet('Stock')
+            self.catalog.load(stock_sheet.get_all_records())
+            self.data_version += 1
+        print(f"🔄 โหลดแคตตาล็อกสินค้าจากชีต Stock ({len(self.catalog)} รายการ)")
+
+    def write_stock_rows(self, stock_sheet, rows):
+        """เขียนเซลล์ของหลายแถวด้วย batch_update ครั้งเดียว (rows คือ dict ของเลขแถว -> cells)
+
+        cells คือ dict ของคอลัมน์ -> ค่า เช่น {'C': 10, 'H': '2025-01-01 10:00:00'}
+        """
+        stock_sheet.batch_update([
+            {'range': f'{column}{row_number}', 'values': [[value]]}
+            for row_number, cells in rows.items()
+            for column, value in cells.items()
+        ])
+
+    def get_products(self):
+        """รายการสินค้าทั้งหมด (สำเนา)"""
+        return self.get_catalog().get_all()
+
+    def find_product(self, product_name):
+        """ค้นหาสินค้าตามชื่อ คืนสำเนาข้อมูลสินค้าหรือ None"""
+        i, product = self.get_catalog().find(product_name)
+        return dict(product) if product is not None else None
+
+    def add_product(self, product):
+        """เพิ่มสินค้าใหม่ต่อท้ายชีต Stock (กำหนด ID ให้) คืนข้อมูลสินค้าที่เพิ่ม"""
+        with self.lock:
+            stock_sheet = self.worksheet('Stock')
+            existing_products = self.get_catalog().products
+
+            # ชีตยังไม่มีสินค้า: ตรวจสอบว่าแถวแรกมีหัวตารางหรือไม่
+            if not existing_products:
+                first_row = stock_sheet.row_values(1)
+                if not first_row or first_row[0] != 'ID':
+                    stock_sheet.clear()
+                    stock_sheet.update(range_name='A1:H1', values=[STOCK_HEADERS])
+                    print("✅ ตั้งค่าหัวตารางใหม่สำเร็จ")
+
+            next_row = ProductCatalog.row_number(len(existing_products))
+            product = dict(product, ID=self.catalog.next_id())
+            stock_sheet.update(
+                range_name=f'A{next_row}:H{next_row}',
+                values=[[product.get(header, '') for header in STOCK_HEADERS]]
+            )
+            self.catalog.append(product)
+            self.data_version += 1
+            return dict(product)
+
+    def update_product(self, product_name, fields):
+        """แก้ไขข้อมูลสินค้า (fields ใช้ชื่อหัวตาราง เช่น {'จำนวน': 5}) ด้วย batch_update ครั้งเดียว
+
+        คืนข้อมูลสินค้าหลังแก้ไข หรือ None ถ้าไม่พบสินค้า
+        """
+        with self.lock:
+            i, product = self.get_catalog().find(product_name)
+            if product is None:
+                return None
+
+            cells = {STOCK_COLUMNS[field]: value for field, value in fields.items()}
+            self.write_stock_rows(self.worksheet('Stock'), {ProductCatalog.row_number(i): cells})
+            self.catalog.update(i, fields)
+            self.data_version += 1
+            return dict(self.catalog.products[i])
+
+    def delete_product(self, product_name):
+        """ลบแถวสินค้าออกจากชีต Stock คืนข้อมูลสินค้าที่ลบ หรือ None ถ้าไม่พบ"""
+        with self.lock:
+            i, product = self.get_catalog().find(product_name)
+            if product is None:
+                return None
+
+            self.worksheet('Stock').delete_rows(ProductCatalog.row_number(i))
+            self.catalog.remove(i)
+            self.data_version += 1
+            return dict(product)
+
+    # ---------- ประวัติ (ชีต History) ----------
+
+    def append_history(self, row):
+        """เพิ่มประวัติเข้าคิวเขียนต่อท้ายชีต History (ไม่อ่านชีตก่อน)"""
+        self.history_writer.add(row)
+
+    def get_history(self, limit=10):
+        """ประวัติล่าสุด limit รายการ (รวมรายการที่ยังรอเขียนลงชีต)"""
+        history_sheet = self.worksheet('History')
+        records = history_sheet.get_all_records()
+        records += self.history_writer.pending_records()
+        return records[-limit:] if len(records) > limit else records
+
+    # ---------- ใบเสร็จ (ชีต Bills) ----------
+
+    def get_bill_index(self):
+        """คืน index เลขที่ใบเสร็จ (โหลดจากชีต Bills ครั้งแรกที่ใช้)"""
+        if not self.bill_index.loaded:
+            self.load_bill_index()
+        return self.bill_index
+
+    def load_bill_index(self):
+        """โหลด index เลขที่ใบเสร็จใหม่จากชีต Bills (อ่านคอลัมน์ A ถึง I ครั้งเดียว)"""
+        with self.lock:
+            bills_sheet = self.worksheet('Bills')
+            self.bill_index.load(bills_sheet.get('A1:I', value_render_option=ValueRenderOption.unformatted))
+            self.data_version += 1
+        print(f"🔄 โหลด index ใบเสร็จจากชีต Bills ({len(self.bill_index.rows)} ใบ)")
+
+    def max_bill_sequence(self, date_prefix):
+        """หาลำดับใบเสร็จสูงสุดของวันจาก index เลขที่ใบเสร็จ"""
+        return self.get_bill_index().max_sequence(date_prefix)
+
+    def commit_bill(self, bill_number, bill_rows, sold_quantities, updated_at):
+        """ตัดสต็อกและเขียนใบเสร็จ
+
+        sold_quantities คือ dict ของชื่อสินค้า -> จำนวนที่ขาย ตรวจสอบสต็อกจากแคตตาล็อกก่อนเขียน
+        ตัดสต็อกทั้งหมดด้วย batch_update ครั้งเดียว และเขียนทุกบรรทัดของใบเสร็จด้วย append_rows
+        ครั้งเดียว หากเขียนใบเสร็จไม่สำเร็จจะคืนค่าสต็อกเดิมแล้วส่ง exception ต่อ
+
+        ถือ self.lock เฉพาะตอนตรวจสอบสต็อกและตอนอัปเดตข้อมูลในหน่วยความจำ คำขอไปยัง Google Sheets
+        ทำนอก lock เพื่อไม่ให้บิลของสินค้าอื่นต้องรอ ผู้เรียกต้องไม่เขียนสินค้าเดียวกันพร้อมกัน
+        (AsyncStockManager ถือ lock ของสินค้าในบิลไว้แล้ว)
+
+        ส่ง BillNotWritten เฉพาะเมื่อแน่ใจว่าไม่มีอะไรถูกเขียน (ตรวจสอบไม่ผ่าน, Google Sheets ปฏิเสธคำขอ
+        และคืนค่าสต็อกเดิมได้) กรณีอื่นเช่นหมดเวลารอคำตอบ ใบเสร็จอาจถูกเขียนไปแล้วจึงส่ง exception เดิมต่อ
+        """
+        with self.lock:
+            try:
+                catalog = self.get_catalog()
+            except Exception as e:
+                raise BillNotWritten(f"ไม่สามารถโหลดแคตตาล็อกสินค้าได้: {e}") from e
+
+            new_cells = {}
+            old_cells = {}
+            new_quantities = {}
+            for product_name, sold in sold_quantities.items():
+                i, product = catalog.find(product_name)
+                if product is None:
+                    raise BillNotWritten(f"ไม่พบสินค้า {product_name}")
+                available_quantity = int(product.get('จำนวน', 0))
+                if available_quantity < sold:
+                    raise BillNotWritten(f"สต็อก {product_name} ไม่เพียงพอ (มี {available_quantity} ต้องการ {sold})")
+                row_number = ProductCatalog.row_number(i)
+                old_cells[row_number] = {'C': product.get('จำนวน', 0), 'H': product.get('วันที่อัปเดตล่าสุด', '')}
+                new_cells[row_number] = {'C': available_quantity - sold, 'H': updated_at}
+                new_quantities[product_name] = available_quantity - sold
+
+        # ตัดสต็อกทุกสินค้าในคำขอเดียว (เก็บค่าเดิมไว้สำหรับคืนค่า)
+        stock_sheet = self.worksheet('Stock')
+        try:
+            self.write_stock_rows(stock_sheet, new_cells)
+        except Exception as e:
+            if request_rejected(e):
+                raise BillNotWritten(str(e)) from e
+            self.catalog.invalidate()
+            raise
+
+        # เขียนทุกบรรทัดของใบเสร็จในคำขอเดียว
+        try:
+            bills_sheet = self.worksheet('Bills')
+            response = bills_sheet.append_rows(bill_rows, value_input_option='RAW', table_range='A1')
+        except Exception as e:
+            try:
+                self.write_stock_rows(stock_sheet, old_cells)
+                print(f"⚠️ เขียนใบเสร็จ {bill_number} ไม่สำเร็จ คืนค่าสต็อกเดิมแล้ว")
+            except Exception as restore_error:
+                self.catalog.invalidate()
+                print(f"❌ ไม่สามารถคืนค่าสต็อกเดิมได้: {restore_error}")
+                raise e
+            if request_rejected(e):
+                raise BillNotWritten(str(e)) from e
+            # ใบเสร็จอาจถูกเขียนแล้วแม้ไม่ได้รับคำตอบ ให้ผู้เรียกตรวจสอบกับชีต Bills
+            self.bill_index.invalidate()
+            raise
+
+        with self.lock:
+            # บันทึกตำแหน่งแถวของใบเสร็จลง index (อ่านไม่ได้ก็โหลด index ใหม่ภายหลัง)
+            first_row, last_row = parse_updated_rows(response)
+            if first_row is not None:
+                self.bill_index.add(bill_number, first_row, last_row, bill_records(bill_rows))
+            else:
+                self.bill_index.invalidate()
+
+            # อัปเดตแคตตาล็อกในหน่วยความจำ (ค้นหาตามชื่อใหม่ เพราะแคตตาล็อกอาจถูกโหลดใหม่ระหว่างเขียน)
+            for product_name, quantity in new_quantities.items():
+                i, product = self.catalog.find(product_name)
+                if product is not None:
+                    self.catalog.update(i, {'จำนวน': quantity, 'วันที่อัปเดตล่าสุด': updated_at})
+            self.data_version += 1
+
+    def get_seller_bills(self, seller, offset=0, limit=5):
+        """สรุปใบเสร็จของผู้ขาย (ใหม่ไปเก่า) จาก index คืนค่า (รายการ, จำนวนใบทั้งหมด)"""
+        return self.get_bill_index().get_seller_bills(seller, offset, limit)
+
+    def read_bill_rows(self, bill_number):
+        """อ่านรายการในใบเสร็จจากช่วงแถวใน index ด้วยการอ่านชีตครั้งเดียว
+
+        คืน [] ถ้าไม่พบใบเสร็จ และ None ถ้าแถวในชีตไม่ตรงกับ index (ชีตถูกแก้ไขด้วยมือ)
+        """
+        rows = self.get_bill_index().get_rows(bill_number)
+        if rows is None:
+            return []
+
+        first_row, last_row = rows
+        bills_sheet = self.worksheet('Bills')
+        values = bills_sheet.get(f'A{first_row}:J{last_row}', value_render_option=ValueRenderOption.unformatted)
+        bill_items = bill_records(values)
+
+        if len(bill_items) != last_row - first_row + 1:
+            return None
+        if any(str(item['เลขที่ใบเสร็จ']) != bill_number for item in bill_items):
+            return None
+        return bill_items
+
+    def get_bill(self, bill_number):
+        """รายการในใบเสร็จ (จาก cache หรืออ่านเฉพาะแถวของใบเสร็จนั้น)"""
+        bill_items = self.bill_index.get_cached(bill_number)
+        if bill_items is not None:
+            return bill_items
+
+        bill_items = self.read_bill_rows(bill_number)
+        if bill_items is None:
+            # แถวในชีตเลื่อนไปจาก index: โหลด index ใหม่แล้วลองอีกครั้ง
+            self.load_bill_index()
+            bill_items = self.read_bill_rows(bill_number) or []
+
+        if bill_items:
+            self.bill_index.put_cached(bill_number, bill_items)
+        return bill_items
@@ -0,0 +1,86 @@
+import threading
+
+from utils import STOCK_HEADERS
+
+
+class SheetsReplicator:
+    """ส่งการเปลี่ยนแปลงจากฐานข้อมูลในเครื่องไปยัง Google Sheets เบื้องหลัง
+
+    อ่านตาราง outbox ทุก interval วินาที: แถวของ History และ Bills จะถูกเขียนต่อท้ายด้วย
+    append_rows ครั้งเดียวต่อชีต ส่วนการเปลี่ยนแปลงของสินค้าจะเขียนชีต Stock ใหม่ทั้งชีต
+    ครั้งเดียวไม่ว่าจะมีกี่รายการ ส่งไม่สำเร็จจะลองใหม่ในรอบถัดไป (ข้อมูลยังอยู่ใน outbox)
+    """
+
+    def __init__(self, store, sheets, interval=5.0, batch_size=500):
+        self.store = store  # SQLiteBackend
+        self.sheets = sheets  # SheetsBackend ที่เชื่อมต่อแล้ว
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stock_row_count = None  # จำนวนแถวสินค้าที่นำเข้าหรือเขียนลงชีตครั้งล่าสุด (None = ยังไม่ได้อ่านจากฐานข้อมูล)
+        self.sync_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='sheets-replicator', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sync()
+
+    def sync(self):
+        """ส่งการเปลี่ยนแปลงที่ค้างอยู่ทั้งหมด คืนจำนวนรายการที่ส่งสำเร็จ"""
+        with self.sync_lock:
+            synced = 0
+            while True:
+                changes = self.store.pending_changes(self.batch_size)
+                if not changes:
+                    return synced
+                sent = self.push(changes)
+                synced += sent
+                if sent < len(changes):
+                    return synced
+
+    def push(self, changes):
+        """ส่งการเปลี่ยนแปลงหนึ่งชุดแยกตามชีต คืนจำนวนรายการที่ส่งสำเร็จ"""
+        sent = 0
+        for sheet in ('Stock', 'History', 'Bills'):
+            ids = [change_id for change_id, title, row in changes if title == sheet]
+            if not ids:
+                continue
+            try:
+                if sheet == 'Stock':
+                    self.push_stock()
+                else:
+                    rows = [row for change_id, title, row in changes if title == sheet]
+                    self.sheets.worksheet(sheet).append_rows(rows, value_input_option='RAW', table_range='A1')
+                self.store.ack_changes(ids)
+                sent += len(ids)
+            except Exception as e:
+                print(f"❌ ส่งข้อมูลไปยังชีต {sheet} ไม่สำเร็จ จะลองใหม่ภายหลัง: {e}")
+        return sent
+
+    def push_stock(self):
+        """เขียนสินค้าทั้งหมดลงชีต Stock และล้างแถวที่เหลือจากข้อมูลเดิม
+
+        ล้างเฉพาะแถวที่นำเข้าหรือเขียนลงชีตเอง (จำนวนแถวบันทึกไว้ในฐานข้อมูล) ถ้าไม่รู้จำนวนแถวเดิมจะไม่ล้างแถวใด
+        """
+        rows = self.store.stock_rows()
+        if self.stock_row_count is None:
+            self.stock_row_count = self.store.sync_state('stock_rows')
+        stock_sheet = self.sheets.worksheet('Stock')
+        stock_sheet.update(range_name=f'A1:H{len(rows) + 1}', values=[STOCK_HEADERS] + rows)
+        if self.stock_row_count is not None and self.stock_row_count > len(rows):
+            stock_sheet.batch_clear([f'A{len(rows) + 2}:H{self.stock_row_count + 1}'])
+        self.stock_row_count = len(rows)
+        self.store.save_sync_state('stock_rows', len(rows))
+
+    def close(self):
+        """หยุด thread และส่งการเปลี่ยนแปลงที่เหลือ (ถ้าเชื่อมต่อชีตไม่ได้ ข้อมูลจะรออยู่ใน outbox)"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 1)
+            self.thread = None
+            self.sync()
@@ -0,0 +1,415 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils import BILLS_HEADERS, HISTORY_HEADERS, STOCK_HEADERS, bill_records, normalize_product_name
+
+from .base import BillNotWritten, StorageBackend
+from .sheets_replicator import SheetsReplicator
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    unit TEXT,
+    price NUMERIC,
+    description TEXT,
+    image_url TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_products_name_key ON products (name_key);
+
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT,
+    user TEXT,
+    action TEXT,
+    product_name TEXT,
+    quantity NUMERIC,
+    note TEXT
+);
+
+CREATE TABLE IF NOT EXISTS bills (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bill_number TEXT NOT NULL,
+    date TEXT,
+    seller TEXT,
+    product_name TEXT,
+    quantity NUMERIC,
+    unit TEXT,
+    unit_price NUMERIC,
+    line_total NUMERIC,
+    total NUMERIC,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_bills_bill_number ON bills (bill_number);
+CREATE INDEX IF NOT EXISTS idx_bills_seller ON bills (seller, id);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet TEXT NOT NULL,
+    payload TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+PRODUCT_COLUMNS = ['product_id', 'name', 'quantity', 'unit', 'price', 'description', 'image_url', 'updated_at']
+HISTORY_COLUMNS = ['date', 'user', 'action', 'product_name', 'quantity', 'note']
+BILL_COLUMNS = ['bill_number', 'date', 'seller', 'product_name', 'quantity', 'unit', 'unit_price', 'line_total', 'total', 'note']
+
+# ชื่อหัวตารางในชีต Stock -> คอลัมน์ในตาราง products
+PRODUCT_FIELDS = dict(zip(STOCK_HEADERS, PRODUCT_COLUMNS))
+
+
+class SQLiteBackend(StorageBackend):
+    """ที่เก็บข้อมูลหลักบน SQLite พร้อมส่งสำเนาไป Google Sheets เบื้องหลัง
+
+    ทุกการอ่านและเขียนทำในฐานข้อมูลในเครื่อง (ใช้ transaction และ index) การเปลี่ยนแปลงจะถูกบันทึก
+    ลงตาราง outbox ใน transaction เดียวกัน แล้ว SheetsReplicator จะส่งไปยังชีตตามรูปแบบเดิม
+    เพื่อให้พนักงานยังเปิดดูข้อมูลใน Google Sheets ได้
+
+    mirror คือ SheetsBackend ที่ใช้เชื่อมต่อชีต (ไม่บังคับ) ถ้าฐานข้อมูลยังว่างตอนเริ่มต้น
+    จะนำเข้าข้อมูลจากชีตก่อนหนึ่งครั้ง
+    """
+
+    def __init__(self, path, mirror=None, sync_interval=5.0):
+        self.path = path
+        self.mirror = mirror
+        self.conn = None
+        self.lock = threading.RLock()
+        self.replicator = SheetsReplicator(self, mirror, interval=sync_interval) if mirror is not None else None
+        self.mirror_connected = False
+        self.phase_times = {}  # ขั้นตอนของ connect() -> วินาที
+
+    def connect(self):
+        """เปิดฐานข้อมูล สร้างตาราง และเริ่มส่งข้อมูลไป Google Sheets คืน True ถ้าสำเร็จ
+
+        ถ้ามีชีตแต่ฐานข้อมูลยังว่าง ต้องนำเข้าข้อมูลจากชีตให้สำเร็จก่อนเริ่มส่งข้อมูล (ไม่สำเร็จจะคืน False
+        ให้ลองใหม่) เพื่อไม่ให้ฐานข้อมูลว่างถูกส่งไปเขียนทับชีต Stock
+        """
+        started = time.perf_counter()
+        if self.conn is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                self.conn.row_factory = sqlite3.Row
+                self.conn.execute('PRAGMA journal_mode=WAL')
+                self.conn.execute('PRAGMA synchronous=NORMAL')
+                self.conn.executescript(SCHEMA)
+                print(f"✅ เปิดฐานข้อมูล SQLite สำเร็จ: {self.path}")
+            except Exception as e:
+                print(f"❌ เกิดข้อผิดพลาดในการเปิดฐานข้อมูล SQLite: {e}")
+                self.conn = None
+                return False
+        self.phase_times['sqlite'] = time.perf_counter() - started
+
+        if self.mirror is None:
+            return True
+        if not self.mirror_connected:
+            self.mirror_connected = self.mirror.connect()
+        if self.is_empty():
+            if not self.mirror_connected:
+                print("❌ ฐานข้อมูล SQLite ยังว่างและเชื่อมต่อ Google Sheets ไม่ได้ ต้องนำเข้าข้อมูลจากชีตก่อนใช้งาน")
+                return False
+            started = time.perf_counter()
+            imported = self.import_from_sheets()
+            self.phase_times['import_from_sheets'] = time.perf_counter() - started
+            if not imported:
+                return False
+        if self.mirror_connected:
+            self.replicator.start()
+        return True
+
+    def connect_times(self):
+        times = self.mirror.connect_times() if self.mirror is not None else {}
+        times.update(self.phase_times)
+        return times
+
+    def close(self):
+        """ส่งการเปลี่ยนแปลงที่เหลือไปยังชีตและปิดฐานข้อมูล"""
+        if self.replicator is not None:
+            self.replicator.close()
+        if self.mirror is not None:
+            self.mirror.close()
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def transaction(self):
+        """เริ่ม transaction แบบ IMMEDIATE (ใช้กับ with)"""
+        return _Transaction(self)
+
+    def is_empty(self):
+        with self.lock:
+            for table in ('products', 'history', 'bills'):
+                if self.conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                    return False
+        return True
+
+    def import_from_sheets(self):
+        """นำเข้าข้อมูลทั้งหมดจาก Google Sheets ครั้งแรก (ไม่บันทึกลง outbox) คืน True ถ้าสำเร็จ"""
+        try:
+            products = self.mirror.get_products()
+            history = self.mirror.worksheet('History').get_all_values()[1:]
+            bills = self.mirror.worksheet('Bills').get_all_values()[1:]
+            with self.transaction() as conn:
+                for product in products:
+                    self.insert_product(conn, product)
+                conn.executemany(
+                    f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                    [_pad(row, len(HISTORY_COLUMNS)) for row in history if any(row)]
+                )
+                conn.executemany(
+                    f"INSERT INTO bills ({', '.join(BILL_COLUMNS)}) VALUES ({', '.join('?' * len(BILL_COLUMNS))})",
+                    [_pad(row, len(BILL_COLUMNS)) for row in bills if row and row[0]]
+                )
+                # แถวสินค้าในชีตตอนนี้มาจากการนำเข้า SheetsReplicator จึงล้างแถวเหล่านี้ได้เมื่อสินค้าถูกลบ
+                self.save_sync_state('stock_rows', len(products), conn)
+            print(f"✅ นำเข้าข้อมูลจาก Google Sheets: สินค้า {len(products)}, ประวัติ {len(history)}, ใบเสร็จ {len(bills)} แถว")
+            return True
+        except Exception as e:
+            print(f"❌ เกิดข้อผิดพลาดในการนำเข้าข้อมูลจาก Google Sheets: {e}")
+            return False
+
+    # ---------- สินค้า ----------
+
+    @staticmethod
+    def product_record(row):
+        return {header: row[column] for header, column in PRODUCT_FIELDS.items()}
+
+    @staticmethod
+    def insert_product(conn, product):
+        values = [product.get(header, '') for header in STOCK_HEADERS]
+        conn.execute(
+            f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}, name_key) VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))}, ?)",
+            values + [normalize_product_name(product.get('ชื่อสินค้า', ''))]
+        )
+
+    def get_products(self):
+        """รายการสินค้าทั้งหมดตามลำดับที่เพิ่ม"""
+        with self.lock:
+            rows = self.conn.execute('SELECT * FROM products ORDER BY id').fetchall()
+        return [self.product_record(row) for row in rows]
+
+    def find_row(self, conn, product_name):
+        return conn.execute(
+            'SELECT * FROM products WHERE name_key = ? ORDER BY id LIMIT 1',
+            (normalize_product_name(product_name),)
+        ).fetchone()
+
+    def find_product(self, product_name):
+        """ค้นหาสินค้าตามชื่อ (ใช้ index ของชื่อที่ normalize แล้ว)"""
+        with self.lock:
+            row = self.find_row(self.conn, product_name)
+        return self.product_record(row) if row is not None else None
+
+    def add_product(self, product):
+        """เพิ่มสินค้าใหม่ (กำหนด ID ต่อจาก ID สูงสุดที่มี) คืนข้อมูลสินค้าที่เพิ่ม"""
+        with self.transaction() as conn:
+            max_id = conn.execute('SELECT MAX(product_id) FROM products').fetchone()[0]
+            product = dict(product, ID=(max_id or 0) + 1)
+            self.insert_product(conn, product)
+            self.queue_stock(conn)
+        return dict(product)
+
+    def update_product(self, product_name, fields):
+        """แก้ไขข้อมูลสินค้า คืนข้อมูลหลังแก้ไข หรือ None ถ้าไม่พบ"""
+        with self.transaction() as conn:
+            row = self.find_row(conn, product_name)
+            if row is None:
+                return None
+            columns = {PRODUCT_FIELDS[field]: value for field, value in fields.items()}
+            if 'name' in columns:
+                columns['name_key'] = normalize_product_name(columns['name'])
+            conn.execute(
+                f"UPDATE products SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                list(columns.values()) + [row['id']]
+            )
+            self.queue_stock(conn)
+            row = conn.execute('SELECT * FROM products WHERE id = ?', (row['id'],)).fetchone()
+        return self.product_record(row)
+
+    def delete_product(self, product_name):
+        """ลบสินค้า คืนข้อมูลสินค้าที่ลบ หรือ None ถ้าไม่พบ"""
+        with self.transaction() as conn:
+            row = self.find_row(conn, product_name)
+            if row is None:
+                return None
+            conn.execute('DELETE FROM products WHERE id = ?', (row['id'],))
+            self.queue_stock(conn)
+        return self.product_record(row)
+
+    # ---------- ประวัติ ----------
+
+    def append_history(self, row):
+        with self.transaction() as conn:
+            conn.execute(
+                f"INSERT INTO history ({', '.join(HISTORY_COLUMNS)}) VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                list(row)
+            )
+            self.queue_rows(conn, 'History', [row])
+
+    def get_history(self, limit=10):
+        """ประวัติล่าสุด limit รายการ (เก่าไปใหม่)"""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(HISTORY_HEADERS, tuple(row))) for row in reversed(rows)]
+
+    # ---------- ใบเสร็จ ----------
+
+    def max_bill_sequence(self, date_prefix):
+        """ลำดับใบเสร็จสูงสุดของวันที่ระบุ (YYYYMMDD)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MAX(CAST(substr(bill_number, 10) AS INTEGER)) FROM bills "
+                "WHERE bill_number >= ? AND bill_number < ?",
+                (f'{date_prefix}-', f'{date_prefix}.')
+            ).fetchone()
+        return row[0] or 0
+
+    def commit_bill(self, bill_number, bill_rows, sold_quantities, updated_at):
+        """ตรวจสอบและตัดสต็อก แล้วบันทึกใบเสร็จใน transaction เดียว (ไม่สำเร็จจะไม่มีอะไรถูกเขียน)"""
+        try:
+            with self.transaction() as conn:
+                for product_name, sold in sold_quantities.items():
+                    row = self.find_row(conn, product_name)
+                    if row is None:
+                        raise BillNotWritten(f"ไม่พบสินค้า {product_name}")
+                    if int(row['quantity']) < sold:
+                        raise BillNotWritten(f"สต็อก {product_name} ไม่เพียงพอ (มี {row['quantity']} ต้องการ {sold})")
+                    conn.execute(
+                        'UPDATE products SET quantity = quantity - ?, updated_at = ? WHERE id = ?',
+                        (sold, updated_at, row['id'])
+                    )
+                conn.executemany(
+                    f"INSERT INTO bills ({', '.join(BILL_COLUMNS)}) VALUES ({', '.join('?' * len(BILL_COLUMNS))})",
+                    [list(row) for row in bill_rows]
+                )
+                self.queue_stock(conn)
+                self.queue_rows(conn, 'Bills', bill_rows)
+        except sqlite3.Error as e:
+            # transaction ถูก rollback แล้ว
+            raise BillNotWritten(str(e)) from e
+
+    def get_bill(self, bill_number):
+        """รายการในใบเสร็จ"""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(BILL_COLUMNS)} FROM bills WHERE bill_number = ? ORDER BY id", (bill_number,)
+            ).fetchall()
+        return bill_records([tuple(row) for row in rows])
+
+    def get_seller_bills(self, seller, offset=0, limit=5):
+        """สรุปใบเสร็จของผู้ขาย (ใหม่ไปเก่า) คืนค่า (รายการ, จำนวนใบทั้งหมด)"""
+        with self.lock:
+            total = self.conn.execute(
+                'SELECT COUNT(DISTINCT bill_number) FROM bills WHERE seller = ?', (str(seller),)
+            ).fetchone()[0]
+            bills = self.conn.execute(
+                'SELECT bill_number, MIN(date) AS date, SUM(line_total) AS total, MAX(id) AS last_id '
+                'FROM bills WHERE seller = ? GROUP BY bill_number ORDER BY last_id DESC LIMIT ? OFFSET ?',
+                (str(seller), limit, offset)
+            ).fetchall()
+            bill_numbers = [row['bill_number'] for row in bills]
+            items = self.conn.execute(
+                f"SELECT bill_number, product_name, quantity, unit FROM bills "
+                f"WHERE bill_number IN ({', '.join('?' * len(bill_numbers))}) ORDER BY id",
+                bill_numbers
+            ).fetchall() if bill_numbers else []
+
+        summaries = []
+        for row in bills:
+            summaries.append({
+                'เลขที่ใบเสร็จ': row['bill_number'],
+                'วันที่': row['date'],
+                'ผู้ขาย': str(seller),
+                'ยอดรวม': float(row['total'] or 0),
+                'รายการ': [
+                    (item['product_name'], item['quantity'], item['unit'])
+                    for item in items if item['bill_number'] == row['bill_number']
+                ]
+            })
+        return summaries, total
+
+    # ---------- outbox สำหรับส่งข้อมูลไป Google Sheets ----------
+
+    def queue_stock(self, conn):
+        """บันทึกว่าชีต Stock ต้องเขียนใหม่ทั้งชีต"""
+        if self.replicator is not None:
+            conn.execute("INSERT INTO outbox (sheet, payload) VALUES ('Stock', NULL)")
+
+    def queue_rows(self, conn, sheet, rows):
+        """บันทึกแถวที่ต้องเขียนต่อท้ายชีต"""
+        if self.replicator is not None:
+            conn.executemany(
+                'INSERT INTO outbox (sheet, payload) VALUES (?, ?)',
+                [(sheet, json.dumps(list(row), ensure_ascii=False)) for row in rows]
+            )
+
+    def pending_changes(self, limit=500):
+        """การเปลี่ยนแปลงที่ยังไม่ได้ส่งไปยังชีต เรียงตามลำดับ [(id, sheet, row หรือ None), ...]"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id, sheet, payload FROM outbox ORDER BY id LIMIT ?', (limit,)
+            ).fetchall()
+        return [(row['id'], row['sheet'], json.loads(row['payload']) if row['payload'] else None) for row in rows]
+
+    def ack_changes(self, change_ids):
+        """ลบการเปลี่ยนแปลงที่ส่งไปยังชีตแล้ว"""
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM outbox WHERE id = ?', [(change_id,) for change_id in change_ids])
+
+    def sync_state(self, key):
+        """ค่าสถานะการส่งข้อมูลไปยังชีตที่บันทึกไว้ (None ถ้าไม่มี)"""
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def save_sync_state(self, key, value, conn=None):
+        """บันทึกค่าสถานะการส่งข้อมูลไปยังชีต (ส่ง conn เพื่อบันทึกใน transaction ที่เปิดอยู่)"""
+        if conn is not None:
+            conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+            return
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def stock_rows(self):
+        """ข้อมูลสินค้าทั้งหมดในรูปแบบแถวของชีต Stock"""
+        return [[product[header] for header in STOCK_HEADERS] for product in self.get_products()]
+
+
+class _Transaction:
+    """context manager ของ transaction (ล็อก connection ระหว่างทำงาน)"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __enter__(self):
+        self.backend.lock.acquire()
+        self.backend.conn.execute('BEGIN IMMEDIATE')
+        return self.backend.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.backend.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.backend.lock.release()
+        return False
+
+
+def _pad(row, length):
+    return (list(row) + [''] * length)[:length]
@@ -1 +1,2 @@
+from .base import AppModal, AppView, add_bill_pending_field, send_storage_not_ready, storage_not_ready_embed
 from .product_card_view import ProductCardView
@@ -0,0 +1,54 @@
+import discord
+
+from storage import StorageNotReady
+
+
+def storage_not_ready_embed(error):
+    """ข้อความแจ้งผู้ใช้เมื่อที่เก็บข้อมูลยังเชื่อมต่อไม่เสร็จ (ใช้ทั้งคำสั่งและ view)"""
+    return discord.Embed(
+        title="⏳ ระบบกำลังเริ่มต้น",
+        description=str(error),
+        color=0xf39c12
+    )
+
+
+async def send_storage_not_ready(interaction, error):
+    """ตอบ interaction ด้วยข้อความระบบกำลังเริ่มต้น (ตอบแบบ followup ถ้าตอบไปแล้ว)"""
+    embed = storage_not_ready_embed(error)
+    if interaction.response.is_done():
+        await interaction.followup.send(embed=embed, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+class AppView(discord.ui.View):
+    """View พื้นฐานของ bot: callback ที่ส่ง StorageNotReady จะได้ข้อความเดียวกับคำสั่ง
+
+    callback ของ view ไม่ผ่าน on_command_error จึงต้องจัดการที่ on_error ของ view เอง
+    """
+
+    async def on_error(self, interaction, error, item):
+        if isinstance(error, StorageNotReady):
+            await send_storage_not_ready(interaction, error)
+            return
+        await super().on_error(interaction, error, item)
+
+
+class AppModal(discord.ui.Modal):
+    """Modal พื้นฐานของ bot: on_submit ที่ส่ง StorageNotReady จะได้ข้อความเดียวกับคำสั่ง"""
+
+    async def on_error(self, interaction, error):
+        if isinstance(error, StorageNotReady):
+            await send_storage_not_ready(interaction, error)
+            return
+        await super().on_error(interaction, error)
+
+
+def add_bill_pending_field(embed, stock_manager, bill_number):
+    """เพิ่มหมายเหตุในใบเสร็จถ้าใบเสร็จยังรอบันทึกลงที่เก็บข้อมูล (Google Sheets ไม่ตอบระหว่างขาย)"""
+    if stock_manager.is_bill_pending(bill_number):
+        embed.add_field(
+            name="⏳ กำลังบันทึกใบเสร็จ",
+            value="Google Sheets ไม่ตอบระหว่างขาย ระบบจะบันทึกใบเสร็จนี้ให้อัตโนมัติ ไม่ต้องทำรายการซ้ำ",
+            inline=False
+        )
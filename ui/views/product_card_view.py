@@ -4,9 +4,11 @@ from datetime import datetime
 import json
 import os
 import asyncio
+import uuid
 
-# ID ของช่องบันทึกใบเสร็จ
-BILL_HISTORY_CHANNEL_ID = 1393184006748635156
+from storage import StorageNotReady
+
+from .base import AppModal, AppView, add_bill_pending_field, send_storage_not_ready
 
 # ฟังก์ชันช่วยสำหรับการลบห้องหลังแสดงใบเสร็จการขาย
 async def remove_seller_permission(interaction, seller_user):
@@ -48,32 +50,30 @@ async def remove_seller_permission(interaction, seller_user):
     except Exception as e:
         print(f"❌ เกิดข้อผิดพลาดในการลบห้อง: {e}")
 
-class ProductCardView(discord.ui.View):
-    def __init__(self, product, stock_manager, timeout=300):
+class ProductCardView(AppView):
+    def __init__(self, product, app, timeout=300):
         super().__init__(timeout=timeout)
         self.product = product
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         
     @discord.ui.button(label="🛒 เพิ่มเข้ารถเข็น", style=discord.ButtonStyle.primary, emoji="🛒")
     async def add_to_cart(self, interaction: discord.Interaction, button: discord.ui.Button):
         """เพิ่มสินค้าเข้ารถเข็น"""
-        await interaction.response.send_modal(AddToCartModal(self.product, self.stock_manager))
+        await interaction.response.send_modal(AddToCartModal(self.product, self.app))
     
     @discord.ui.button(label="💳 ชำระเงิน", style=discord.ButtonStyle.success, emoji="💳")
     async def quick_buy(self, interaction: discord.Interaction, button: discord.ui.Button):
         """ซื้อสินค้าทันที"""
-        await interaction.response.send_modal(QuickBuyModal(self.product, self.stock_manager))
+        await interaction.response.send_modal(QuickBuyModal(self.product, self.app))
     
     @discord.ui.button(label="🛒 ดูรถเข็น", style=discord.ButtonStyle.secondary, emoji="🛒")
     async def view_cart(self, interaction: discord.Interaction, button: discord.ui.Button):
         """ดูรถเข็นสินค้า"""
         await interaction.response.defer()
         
-        # Import ที่นี่เพื่อหลีกเลี่ยง circular import
-        from bot import user_carts, Cart
-        
         user_id = str(interaction.user.id)
-        if user_id not in user_carts or not user_carts[user_id].get_items():
+        if not self.app.get_cart(user_id).get_items():
             embed = discord.Embed(
                 title="🛒 รถเข็นของคุณ",
                 description="รถเข็นว่างเปล่า",
@@ -87,7 +87,7 @@ class ProductCardView(discord.ui.View):
             await interaction.followup.send(embed=embed, ephemeral=True)
             return
         
-        cart = user_carts[user_id]
+        cart = self.app.get_cart(user_id)
         items = cart.get_items()
         total = cart.get_total()
         
@@ -115,7 +115,7 @@ class ProductCardView(discord.ui.View):
         )
         
         # สร้าง View สำหรับการจัดการรถเข็น
-        cart_view = CartManageView(user_id)
+        cart_view = CartManageView(user_id, self.app)
         
         await interaction.followup.send(embed=embed, view=cart_view, ephemeral=True)
     
@@ -124,11 +124,8 @@ class ProductCardView(discord.ui.View):
         """เคลียร์รถเข็นสินค้า"""
         await interaction.response.defer()
         
-        # Import ที่นี่เพื่อหลีกเลี่ยง circular import
-        from bot import user_carts, Cart
-        
         user_id = str(interaction.user.id)
-        if user_id not in user_carts or not user_carts[user_id].get_items():
+        if not self.app.get_cart(user_id).get_items():
             embed = discord.Embed(
                 title="🛒 รถเข็นของคุณ",
                 description="รถเข็นว่างเปล่าอยู่แล้ว",
@@ -144,14 +141,15 @@ class ProductCardView(discord.ui.View):
             color=0xf39c12
         )
         
-        view = ClearCartConfirmView(user_id)
+        view = ClearCartConfirmView(user_id, self.app)
         await interaction.followup.send(embed=embed, view=view, ephemeral=True)
 
-class AddToCartModal(discord.ui.Modal):
-    def __init__(self, product, stock_manager):
+class AddToCartModal(AppModal):
+    def __init__(self, product, app):
         super().__init__(title=f"เพิ่ม {product.get('ชื่อสินค้า', 'สินค้า')} เข้ารถเข็น")
         self.product = product
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         
         # ตั้งค่าจำนวนเริ่มต้น
         max_stock = int(product.get('จำนวน', 0))
@@ -179,13 +177,10 @@ class AddToCartModal(discord.ui.Modal):
                 await interaction.followup.send(embed=embed, ephemeral=True)
                 return
             
-            # Import ที่นี่เพื่อหลีกเลี่ยง circular import
-            from bot import add_item_to_cart_helper
-            
             user_id = str(interaction.user.id)
             product_name = self.product.get('ชื่อสินค้า', '')
             
-            result = await add_item_to_cart_helper(user_id, product_name, quantity)
+            result = await self.app.add_item_to_cart(user_id, product_name, quantity)
             
             if result['success']:
                 embed = discord.Embed(
@@ -230,6 +225,8 @@ class AddToCartModal(discord.ui.Modal):
                 color=0xe74c3c
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -238,11 +235,13 @@ class AddToCartModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
 
-class QuickBuyModal(discord.ui.Modal):
-    def __init__(self, product, stock_manager):
+class QuickBuyModal(AppModal):
+    def __init__(self, product, app):
         super().__init__(title=f"ซื้อ {product.get('ชื่อสินค้า', 'สินค้า')} ทันที")
         self.product = product
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
+        self.sale_key = f"quick-{uuid.uuid4().hex}"  # การส่งฟอร์มซ้ำได้ใบเสร็จเดิม
         
         # ตั้งค่าจำนวนเริ่มต้น
         max_stock = int(product.get('จำนวน', 0))
@@ -297,8 +296,9 @@ class QuickBuyModal(discord.ui.Modal):
                 'unit': self.product.get('หน่วย', 'ชิ้น')
             }]
             
-            # สร้างใบเสร็จ
-            bill_number, total_amount = self.stock_manager.create_bill(
+            # สร้างใบเสร็จ (ครั้งเดียวต่อฟอร์ม)
+            bill_number, total_amount, replayed = await self.stock_manager.create_bill_once(
+                self.sale_key,
                 interaction.user,
                 bill_items,
                 self.notes.value or "ซื้อทันที (Quick Buy)"
@@ -337,14 +337,19 @@ class QuickBuyModal(discord.ui.Modal):
                         inline=False
                     )
                 
+                add_bill_pending_field(embed, self.stock_manager, bill_number)
                 embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                 
                 await interaction.followup.send(embed=embed, ephemeral=True)
                 
-                # ส่งล็อกไปยังช่องบันทึกใบเสร็จ
+                # คำขอซ้ำ: ขั้นตอนหลังขายทำไปแล้วโดยคำขอแรก
+                if replayed:
+                    return
+                
+                # ส่งล็อกไปยังช่องบันทึกใบเสร็จ (เข้าคิวส่งเบื้องหลัง ไม่รอช่องล็อก)
                 try:
-                    # ส่งไปยังช่องบันทึกใบเสร็จ (ID: 1393184006748635156)
-                    bill_channel = interaction.client.get_channel(BILL_HISTORY_CHANNEL_ID)
+                    # ส่งไปยังช่องบันทึกใบเสร็จ
+                    bill_channel = interaction.client.get_channel(self.app.bill_history_channel_id)
                     if bill_channel:
                         log_embed = discord.Embed(
                             title="🛒 การซื้อทันที (Quick Buy)",
@@ -391,10 +396,9 @@ class QuickBuyModal(discord.ui.Modal):
                         
                         log_embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                         
-                        await bill_channel.send(embed=log_embed)
-                        print(f"✅ ส่งล็อกใบเสร็จ {bill_number} ไปยังช่องบันทึกแล้ว")
+                        self.app.bill_log.publish(bill_channel, log_embed)
                     else:
-                        print(f"❌ ไม่พบช่องบันทึกใบเสร็จ (ID: 1393184006748635156)")
+                        print(f"❌ ไม่พบช่องบันทึกใบเสร็จ (ID: {self.app.bill_history_channel_id})")
                     
                 except Exception as e:
                     print(f"❌ ไม่สามารถส่งล็อกไปยังช่องบันทึกใบเสร็จได้: {e}")
@@ -417,6 +421,8 @@ class QuickBuyModal(discord.ui.Modal):
                 color=0xe74c3c
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -425,21 +431,22 @@ class QuickBuyModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
 
-class CartManageView(discord.ui.View):
-    def __init__(self, user_id, timeout=300):
+class CartManageView(AppView):
+    def __init__(self, user_id, app, timeout=300):
         super().__init__(timeout=timeout)
         self.user_id = user_id
+        self.app = app
     
     @discord.ui.button(label="💳 ชำระเงิน", style=discord.ButtonStyle.success, emoji="💳")
     async def checkout(self, interaction: discord.Interaction, button: discord.ui.Button):
         """ชำระเงิน"""
         await interaction.response.defer()
         
-        # Import ที่นี่เพื่อหลีกเลี่ยง circular import
-        from bot import user_carts, stock_manager, BILL_HISTORY_CHANNEL_ID
+        stock_manager = self.app.stock_manager
+        bill_channel_id = self.app.bill_history_channel_id
         import datetime
         
-        if self.user_id not in user_carts or not user_carts[self.user_id].get_items():
+        if not self.app.get_cart(self.user_id).get_items():
             embed = discord.Embed(
                 title="❌ รถเข็นว่างเปล่า",
                 description="ไม่มีสินค้าในรถเข็นของคุณ",
@@ -448,36 +455,11 @@ class CartManageView(discord.ui.View):
             await interaction.followup.send(embed=embed, ephemeral=True)
             return
         
-        cart = user_carts[self.user_id]
+        cart = self.app.get_cart(self.user_id)
         items = cart.get_items()
         
         try:
-            # ตรวจสอบสต็อกก่อนขาย
-            stock_errors = []
-            for item in items:
-                product = stock_manager.check_stock(item['product_name'])
-                if product:
-                    available_quantity = int(product.get('จำนวน', 0))
-                    if available_quantity < item['quantity']:
-                        stock_errors.append(f"❌ {item['product_name']}: สต็อกไม่เพียงพอ (มี {available_quantity} ต้องการ {item['quantity']})")
-                else:
-                    stock_errors.append(f"❌ {item['product_name']}: ไม่พบสินค้าในระบบ")
-            
-            if stock_errors:
-                embed = discord.Embed(
-                    title="❌ พบข้อผิดพลาด",
-                    description="ไม่สามารถชำระเงินได้เนื่องจากมีปัญหากับสต็อก",
-                    color=0xe74c3c
-                )
-                embed.add_field(
-                    name="รายการปัญหา",
-                    value="\n".join(stock_errors),
-                    inline=False
-                )
-                await interaction.followup.send(embed=embed, ephemeral=True)
-                return
-            
-            # แปลงข้อมูลสำหรับสร้างใบเสร็จ
+            # แปลงข้อมูลสำหรับสร้างใบเสร็จ (สินค้าถูกกันไว้ตั้งแต่เพิ่มลงรถเข็น จึงไม่ต้องตรวจสต็อกทีละรายการก่อน)
             bill_items = []
             for item in items:
                 bill_items.append({
@@ -488,10 +470,12 @@ class CartManageView(discord.ui.View):
                 })
             
             # สร้างใบเสร็จ
-            bill_number, total_amount = stock_manager.create_bill(
+            bill_number, total_amount, replayed = await stock_manager.create_bill_once(
+                self.app.checkout_key(self.user_id),
                 interaction.user,
                 bill_items,
-                f"ชำระผ่านรถเข็น - {len(items)} รายการ"
+                f"ชำระผ่านรถเข็น - {len(items)} รายการ",
+                hold_owner=self.user_id
             )
             
             if bill_number:
@@ -526,17 +510,22 @@ class CartManageView(discord.ui.View):
                     inline=False
                 )
                 
+                add_bill_pending_field(embed, stock_manager, bill_number)
                 embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                 
                 await interaction.followup.send(embed=embed, ephemeral=True)
                 
-                # เคลียร์รถเข็น
-                cart.clear()
+                # คำขอซ้ำ: ขั้นตอนหลังขายทำไปแล้วโดยคำขอแรก
+                if replayed:
+                    return
+                
+                # เคลียร์รถเข็นและคืนสินค้าที่กันไว้ (รวมสินค้าที่เพิ่มระหว่างรอขาย)
+                await self.app.clear_cart(self.user_id)
                 
-                # ส่งล็อกไปยังช่องบันทึกใบเสร็จ
+                # ส่งล็อกไปยังช่องบันทึกใบเสร็จ (เข้าคิวส่งเบื้องหลัง ไม่รอช่องล็อก)
                 try:
                     # ส่งไปยังช่องบันทึกใบเสร็จ
-                    bill_channel = interaction.client.get_channel(BILL_HISTORY_CHANNEL_ID)
+                    bill_channel = interaction.client.get_channel(bill_channel_id)
                     if bill_channel:
                         log_embed = discord.Embed(
                             title="🛒 การขายผ่านรถเข็น (Shopping Cart)",
@@ -580,10 +569,9 @@ class CartManageView(discord.ui.View):
                         )
                         log_embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                         
-                        await bill_channel.send(embed=log_embed)
-                        print(f"✅ ส่งล็อกใบเสร็จ {bill_number} ไปยังช่องบันทึกแล้ว")
+                        self.app.bill_log.publish(bill_channel, log_embed)
                     else:
-                        print(f"❌ ไม่พบช่องบันทึกใบเสร็จ (ID: {BILL_HISTORY_CHANNEL_ID})")
+                        print(f"❌ ไม่พบช่องบันทึกใบเสร็จ (ID: {bill_channel_id})")
                     
                 except Exception as e:
                     print(f"❌ ไม่สามารถส่งล็อกไปยังช่องบันทึกใบเสร็จได้: {e}")
@@ -592,13 +580,29 @@ class CartManageView(discord.ui.View):
                 await remove_seller_permission(interaction, interaction.user)
                 
             else:
-                embed = discord.Embed(
-                    title="❌ เกิดข้อผิดพลาด",
-                    description="ไม่สามารถสร้างใบเสร็จได้",
-                    color=0xe74c3c
-                )
+                # ขายไม่สำเร็จ (เช่น การกันสินค้าหมดอายุแล้วมีคนซื้อไปก่อน) ตรวจทีละรายการเพื่อแจ้งปัญหา
+                stock_errors = await self.app.cart_stock_errors(self.user_id)
+                if stock_errors:
+                    embed = discord.Embed(
+                        title="❌ พบข้อผิดพลาด",
+                        description="ไม่สามารถชำระเงินได้เนื่องจากมีปัญหากับสต็อก",
+                        color=0xe74c3c
+                    )
+                    embed.add_field(
+                        name="รายการปัญหา",
+                        value="\n".join(stock_errors),
+                        inline=False
+                    )
+                else:
+                    embed = discord.Embed(
+                        title="❌ เกิดข้อผิดพลาด",
+                        description="ไม่สามารถสร้างใบเสร็จได้",
+                        color=0xe74c3c
+                    )
                 await interaction.followup.send(embed=embed, ephemeral=True)
                 
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -607,21 +611,19 @@ class CartManageView(discord.ui.View):
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
 
-class ClearCartConfirmView(discord.ui.View):
-    def __init__(self, user_id, timeout=60):
+class ClearCartConfirmView(AppView):
+    def __init__(self, user_id, app, timeout=60):
         super().__init__(timeout=timeout)
         self.user_id = user_id
+        self.app = app
     
     @discord.ui.button(label="✅ ยืนยันเคลียร์", style=discord.ButtonStyle.danger, emoji="✅")
     async def confirm_clear(self, interaction: discord.Interaction, button: discord.ui.Button):
         """ยืนยันเคลียร์รถเข็น"""
         await interaction.response.defer()
         
-        # Import ที่นี่เพื่อหลีกเลี่ยง circular import
-        from bot import user_carts
-        
-        if self.user_id in user_carts:
-            user_carts[self.user_id].clear()
+        if self.app.get_cart(self.user_id).get_items():
+            await self.app.clear_cart(self.user_id)
             embed = discord.Embed(
                 title="✅ เคลียร์รถเข็นสำเร็จ",
                 description="รถเข็นของคุณถูกเคลียร์แล้ว",
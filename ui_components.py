@@ -5,23 +5,27 @@ from datetime import datetime
 import json
 import os
 import asyncio
+import uuid
+from storage import StorageNotReady
+from ui.views.base import AppModal, AppView, add_bill_pending_field, send_storage_not_ready
 from ui.views.product_card_view import ProductCardView
 
-class ProductInspectionView(discord.ui.View):
+class ProductInspectionView(AppView):
     """View สำหรับแสดงข้อมูลสินค้าพร้อมปุ่มแก้ไข"""
-    def __init__(self, stock_manager, product_data):
+    def __init__(self, app, product_data):
         super().__init__(timeout=300)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.product_data = product_data
         
     @discord.ui.button(label='แก้ไขข้อมูลสินค้า', style=discord.ButtonStyle.primary, emoji='✏️')
     async def edit_product(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = EditProductModal(self.stock_manager, self.product_data)
+        modal = EditProductModal(self.app, self.product_data)
         await interaction.response.send_modal(modal)
     
     @discord.ui.button(label='เพิ่มรูปภาพ', style=discord.ButtonStyle.secondary, emoji='📸')
     async def add_image(self, interaction: discord.Interaction, button: discord.ui.Button):
-        image_view = ImageUploadView(self.stock_manager, self.product_data.get('ชื่อสินค้า', ''))
+        image_view = ImageUploadView(self.app, self.product_data.get('ชื่อสินค้า', ''))
         
         embed = discord.Embed(
             title="📸 เพิ่มรูปภาพสินค้า",
@@ -43,7 +47,7 @@ class ProductInspectionView(discord.ui.View):
     
     @discord.ui.button(label='ลบสินค้า', style=discord.ButtonStyle.danger, emoji='🗑️')
     async def delete_product(self, interaction: discord.Interaction, button: discord.ui.Button):
-        confirm_view = DeleteConfirmationView(self.stock_manager, self.product_data.get('ชื่อสินค้า', ''))
+        confirm_view = DeleteConfirmationView(self.app, self.product_data.get('ชื่อสินค้า', ''))
         
         embed = discord.Embed(
             title="⚠️ ยืนยันการลบสินค้า",
@@ -62,15 +66,16 @@ class ProductInspectionView(discord.ui.View):
     async def back_to_stock(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_message(
             "กลับไปที่เมนูหลัก:",
-            view=AdvancedStockView(self.stock_manager),
+            view=AdvancedStockView(self.app),
             ephemeral=True
         )
 
-class EditProductModal(discord.ui.Modal):
+class EditProductModal(AppModal):
     """Modal สำหรับแก้ไขข้อมูลสินค้า"""
-    def __init__(self, stock_manager, product_data):
+    def __init__(self, app, product_data):
         super().__init__(title=f"✏️ แก้ไขข้อมูลสินค้า")
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.product_data = product_data
         self.original_name = product_data.get('ชื่อสินค้า', '')
         
@@ -136,7 +141,7 @@ class EditProductModal(discord.ui.Modal):
             new_description = self.description.value.strip()
             
             # อัปเดตข้อมูลในชีต
-            success = self.stock_manager.update_product(
+            success = await self.stock_manager.update_product(
                 self.original_name,
                 new_product_name,
                 new_quantity,
@@ -160,7 +165,7 @@ class EditProductModal(discord.ui.Modal):
                     embed.add_field(name="คำอธิบาย", value=new_description, inline=False)
                 
                 # ดึงข้อมูลที่อัปเดตแล้ว
-                updated_product = self.stock_manager.check_stock(new_product_name)
+                updated_product = await self.stock_manager.check_stock(new_product_name)
                 if updated_product and updated_product.get('รูปภาพURL'):
                     embed.set_image(url=updated_product.get('รูปภาพURL'))
                 
@@ -181,6 +186,8 @@ class EditProductModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed)
         
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -189,11 +196,12 @@ class EditProductModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed)
 
-class DeleteConfirmationView(discord.ui.View):
+class DeleteConfirmationView(AppView):
     """View สำหรับยืนยันการลบสินค้า"""
-    def __init__(self, stock_manager, product_name):
+    def __init__(self, app, product_name):
         super().__init__(timeout=60)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.product_name = product_name
     
     @discord.ui.button(label='ยืนยันลบ', style=discord.ButtonStyle.danger, emoji='🗑️')
@@ -201,7 +209,7 @@ class DeleteConfirmationView(discord.ui.View):
         await interaction.response.defer()
         
         try:
-            success = self.stock_manager.delete_product(self.product_name, interaction.user)
+            success = await self.stock_manager.delete_product(self.product_name, interaction.user)
             
             if success:
                 embed = discord.Embed(
@@ -210,7 +218,7 @@ class DeleteConfirmationView(discord.ui.View):
                     color=0x2ecc71
                 )
                 embed.set_footer(text=f"ดำเนินการโดย {interaction.user}")
-                await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+                await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
             else:
                 embed = discord.Embed(
                     title="❌ ลบสินค้าไม่สำเร็จ",
@@ -219,6 +227,8 @@ class DeleteConfirmationView(discord.ui.View):
                 )
                 await interaction.followup.send(embed=embed)
         
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -277,11 +287,12 @@ async def remove_seller_permission(interaction, seller_user):
     except Exception as e:
         print(f"❌ เกิดข้อผิดพลาดในการลบห้อง: {e}")
 
-class StockModal(discord.ui.Modal):
-    def __init__(self, action_type, stock_manager):
+class StockModal(AppModal):
+    def __init__(self, action_type, app):
         super().__init__(title=f"📦 {action_type}สินค้า")
         self.action_type = action_type
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         
         # Product name input
         self.product_name = discord.ui.TextInput(
@@ -320,7 +331,7 @@ class StockModal(discord.ui.Modal):
             
             if self.action_type == "เพิ่ม":
                 unit = self.unit.value.strip()
-                success = self.stock_manager.add_stock(product_name, quantity, unit, interaction.user, 0, "", "")
+                success = await self.stock_manager.add_stock(product_name, quantity, unit, interaction.user, 0, "", "")
                 
                 if success:
                     embed = discord.Embed(
@@ -329,12 +340,12 @@ class StockModal(discord.ui.Modal):
                         color=0x2ecc71
                     )
                     embed.set_footer(text=f"ดำเนินการโดย {interaction.user}")
-                    await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+                    await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
                 else:
                     raise Exception("ไม่สามารถเพิ่มสินค้าได้")
             
             elif self.action_type == "ลด":
-                success, remaining = self.stock_manager.remove_stock(product_name, quantity, interaction.user)
+                success, remaining = await self.stock_manager.remove_stock(product_name, quantity, interaction.user)
                 
                 if success:
                     embed = discord.Embed(
@@ -351,7 +362,7 @@ class StockModal(discord.ui.Modal):
                         )
                     
                     embed.set_footer(text=f"ดำเนินการโดย {interaction.user}")
-                    await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+                    await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
                 else:
                     raise Exception("ไม่พบสินค้าหรือไม่สามารถลดสินค้าได้")
         
@@ -363,6 +374,8 @@ class StockModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed)
         
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -371,14 +384,14 @@ class StockModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed)
 
-class ProductSelectView(discord.ui.View):
-    def __init__(self, stock_manager, action_type):
+class ProductSelectView(AppView):
+    def __init__(self, app, action_type, products):
         super().__init__(timeout=300)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.action_type = action_type
         
-        # Get product list for dropdown
-        products = stock_manager.get_all_stock()
+        # products คือรายการสินค้าสำหรับ dropdown (ผู้เรียกดึงจาก await stock_manager.get_all_stock())
         
         if products:
             options = []
@@ -408,7 +421,7 @@ class ProductSelectView(discord.ui.View):
         selected_product = self.product_select.values[0]
         
         if self.action_type == "ตรวจสอบ":
-            product = self.stock_manager.check_stock(selected_product)
+            product = await self.stock_manager.check_stock(selected_product)
             
             if product:
                 quantity = int(product.get('จำนวน', 0))
@@ -469,7 +482,7 @@ class ProductSelectView(discord.ui.View):
                 )
                 
                 # ใช้ ProductInspectionView แทน
-                await interaction.response.send_message(embed=embed, view=ProductInspectionView(self.stock_manager, product))
+                await interaction.response.send_message(embed=embed, view=ProductInspectionView(self.app, product))
             else:
                 embed = discord.Embed(
                     title="❌ ไม่พบสินค้า",
@@ -480,7 +493,7 @@ class ProductSelectView(discord.ui.View):
         
         elif self.action_type == "เพิ่มรูปภาพ":
             # สร้าง view สำหรับเพิ่มรูปภาพ
-            image_view = ImageUploadView(self.stock_manager, selected_product)
+            image_view = ImageUploadView(self.app, selected_product)
             
             embed = discord.Embed(
                 title="📸 เพิ่มรูปภาพสินค้า",
@@ -503,38 +516,40 @@ class ProductSelectView(discord.ui.View):
         
         else:
             # For add/remove actions, show quantity input modal
-            modal = StockModal(self.action_type, self.stock_manager)
+            modal = StockModal(self.action_type, self.app)
             modal.product_name.default = selected_product
             await interaction.response.send_modal(modal)
 
-class AdvancedStockView(discord.ui.View):
-    def __init__(self, stock_manager):
+class AdvancedStockView(AppView):
+    def __init__(self, app):
         super().__init__(timeout=300)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
     
     # @discord.ui.button(label='เพิ่มสินค้า', style=discord.ButtonStyle.success, emoji='➕')
     # async def add_stock_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-    #     modal = StockModal("เพิ่ม", self.stock_manager)
+    #     modal = StockModal("เพิ่ม", self.app)
     #     await interaction.response.send_modal(modal)
     
     @discord.ui.button(label='สร้างสินค้าใหม่', style=discord.ButtonStyle.primary, emoji='🆕')
     async def create_new_product_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = NewProductModal(self.stock_manager)
+        modal = NewProductModal(self.app)
         await interaction.response.send_modal(modal)
     
     # @discord.ui.button(label='ลดสินค้า', style=discord.ButtonStyle.danger, emoji='➖')
     # async def remove_stock_button(self, interaction: discord.Interaction, button: discord.ui.Button):
     #     await interaction.response.send_message(
     #         "เลือกสินค้าที่ต้องการลด:",
-    #         view=ProductSelectView(self.stock_manager, "ลด"),
+    #         view=ProductSelectView(self.app, "ลด", await self.stock_manager.get_all_stock()),
     #         ephemeral=True
     #     )
     
     @discord.ui.button(label='ตรวจสอบสินค้า', style=discord.ButtonStyle.secondary, emoji='🔍')
     async def check_stock_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        products = await self.stock_manager.get_all_stock()
         await interaction.response.send_message(
             "เลือกสินค้าที่ต้องการตรวจสอบ:",
-            view=ProductSelectView(self.stock_manager, "ตรวจสอบ"),
+            view=ProductSelectView(self.app, "ตรวจสอบ", products),
             ephemeral=True
         )
     
@@ -556,7 +571,7 @@ class AdvancedStockView(discord.ui.View):
         await interaction.followup.send(embed=embed)
         
         # เรียกใช้ฟังก์ชัน products
-        products = self.stock_manager.get_all_stock()
+        products = await self.stock_manager.get_all_stock()
         
         if not products:
             no_products_embed = discord.Embed(
@@ -637,16 +652,17 @@ class AdvancedStockView(discord.ui.View):
                 embed.color = 0x95a5a6
             
             # ส่งเป็น card พร้อมปุ่ม
-            await interaction.followup.send(embed=embed, view=ProductCardView(product, self.stock_manager))
+            await interaction.followup.send(embed=embed, view=ProductCardView(product, self.app))
             
             # รอเล็กน้อยเพื่อไม่ให้ spam
             await asyncio.sleep(0.5)
     
     @discord.ui.button(label='เพิ่มรูปภาพ', style=discord.ButtonStyle.secondary, emoji='📸')
     async def add_image_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        products = await self.stock_manager.get_all_stock()
         await interaction.response.send_message(
             "เลือกสินค้าที่ต้องการเพิ่มรูปภาพ:",
-            view=ProductSelectView(self.stock_manager, "เพิ่มรูปภาพ"),
+            view=ProductSelectView(self.app, "เพิ่มรูปภาพ", products),
             ephemeral=True
         )
     
@@ -654,7 +670,7 @@ class AdvancedStockView(discord.ui.View):
     async def history_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
-        history = self.stock_manager.get_history(10)
+        history = await self.stock_manager.get_history(10)
         
         if not history:
             embed = discord.Embed(
@@ -675,13 +691,13 @@ class AdvancedStockView(discord.ui.View):
                     inline=False
                 )
         
-        await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+        await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
     
     @discord.ui.button(label='สินค้าใกล้หมด', style=discord.ButtonStyle.danger, emoji='⚠️')
     async def low_stock_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
-        low_stock_items = self.stock_manager.check_low_stock()
+        low_stock_items = await self.stock_manager.check_low_stock()
         
         if not low_stock_items:
             embed = discord.Embed(
@@ -703,15 +719,16 @@ class AdvancedStockView(discord.ui.View):
                     inline=True
                 )
         
-        await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+        await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
 
-class ConfirmationView(discord.ui.View):
-    def __init__(self, action, product_name, quantity, stock_manager, user):
+class ConfirmationView(AppView):
+    def __init__(self, action, product_name, quantity, app, user):
         super().__init__(timeout=30)
         self.action = action
         self.product_name = product_name
         self.quantity = quantity
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.user = user
         self.result = None
     
@@ -735,10 +752,11 @@ class ConfirmationView(discord.ui.View):
         self.stop()
         await interaction.response.send_message("❌ ยกเลิกการทำรายการแล้ว", ephemeral=True)
 
-class NewProductModal(discord.ui.Modal):
-    def __init__(self, stock_manager):
+class NewProductModal(AppModal):
+    def __init__(self, app):
         super().__init__(title="🆕 สร้างสินค้าใหม่")
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         
         # Product name input
         self.product_name = discord.ui.TextInput(
@@ -809,8 +827,7 @@ class NewProductModal(discord.ui.Modal):
                 embed.add_field(name="คำอธิบาย", value=description, inline=False)
             
             # เก็บข้อมูลสินค้าไว้ใน pending_image_uploads
-            import bot
-            bot.pending_image_uploads[str(interaction.user.id)] = {
+            self.app.pending_image_uploads[str(interaction.user.id)] = {
                 'product_name': product_name,
                 'quantity': quantity,
                 'unit': unit,
@@ -819,7 +836,7 @@ class NewProductModal(discord.ui.Modal):
             }
             
             # สร้าง view สำหรับรอการอัปโหลดรูป
-            view = ImageUploadView(self.stock_manager, product_name, quantity, unit, price, description)
+            view = ImageUploadView(self.app, product_name, quantity, unit, price, description)
             
             await interaction.followup.send(embed=embed, view=view)
             
@@ -831,6 +848,8 @@ class NewProductModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed)
         
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -839,10 +858,11 @@ class NewProductModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed)
 
-class ImageUploadView(discord.ui.View):
-    def __init__(self, stock_manager, product_name, quantity=None, unit=None, price=None, description=None):
+class ImageUploadView(AppView):
+    def __init__(self, app, product_name, quantity=None, unit=None, price=None, description=None):
         super().__init__(timeout=300)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.product_name = product_name
         self.quantity = quantity
         self.unit = unit
@@ -865,11 +885,9 @@ class ImageUploadView(discord.ui.View):
             if image_url:
                 if self.is_new_product:
                     # สร้างสินค้าใหม่พร้อมรูปภาพ
-                    import bot
-                    if str(interaction.user.id) in bot.pending_image_uploads:
-                        del bot.pending_image_uploads[str(interaction.user.id)]
+                    self.app.pending_image_uploads.pop(str(interaction.user.id), None)
                     
-                    success = self.stock_manager.add_stock(
+                    success = await self.stock_manager.add_stock(
                         self.product_name, 
                         self.quantity, 
                         self.unit, 
@@ -887,7 +905,7 @@ class ImageUploadView(discord.ui.View):
                         )
                         embed.set_footer(text=f"ดำเนินการโดย {interaction.user}")
                         embed.set_image(url=image_url)
-                        await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+                        await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
                     else:
                         embed = discord.Embed(
                             title="❌ เกิดข้อผิดพลาด",
@@ -896,38 +914,27 @@ class ImageUploadView(discord.ui.View):
                         )
                         await interaction.followup.send(embed=embed)
                 else:
-                    # อัปเดตรูปภาพสินค้าเดิม
-                    products = self.stock_manager.get_all_stock()
-                    for product in products:
-                        if product['ชื่อสินค้า'].lower() == self.product_name.lower():
-                            # อัปเดต URL รูปภาพในชีต
-                            stock_sheet = self.stock_manager.spreadsheet.worksheet('Stock')
-                            existing_products = stock_sheet.get_all_records()
-                            
-                            for i, p in enumerate(existing_products):
-                                if p['ชื่อสินค้า'].lower() == self.product_name.lower():
-                                    stock_sheet.update(f'G{i+2}', image_url)
-                                    break
-                            
-                            embed = discord.Embed(
-                                title="✅ เพิ่มรูปภาพสำเร็จ",
-                                description=f"เพิ่มรูปภาพสำหรับสินค้า **{self.product_name}** เรียบร้อยแล้ว",
-                                color=0x2ecc71
-                            )
-                            embed.add_field(
-                                name="ℹ️ ระบบจัดเก็บ",
-                                value="ใช้ Discord CDN สำหรับความเร็วและเสถียรภาพ",
-                                inline=False
-                            )
-                            embed.add_field(
-                                name="📸 รูปภาพที่เพิ่ม",
-                                value=f"ใช้รูปภาพล่าสุดจาก {latest_image.filename}",
-                                inline=False
-                            )
-                            embed.set_image(url=image_url)
-                            await interaction.followup.send(embed=embed)
-                            return
-                            
+                    # อัปเดตรูปภาพสินค้าเดิม (ค้นหาผ่าน index ชื่อสินค้า)
+                    if await self.stock_manager.update_product_image(self.product_name, image_url):
+                        embed = discord.Embed(
+                            title="✅ เพิ่มรูปภาพสำเร็จ",
+                            description=f"เพิ่มรูปภาพสำหรับสินค้า **{self.product_name}** เรียบร้อยแล้ว",
+                            color=0x2ecc71
+                        )
+                        embed.add_field(
+                            name="ℹ️ ระบบจัดเก็บ",
+                            value="ใช้ Discord CDN สำหรับความเร็วและเสถียรภาพ",
+                            inline=False
+                        )
+                        embed.add_field(
+                            name="📸 รูปภาพที่เพิ่ม",
+                            value=f"ใช้รูปภาพล่าสุดจาก {latest_image.filename}",
+                            inline=False
+                        )
+                        embed.set_image(url=image_url)
+                        await interaction.followup.send(embed=embed)
+                        return
+                    
                     embed = discord.Embed(
                         title="❌ ไม่พบสินค้า",
                         description=f"ไม่พบสินค้า **{self.product_name}** ในระบบ",
@@ -1002,11 +1009,9 @@ class ImageUploadView(discord.ui.View):
         await interaction.response.defer()
         
         # ลบข้อมูลออกจาก pending_image_uploads
-        import bot
-        if str(interaction.user.id) in bot.pending_image_uploads:
-            del bot.pending_image_uploads[str(interaction.user.id)]
+        self.app.pending_image_uploads.pop(str(interaction.user.id), None)
         
-        success = self.stock_manager.add_stock(
+        success = await self.stock_manager.add_stock(
             self.product_name, 
             self.quantity, 
             self.unit, 
@@ -1023,7 +1028,7 @@ class ImageUploadView(discord.ui.View):
                 color=0x2ecc71
             )
             embed.set_footer(text=f"ดำเนินการโดย {interaction.user}")
-            await interaction.followup.send(embed=embed, view=AdvancedStockView(self.stock_manager))
+            await interaction.followup.send(embed=embed, view=AdvancedStockView(self.app))
         else:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -1036,9 +1041,7 @@ class ImageUploadView(discord.ui.View):
     async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
         if self.is_new_product:
             # ลบข้อมูลออกจาก pending_image_uploads
-            import bot
-            if str(interaction.user.id) in bot.pending_image_uploads:
-                del bot.pending_image_uploads[str(interaction.user.id)]
+            self.app.pending_image_uploads.pop(str(interaction.user.id), None)
             
             embed = discord.Embed(
                 title="❌ ยกเลิกการสร้างสินค้า",
@@ -1068,235 +1071,11 @@ class ImageUploadView(discord.ui.View):
             print(f"❌ เกิดข้อผิดพลาดในการค้นหารูปภาพ: {e}")
             return None
 
-class ProductCardView(discord.ui.View):
-    def __init__(self, stock_manager, product_name):
-        super().__init__(timeout=300)
-        self.stock_manager = stock_manager
-        self.product_name = product_name
-    
-    @discord.ui.button(label='Buy Now', style=discord.ButtonStyle.success, emoji='💰')
-    async def buy_now(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        
-        embed = discord.Embed(
-            title="🛒 การซื้อสินค้า",
-            description=f"คุณต้องการซื้อ **{self.product_name}** หรือไม่?",
-            color=0x2ecc71
-        )
-        embed.add_field(
-            name="💡 วิธีซื้อ",
-            value=f"ใช้คำสั่ง `!buy {self.product_name}` เพื่อซื้อสินค้า",
-            inline=False
-        )
-        await interaction.followup.send(embed=embed, ephemeral=True)
-    
-    @discord.ui.button(label='Add to cart', style=discord.ButtonStyle.primary, emoji='🛒')
-    async def add_to_cart(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Defer the interaction immediately to prevent timeout
-        await interaction.response.defer(ephemeral=True)
-        
-        try:
-            # ดึงข้อมูลสินค้าจากสต็อก
-            product = self.stock_manager.check_stock(self.product_name)
-            
-            if product:
-                # Import user_carts from bot.py
-                from bot import user_carts, Cart
-                
-                user_id = str(interaction.user.id)
-                if user_id not in user_carts:
-                    user_carts[user_id] = Cart()
-                
-                # เพิ่มสินค้าลงรถเข็น (จำนวน 1 ชิ้น)
-                price = float(product.get('ราคา', 0))
-                unit = product.get('หน่วย', 'ชิ้น')
-                quantity = 1
-                
-                # ตรวจสอบสต็อกเพียงพอหรือไม่
-                available_quantity = int(product.get('จำนวน', 0))
-                if available_quantity < quantity:
-                    embed = discord.Embed(
-                        title="❌ สต็อกไม่เพียงพอ",
-                        description=f"สินค้า **{self.product_name}** เหลือเพียง {available_quantity} {unit}",
-                        color=0xe74c3c
-                    )
-                    await interaction.followup.send(embed=embed, ephemeral=True)
-                    return
-                
-                user_carts[user_id].add_item(self.product_name, quantity, price, unit)
-                
-                # แสดงรายการสินค้าในรถเข็นทั้งหมด
-                cart = user_carts[user_id]
-                cart_items = cart.get_items()
-                total_price = cart.get_total()
-                
-                embed = discord.Embed(
-                    title="✅ เพิ่มลงรถเข็นสำเร็จ",
-                    description=f"เพิ่ม **{self.product_name}** x{quantity} ลงรถเข็นแล้ว!",
-                    color=0x2ecc71
-                )
-                
-                # แสดงรายการสินค้าในรถเข็นทั้งหมด
-                cart_list = ""
-                for i, item in enumerate(cart_items, 1):
-                    item_total = item['price'] * item['quantity']
-                    cart_list += f"{i}. **{item['product_name']}** x{item['quantity']} {item['unit']} = {item_total:,.0f} บาท\n"
-                
-                embed.add_field(
-                    name="� รถเข็นของคุณ",
-                    value=cart_list if cart_list else "ไม่มีสินค้า",
-                    inline=False
-                )
-                
-                embed.add_field(
-                    name="💰 ยอดรวมทั้งหมด",
-                    value=f"{total_price:,.0f} บาท",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="� จำนวนรายการ",
-                    value=f"{len(cart_items)} รายการ",
-                    inline=True
-                )
-                
-                embed.add_field(
-                    name="💡 คำแนะนำ",
-                    value="ใช้คำสั่ง `!checkout` เพื่อชำระเงิน\nใช้คำสั่ง `!cart` เพื่อดูรถเข็น\nใช้คำสั่ง `!clear_cart` เพื่อเคลียร์รถเข็น",
-                    inline=False
-                )
-                
-                await interaction.followup.send(embed=embed, ephemeral=True)
-            else:
-                embed = discord.Embed(
-                    title="❌ ไม่พบสินค้า",
-                    description=f"ไม่พบสินค้า **{self.product_name}** ในระบบ",
-                    color=0xe74c3c
-                )
-                await interaction.followup.send(embed=embed, ephemeral=True)
-                
-        except Exception as e:
-            embed = discord.Embed(
-                title="❌ เกิดข้อผิดพลาด",
-                description=f"ไม่สามารถเพิ่มสินค้าลงรถเข็นได้: {str(e)}",
-                color=0xe74c3c
-            )
-            await interaction.followup.send(embed=embed, ephemeral=True)
-    
-    # @discord.ui.button(label='เพิ่มรูปภาพ', style=discord.ButtonStyle.secondary, emoji='📸')
-    # async def add_image(self, interaction: discord.Interaction, button: discord.ui.Button):
-    #     await interaction.response.defer()
-        
-    #     # ค้นหารูปภาพล่าสุดใน channel
-    #     latest_image = await self.find_latest_image_in_channel(interaction.channel)
-        
-    #     if latest_image:
-    #         # อัปโหลดรูปภาพด้วย Discord CDN
-    #         filename = f"{self.product_name}_{latest_image.filename}"
-    #         image_url = await self.stock_manager.upload_image_to_drive(latest_image.url, filename)
-            
-    #         if image_url:
-    #             # อัปเดตข้อมูลสินค้าด้วย URL รูปภาพ
-    #             products = self.stock_manager.get_all_stock()
-    #             for product in products:
-    #                 if product['ชื่อสินค้า'].lower() == self.product_name.lower():
-    #                     # อัปเดต URL รูปภาพในชีต
-    #                     stock_sheet = self.stock_manager.spreadsheet.worksheet('Stock')
-    #                     existing_products = stock_sheet.get_all_records()
-                        
-    #                     for i, p in enumerate(existing_products):
-    #                         if p['ชื่อสินค้า'].lower() == self.product_name.lower():
-    #                             stock_sheet.update(f'G{i+2}', image_url)
-    #                             break
-                        
-    #                     embed = discord.Embed(
-    #                         title="✅ เพิ่มรูปภาพสำเร็จ",
-    #                         description=f"เพิ่มรูปภาพสำหรับสินค้า **{self.product_name}** เรียบร้อยแล้ว",
-    #                         color=0x2ecc71
-    #                     )
-    #                     embed.add_field(
-    #                         name="ℹ️ ระบบจัดเก็บ",
-    #                         value="ใช้ Discord CDN สำหรับความเร็วและเสถียรภาพ",
-    #                         inline=False
-    #                     )
-    #                     embed.add_field(
-    #                         name="📸 รูปภาพที่เพิ่ม",
-    #                         value=f"ใช้รูปภาพล่าสุดจาก {latest_image.filename}",
-    #                         inline=False
-    #                     )
-    #                     embed.set_image(url=image_url)
-    #                     await interaction.followup.send(embed=embed)
-    #                     return
-                        
-    #             embed = discord.Embed(
-    #                 title="❌ ไม่พบสินค้า",
-    #                 description=f"ไม่พบสินค้า **{self.product_name}** ในระบบ",
-    #                 color=0xe74c3c
-    #             )
-    #             await interaction.followup.send(embed=embed)
-    #         else:
-    #             embed = discord.Embed(
-    #                 title="❌ อัปโหลดรูปภาพไม่สำเร็จ",
-    #                 description="เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ",
-    #                 color=0xe74c3c
-    #             )
-    #             await interaction.followup.send(embed=embed)
-    #     else:
-    #         embed = discord.Embed(
-    #             title="❌ ไม่พบรูปภาพ",
-    #             description="ไม่พบรูปภาพล่าสุดใน channel นี้",
-    #             color=0xe74c3c
-    #         )
-    #         embed.add_field(
-    #             name="💡 คำแนะนำ",
-    #             value="กรุณาส่งรูปภาพในช่องนี้ก่อน หรือใช้คำสั่ง `upload: ชื่อสินค้า` พร้อมแนบรูปภาพ",
-    #             inline=False
-    #         )
-    #         await interaction.followup.send(embed=embed)
-    
-    async def find_latest_image_in_channel(self, channel, limit=50):
-        """ค้นหารูปภาพล่าสุดใน channel"""
-        try:
-            async for message in channel.history(limit=limit):
-                if message.attachments:
-                    for attachment in message.attachments:
-                        if attachment.content_type and attachment.content_type.startswith('image/'):
-                            return attachment
-            return None
-        except Exception as e:
-            print(f"❌ เกิดข้อผิดพลาดในการค้นหารูปภาพ: {e}")
-            return None
-    
-    @discord.ui.button(label='Checkout', style=discord.ButtonStyle.secondary, emoji='💳')
-    async def checkout(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        
-        embed = discord.Embed(
-            title="💳 ชำระเงิน",
-            description=f"กำลังดำเนินการชำระเงินสำหรับ **{self.product_name}**",
-            color=0x9b59b6
-        )
-        embed.add_field(
-            name="💡 การชำระเงิน",
-            value="ระบบการชำระเงินจะเปิดให้บริการในเร็วๆ นี้",
-            inline=False
-        )
-        await interaction.followup.send(embed=embed, ephemeral=True)
-
-    @discord.ui.button(label='เพิ่มรูปภาพ', style=discord.ButtonStyle.secondary, emoji='📸', row=1)
-    async def add_image_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        
-        await interaction.followup.send(
-            "เลือกสินค้าที่ต้องการเพิ่มรูปภาพ:",
-            view=ProductSelectView(self.stock_manager, "เพิ่มรูปภาพ"),
-            ephemeral=True
-        )
-
-class SalesModal(discord.ui.Modal):
-    def __init__(self, stock_manager):
+class SalesModal(AppModal):
+    def __init__(self, app):
         super().__init__(title="🛒 สร้างการขาย")
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         
         # รายการสินค้าที่ต้องการขาย
         self.items_input = discord.ui.TextInput(
@@ -1337,7 +1116,7 @@ class SalesModal(discord.ui.Modal):
                             quantity = int(parts[1].strip())
                             
                             # ตรวจสอบสินค้าในสต็อก
-                            product = self.stock_manager.check_stock(product_name)
+                            product = await self.stock_manager.check_stock(product_name)
                             if product:
                                 available_quantity = int(product['จำนวน'])
                                 if available_quantity >= quantity:
@@ -1407,9 +1186,11 @@ class SalesModal(discord.ui.Modal):
                     inline=False
                 )
             
-            view = SalesConfirmView(self.stock_manager, items, self.notes.value)
+            view = SalesConfirmView(self.app, items, self.notes.value)
             await interaction.followup.send(embed=embed, view=view, ephemeral=True)
             
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -1418,20 +1199,23 @@ class SalesModal(discord.ui.Modal):
             )
             await interaction.followup.send(embed=embed, ephemeral=True)
 
-class SalesConfirmView(discord.ui.View):
-    def __init__(self, stock_manager, items, notes):
+class SalesConfirmView(AppView):
+    def __init__(self, app, items, notes):
         super().__init__(timeout=300)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
         self.items = items
         self.notes = notes
+        self.sale_key = f"confirm-{uuid.uuid4().hex}"  # การกดยืนยันซ้ำได้ใบเสร็จเดิม
     
     @discord.ui.button(label='ยืนยันการขาย', style=discord.ButtonStyle.success, emoji='✅')
     async def confirm_sale(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
         
         try:
-            # สร้างใบเสร็จ
-            bill_number, total_amount = self.stock_manager.create_bill(
+            # สร้างใบเสร็จ (ครั้งเดียวต่อ view)
+            bill_number, total_amount, replayed = await self.stock_manager.create_bill_once(
+                self.sale_key,
                 interaction.user,
                 self.items,
                 self.notes
@@ -1482,14 +1266,19 @@ class SalesConfirmView(discord.ui.View):
                         inline=False
                     )
                 
+                add_bill_pending_field(embed, self.stock_manager, bill_number)
                 embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                 
                 # ส่งใบเสร็จในช่องแชทปัจจุบัน
                 await interaction.followup.send(embed=embed)
                 
-                # ส่งล็อกไปยังช่องประวัติบิล
+                # คำขอซ้ำ: ขั้นตอนหลังขายทำไปแล้วโดยคำขอแรก
+                if replayed:
+                    return
+                
+                # ส่งล็อกไปยังช่องประวัติบิล (เข้าคิวส่งเบื้องหลัง ไม่รอช่องล็อก)
                 try:
-                    bill_history_channel = interaction.guild.get_channel(1393184006748635156)
+                    bill_history_channel = interaction.guild.get_channel(self.app.bill_history_channel_id)
                     if bill_history_channel:
                         log_embed = discord.Embed(
                             title="📋 ล็อกการขาย",
@@ -1534,7 +1323,7 @@ class SalesConfirmView(discord.ui.View):
                             )
                         log_embed.set_footer(text=f"ใบเสร็จเลขที่: {bill_number}")
                         
-                        await bill_history_channel.send(embed=log_embed)
+                        self.app.bill_log.publish(bill_history_channel, log_embed)
                 except Exception as e:
                     print(f"❌ ไม่สามารถส่งล็อกไปยังช่องประวัติบิลได้: {e}")
                 
@@ -1557,6 +1346,8 @@ class SalesConfirmView(discord.ui.View):
                 )
                 await interaction.followup.send(embed=embed, ephemeral=True)
                 
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -1579,65 +1370,85 @@ class SalesConfirmView(discord.ui.View):
             item.disabled = True
         await interaction.edit_original_response(view=self)
 
-class SalesChannelView(discord.ui.View):
-    def __init__(self, stock_manager):
+# จำนวนใบเสร็จต่อหน้าในประวัติการขาย
+SALES_HISTORY_PAGE_SIZE = 5
+
+class SalesHistoryView(AppView):
+    """View แสดงประวัติการขายของผู้ขายทีละหน้า (ใหม่ไปเก่า)"""
+    def __init__(self, app, seller, page=0):
+        super().__init__(timeout=300)
+        self.app = app
+        self.stock_manager = app.stock_manager
+        self.seller = seller
+        self.page = page
+    
+    async def render(self):
+        """สร้าง embed ของหน้าปัจจุบันและเปิด/ปิดปุ่มเปลี่ยนหน้า"""
+        bills, total = await self.stock_manager.get_seller_bills(
+            str(self.seller), self.page * SALES_HISTORY_PAGE_SIZE, SALES_HISTORY_PAGE_SIZE
+        )
+        total_pages = max((total + SALES_HISTORY_PAGE_SIZE - 1) // SALES_HISTORY_PAGE_SIZE, 1)
+        
+        if not bills:
+            embed = discord.Embed(
+                title="📋 ประวัติการขาย",
+                description="ไม่มีประวัติการขาย",
+                color=0xff6b6b
+            )
+        else:
+            embed = discord.Embed(
+                title="📋 ประวัติการขาย",
+                description=f"ประวัติการขายของ {self.seller.mention}",
+                color=0x3498db
+            )
+            
+            for bill in bills:
+                items_text = ""
+                for name, quantity, unit in bill['รายการ']:
+                    items_text += f"• {name} x {quantity} {unit}\n"
+                
+                embed.add_field(
+                    name=f"🧾 {bill['เลขที่ใบเสร็จ']}",
+                    value=f"{items_text}💰 ยอดรวม: {bill['ยอดรวม']:,.0f} บาท\n📅 {bill['วันที่']}",
+                    inline=False
+                )
+            
+            embed.set_footer(text=f"หน้า {self.page + 1}/{total_pages} • ทั้งหมด {total} ใบ")
+        
+        self.newer_page.disabled = self.page <= 0
+        self.older_page.disabled = self.page >= total_pages - 1
+        return embed
+    
+    @discord.ui.button(label='ใหม่กว่า', style=discord.ButtonStyle.secondary, emoji='◀️')
+    async def newer_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+    
+    @discord.ui.button(label='เก่ากว่า', style=discord.ButtonStyle.secondary, emoji='▶️')
+    async def older_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+class SalesChannelView(AppView):
+    def __init__(self, app):
         super().__init__(timeout=None)
-        self.stock_manager = stock_manager
+        self.app = app
+        self.stock_manager = app.stock_manager
     
     @discord.ui.button(label='🛒 สร้างการขาย', style=discord.ButtonStyle.success, emoji='🛒')
     async def create_sale(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = SalesModal(self.stock_manager)
+        modal = SalesModal(self.app)
         await interaction.response.send_modal(modal)
     
     @discord.ui.button(label='📋 ดูประวัติการขาย', style=discord.ButtonStyle.secondary, emoji='📋')
     async def view_sales_history(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
-            # ดึงประวัติการขายจากชีต Bills
-            bills_sheet = self.stock_manager.spreadsheet.worksheet('Bills')
-            records = bills_sheet.get_all_records()
-            
-            # กรองเฉพาะใบเสร็จของผู้ใช้นี้
-            user_bills = {}
-            for record in records:
-                if record['ผู้ขาย'] == str(interaction.user):
-                    bill_number = record['เลขที่ใบเสร็จ']
-                    if bill_number not in user_bills:
-                        user_bills[bill_number] = []
-                    user_bills[bill_number].append(record)
-            
-            if not user_bills:
-                embed = discord.Embed(
-                    title="📋 ประวัติการขาย",
-                    description="ไม่มีประวัติการขาย",
-                    color=0xff6b6b
-                )
-            else:
-                embed = discord.Embed(
-                    title="📋 ประวัติการขาย",
-                    description=f"ประวัติการขายของ {interaction.user.mention}",
-                    color=0x3498db
-                )
-                
-                # แสดงใบเสร็จล่าสุด 5 ใบ
-                recent_bills = list(user_bills.items())[-5:]
-                
-                for bill_number, items in recent_bills:
-                    total_amount = 0
-                    items_text = ""
-                    
-                    for item in items:
-                        if item['ราคารวม']:
-                            total_amount += float(item['ราคารวม'])
-                        items_text += f"• {item['ชื่อสินค้า']} x {item['จำนวน']} {item['หน่วย']}\n"
-                    
-                    embed.add_field(
-                        name=f"🧾 {bill_number}",
-                        value=f"{items_text}💰 ยอดรวม: {total_amount:,.0f} บาท\n📅 {items[0]['วันที่']}",
-                        inline=False
-                    )
-            
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            # แสดงประวัติการขายจาก index ในหน่วยความจำ (ไม่ต้องดาวน์โหลดชีต Bills)
+            view = SalesHistoryView(self.app, interaction.user)
+            await interaction.response.send_message(embed=await view.render(), view=view, ephemeral=True)
             
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
@@ -1664,7 +1475,7 @@ class SalesChannelView(discord.ui.View):
         await interaction.followup.send(embed=embed)
         
         # เรียกใช้ฟังก์ชัน products
-        products = self.stock_manager.get_all_stock()
+        products = await self.stock_manager.get_all_stock()
         
         if not products:
             no_products_embed = discord.Embed(
@@ -1745,7 +1556,7 @@ class SalesChannelView(discord.ui.View):
                 embed.color = 0x95a5a6
             
             # ส่งเป็น card พร้อมปุ่ม (ใช้ ProductCardView ใหม่)
-            await interaction.followup.send(embed=embed, view=ProductCardView(product, self.stock_manager))
+            await interaction.followup.send(embed=embed, view=ProductCardView(product, self.app))
             
             # รอเล็กน้อยเพื่อไม่ให้ spam
             await asyncio.sleep(0.5)
@@ -1756,9 +1567,7 @@ class SalesChannelView(discord.ui.View):
         
         try:
             # สร้างช่องแชทการขายส่วนตัว
-            from bot import create_sales_channel
-            
-            sales_channel = await create_sales_channel(interaction.guild, interaction.user)
+            sales_channel = await self.app.create_sales_channel(interaction.guild, interaction.user)
             
             if sales_channel:
                 embed = discord.Embed(
@@ -1789,6 +1598,8 @@ class SalesChannelView(discord.ui.View):
                 )
                 await interaction.followup.send(embed=embed, ephemeral=False)
                 
+        except StorageNotReady as e:
+            await send_storage_not_ready(interaction, e)
         except Exception as e:
             embed = discord.Embed(
                 title="❌ เกิดข้อผิดพลาด",
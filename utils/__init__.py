@@ -0,0 +1,16 @@
+from .bill_index import BILLS_HEADERS, BillIndex, bill_records, parse_updated_rows
+from .bill_journal import BillJournal
+from .bill_log_outbox import BillLogOutbox
+from .bill_numbers import BillNumberAllocator
+from .cart_store import CartStore
+from .change_probe import ChangeProbe
+from .fake_sheets import FakeSheetsClient, FakeSpreadsheet, FakeWorksheet
+from .history_writer import HISTORY_HEADERS, HistoryWriter
+from .idempotency import IdempotencyCache
+from .product_catalog import STOCK_HEADERS, ProductCatalog, normalize_product_name
+from .product_locks import ProductLocks
+from .rate_limiter import TokenBucket
+from .reservations import InsufficientStock, ReservationLedger
+from .sheets_client import SheetsClient
+from .snapshot import SnapshotWriter
+from .worksheet_cache import WorksheetCache
@@ -0,0 +1,179 @@
+import re
+import threading
+from collections import OrderedDict
+
+BILLS_HEADERS = ['เลขที่ใบเสร็จ', 'วันที่', 'ผู้ขาย', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคาต่อหน่วย', 'ราคารวม', 'ยอดรวม', 'หมายเหตุ']
+
+# ช่วงแถวที่ append_rows ตอบกลับมา เช่น "Bills!A120:J123"
+_UPDATED_RANGE = re.compile(r'![A-Z]+(\d+)(?::[A-Z]+(\d+))?$')
+
+
+def parse_updated_rows(response):
+    """อ่านแถวแรกและแถวสุดท้ายที่เพิ่งเขียนจากผลลัพธ์ของ append_rows คืน (None, None) ถ้าอ่านไม่ได้"""
+    try:
+        match = _UPDATED_RANGE.search(response['updates']['updatedRange'])
+    except (KeyError, TypeError):
+        return None, None
+    if not match:
+        return None, None
+    first_row = int(match.group(1))
+    return first_row, int(match.group(2) or first_row)
+
+
+def bill_records(rows):
+    """แปลงแถวของชีต Bills เป็น dict ในรูปแบบเดียวกับ get_all_records()"""
+    records = []
+    for row in rows:
+        row = list(row) + [''] * (len(BILLS_HEADERS) - len(row))
+        records.append(dict(zip(BILLS_HEADERS, row)))
+    return records
+
+
+def _amount(value):
+    try:
+        return float(value) if value not in ('', None) else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class BillIndex:
+    """index เลขที่ใบเสร็จ -> ช่วงแถวในชีต Bills พร้อม LRU cache ของรายการในใบเสร็จ
+
+    โหลดข้อมูลจากชีตครั้งเดียว หลังจากนั้นเพิ่มข้อมูลทีละใบเมื่อสร้างใบเสร็จ
+    การค้นหาใบเสร็จจึงอ่านชีตไม่เกินหนึ่งช่วงแถว หรือไม่อ่านเลยถ้ามีใน cache
+
+    sellers เก็บสรุปใบเสร็จของผู้ขายแต่ละคน (เลขที่, วันที่, ยอดรวม, รายการสินค้า)
+    เรียงตามลำดับที่สร้าง สำหรับแสดงประวัติการขายโดยไม่ต้องอ่านชีต
+    """
+
+    def __init__(self, cache_size=128):
+        self.rows = {}  # เลขที่ใบเสร็จ -> (แถวแรก, แถวสุดท้าย)
+        self.sellers = {}  # ผู้ขาย -> [สรุปใบเสร็จ, ...] (เก่าไปใหม่)
+        self.loaded = False
+        self.cache = OrderedDict()  # เลขที่ใบเสร็จ -> รายการในใบเสร็จ (ล่าสุดอยู่ท้าย)
+        self.cache_size = cache_size
+        self.lock = threading.RLock()
+
+    def load(self, values):
+        """สร้าง index ใหม่จากค่าในชีต Bills ตั้งแต่แถวหัวตาราง (คอลัมน์ A ถึง I)"""
+        rows = {}
+        summaries = {}
+        sellers = {}
+        for row_number, row in enumerate(values[1:], start=2):
+            if not row or not str(row[0]):
+                continue
+            record = bill_records([row])[0]
+            bill_number = str(record['เลขที่ใบเสร็จ'])
+            first_row = rows.get(bill_number, (row_number, row_number))[0]
+            rows[bill_number] = (first_row, row_number)
+
+            summary = summaries.get(bill_number)
+            if summary is None:
+                summary = self.new_summary(record)
+                summaries[bill_number] = summary
+                sellers.setdefault(summary['ผู้ขาย'], []).append(summary)
+            self.add_to_summary(summary, record)
+        with self.lock:
+            self.rows = rows
+            self.sellers = sellers
+            self.cache.clear()
+            self.loaded = True
+
+    @staticmethod
+    def new_summary(record):
+        return {
+            'เลขที่ใบเสร็จ': str(record['เลขที่ใบเสร็จ']),
+            'วันที่': record['วันที่'],
+            'ผู้ขาย': str(record['ผู้ขาย']),
+            'ยอดรวม': 0,
+            'รายการ': []
+        }
+
+    @staticmethod
+    def add_to_summary(summary, record):
+        summary['ยอดรวม'] += _amount(record['ราคารวม'])
+        summary['รายการ'].append((record['ชื่อสินค้า'], record['จำนวน'], record['หน่วย']))
+
+    def to_snapshot(self):
+        """สำเนาของ index สำหรับบันทึกลง snapshot (ไม่รวม cache รายการในใบเสร็จ)"""
+        with self.lock:
+            return {
+                'rows': {bill_number: list(rows) for bill_number, rows in self.rows.items()},
+                'sellers': {
+                    seller: [dict(summary, รายการ=[list(item) for item in summary['รายการ']]) for summary in bills]
+                    for seller, bills in self.sellers.items()
+                }
+            }
+
+    def restore(self, data):
+        """โหลด index จากข้อมูลที่ได้จาก to_snapshot()"""
+        rows = {bill_number: tuple(rows) for bill_number, rows in data['rows'].items()}
+        sellers = {
+            seller: [dict(summary, รายการ=[tuple(item) for item in summary['รายการ']]) for summary in bills]
+            for seller, bills in data['sellers'].items()
+        }
+        with self.lock:
+            self.rows = rows
+            self.sellers = sellers
+            self.cache.clear()
+            self.loaded = True
+
+    def invalidate(self):
+        """บังคับให้โหลด index ใหม่ในการค้นหาครั้งถัดไป"""
+        with self.lock:
+            self.loaded = False
+            self.cache.clear()
+
+    def add(self, bill_number, first_row, last_row, records=None):
+        """บันทึกใบเสร็จที่เพิ่งเขียนลงชีต (และเก็บรายการไว้ใน cache ถ้ามี)"""
+        with self.lock:
+            self.rows[bill_number] = (first_row, last_row)
+            if records:
+                summary = self.new_summary(records[0])
+                for record in records:
+                    self.add_to_summary(summary, record)
+                self.sellers.setdefault(summary['ผู้ขาย'], []).append(summary)
+                self.put_cached(bill_number, records)
+
+    def get_rows(self, bill_number):
+        """คืนช่วงแถว (แถวแรก, แถวสุดท้าย) ของใบเสร็จ หรือ None ถ้าไม่พบ"""
+        with self.lock:
+            return self.rows.get(bill_number)
+
+    def get_seller_bills(self, seller, offset=0, limit=5):
+        """คืนสรุปใบเสร็จของผู้ขาย (ใหม่ไปเก่า) เริ่มที่ offset และจำนวนใบทั้งหมด"""
+        with self.lock:
+            bills = self.sellers.get(str(seller), [])
+            total = len(bills)
+            end = max(total - offset, 0)
+            page = bills[max(end - limit, 0):end]
+        return [dict(summary, รายการ=list(summary['รายการ'])) for summary in reversed(page)], total
+
+    def get_cached(self, bill_number):
+        """คืนสำเนารายการในใบเสร็จจาก cache หรือ None"""
+        with self.lock:
+            records = self.cache.get(bill_number)
+            if records is None:
+                return None
+            self.cache.move_to_end(bill_number)
+            return [dict(record) for record in records]
+
+    def put_cached(self, bill_number, records):
+        with self.lock:
+            self.cache[bill_number] = [dict(record) for record in records]
+            self.cache.move_to_end(bill_number)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def max_sequence(self, date_prefix):
+        """ลำดับใบเสร็จสูงสุดของวันที่ระบุ (YYYYMMDD)"""
+        sequence = 0
+        with self.lock:
+            bill_numbers = list(self.rows)
+        for bill_number in bill_numbers:
+            if bill_number.startswith(f"{date_prefix}-"):
+                try:
+                    sequence = max(sequence, int(bill_number.split('-', 1)[1]))
+                except ValueError:
+                    pass
+        return sequence
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+
+
+class BillJournal:
+    """บันทึกการขายล่วงหน้า (write-ahead) ลงไฟล์ JSONL แบบต่อท้าย เพื่อกู้คืนใบเสร็จที่เขียนไม่ครบ
+
+    begin() เขียนข้อมูลการขายทั้งใบพร้อม fsync ก่อนเขียนลงที่เก็บข้อมูล และ done() บันทึกว่าเขียนครบแล้ว
+    (ไม่ต้อง fsync เพราะถ้าหายไป การกู้คืนจะพบว่าใบเสร็จมีอยู่แล้ว) ตอนเริ่มต้น pending() คืนรายการ
+    ที่ยังไม่เสร็จให้ทำซ้ำ เมื่อไม่มีรายการค้างและไฟล์ยาวเกิน compact_lines บรรทัดจะล้างไฟล์
+    """
+
+    def __init__(self, path, compact_lines=1000):
+        self.path = path
+        self.compact_lines = compact_lines
+        self.open_entries = {}  # เลขที่ใบเสร็จ -> ข้อมูลการขายที่ยังไม่เสร็จ
+        self.lines = 0  # จำนวนบรรทัดในไฟล์
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self):
+        """อ่านไฟล์ journal (เรียกครั้งเดียวตอนเริ่มต้น) บรรทัดสุดท้ายที่เขียนไม่ครบจะถูกข้าม"""
+        with self.lock:
+            self.open_entries = {}
+            self.lines = 0
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        self.lines += 1
+                        if record.get('op') == 'begin':
+                            self.open_entries[record['bill_number']] = record
+                        elif record.get('op') == 'done':
+                            self.open_entries.pop(record['bill_number'], None)
+            except FileNotFoundError:
+                pass
+            # เขียนใหม่เฉพาะรายการที่ค้าง (ตัดบรรทัดที่เสร็จแล้วและบรรทัดที่เขียนไม่ครบทิ้ง)
+            self.rewrite()
+
+    def pending(self):
+        """รายการขายที่ยังไม่เสร็จ ตามลำดับที่เขียน"""
+        with self.lock:
+            return list(self.open_entries.values())
+
+    def is_open(self, bill_number):
+        """การขายนี้ยังไม่เสร็จหรือไม่"""
+        with self.lock:
+            return bill_number in self.open_entries
+
+    def begin(self, bill_number, entry):
+        """บันทึกการขายก่อนเขียนลงที่เก็บข้อมูล (รอจนข้อมูลถึงดิสก์)"""
+        record = dict(entry, op='begin', bill_number=bill_number)
+        with self.lock:
+            self.append(record, sync=True)
+            self.open_entries[bill_number] = record
+
+    def done(self, bill_number):
+        """บันทึกว่าการขายเขียนลงที่เก็บข้อมูลครบแล้ว"""
+        with self.lock:
+            self.open_entries.pop(bill_number, None)
+            if not self.open_entries and self.lines >= self.compact_lines:
+                self.rewrite()
+            else:
+                self.append({'op': 'done', 'bill_number': bill_number}, sync=False)
+
+    def append(self, record, sync):
+        """เขียนต่อท้ายไฟล์ (ต้องถือ lock)"""
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+        self.lines += 1
+
+    def rewrite(self):
+        """เขียนไฟล์ใหม่แบบ atomic ให้เหลือเฉพาะรายการที่ค้าง (ต้องถือ lock)"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.open_entries.values():
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.lines = len(self.open_entries)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
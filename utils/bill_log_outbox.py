@@ -0,0 +1,83 @@
+import asyncio
+import collections
+
+import discord
+
+# ข้อจำกัดของ Discord ต่อหนึ่งข้อความ
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS = 6000
+
+
+class BillLogOutbox:
+    """คิวส่งล็อกใบเสร็จไปยังช่องประวัติบิลเบื้องหลัง
+
+    publish() ใส่ embed ลงคิวแล้วคืนทันที ผู้ซื้อจึงได้ใบเสร็จโดยไม่ต้องรอช่องล็อก worker ส่งทีละข้อความ
+    ถ้ามีหลายใบเสร็จรออยู่ (เช่น ตอนขายพร้อมกันหลายคน) จะรวมเป็นข้อความเดียวได้สูงสุด 10 embed
+    ส่งไม่สำเร็จเพราะ rate limit หรือ Discord ขัดข้อง (5xx) จะรอแล้วลองใหม่ สูงสุด max_attempts ครั้ง
+    ส่งครบทุกครั้งแล้วยังไม่สำเร็จ หรือ Discord ปฏิเสธคำขอ (4xx อื่น) จะทิ้งล็อกนั้นและพิมพ์ข้อผิดพลาด
+
+    คิวอยู่ในหน่วยความจำเท่านั้น ไม่ได้บันทึกลงดิสก์: ถ้า process ถูกปิดหรือ crash ขณะที่ยังมีล็อกรออยู่
+    ล็อกเหล่านั้นจะหายไปเงียบๆ โดยไม่ส่งซ้ำเมื่อเริ่มใหม่ ช่องประวัติบิลจึงอาจขาดบางใบเสร็จ
+    แต่ใบเสร็จและการตัดสต็อกบันทึกลงชีต Bills แล้วก่อนเข้าคิว ใช้ชีต Bills เป็นข้อมูลอ้างอิงเสมอ
+    """
+
+    def __init__(self, max_embeds=MAX_EMBEDS_PER_MESSAGE, retry_delay=1.0, max_retry_delay=60.0, max_attempts=8):
+        self.max_embeds = max_embeds
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.pending = collections.deque()  # (ช่อง, embed) ตามลำดับที่เข้าคิว
+        self.task = None
+
+    def publish(self, channel, embed):
+        """ใส่ embed ลงคิวส่งไปยัง channel (เรียกจาก event loop)"""
+        self.pending.append((channel, embed))
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        while self.pending:
+            await self.send(*self.next_batch())
+
+    def next_batch(self):
+        """ดึง embed ที่รออยู่ของช่องแรกในคิว ให้ได้มากที่สุดที่ใส่ในข้อความเดียวได้"""
+        channel = self.pending[0][0]
+        embeds = []
+        characters = 0
+        skipped = []
+        while self.pending and len(embeds) < self.max_embeds:
+            item_channel, embed = self.pending[0]
+            if item_channel is not channel:
+                skipped.append(self.pending.popleft())
+                continue
+            if embeds and characters + len(embed) > MAX_EMBED_CHARACTERS:
+                break
+            self.pending.popleft()
+            embeds.append(embed)
+            characters += len(embed)
+        # embed ของช่องอื่นกลับไปรอหน้าคิวตามลำดับเดิม
+        self.pending.extendleft(reversed(skipped))
+        return channel, embeds
+
+    async def send(self, channel, embeds):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await channel.send(embeds=embeds)
+                return True
+            except discord.RateLimited as e:
+                wait = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"❌ ไม่สามารถส่งล็อกไปยังช่องประวัติบิลได้: {e}")
+                    return False
+                wait = getattr(e, 'retry_after', None) or delay
+            except Exception as e:
+                print(f"❌ ไม่สามารถส่งล็อกไปยังช่องประวัติบิลได้: {e}")
+                return False
+            if attempt < self.max_attempts:
+                print(f"⚠️ ส่งล็อกใบเสร็จไม่สำเร็จ ลองใหม่ใน {wait:.1f} วินาที ({attempt}/{self.max_attempts})")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.max_retry_delay)
+        print(f"❌ ส่งล็อกใบเสร็จไม่สำเร็จหลังลอง {self.max_attempts} ครั้ง (ทิ้ง {len(embeds)} รายการ)")
+        return False
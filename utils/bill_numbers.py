@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+
+class BillNumberAllocator:
+    """ตัวจัดสรรเลขที่ใบเสร็จรายวันในรูปแบบ YYYYMMDD-XXX
+
+    เก็บลำดับของวันไว้ในหน่วยความจำ อ่านชีตเพียงครั้งเดียวตอนเริ่มต้นหรือเมื่อขึ้นวันใหม่
+    และบันทึกเลขล่าสุดที่ออกไปแล้ว (high-water mark) ลงไฟล์ทุกครั้ง
+    เพื่อไม่ให้ออกเลขซ้ำหลังรีสตาร์ท
+    """
+
+    def __init__(self, state_path, load_sequence):
+        self.state_path = state_path
+        self.load_sequence = load_sequence  # ฟังก์ชัน (YYYYMMDD) -> ลำดับสูงสุดที่พบในชีต
+        self.date = None
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_number(self, now=None):
+        """ออกเลขที่ใบเสร็จถัดไป (ปลอดภัยเมื่อเรียกพร้อมกันหลาย thread)"""
+        today = (now or datetime.now()).strftime('%Y%m%d')
+        with self.lock:
+            if self.date != today:
+                self.seed(today)
+            self.sequence += 1
+            self.save()
+            return f"{today}-{self.sequence:03d}"
+
+    def seed(self, today=None):
+        """ตั้งค่าลำดับของวันจากไฟล์ที่บันทึกไว้และจากชีต (ใช้ค่าที่มากกว่า)"""
+        today = today or datetime.now().strftime('%Y%m%d')
+        sequence = self.read_saved(today)
+        try:
+            sequence = max(sequence, self.load_sequence(today))
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถอ่านเลขที่ใบเสร็จล่าสุดจากชีตได้ ใช้ค่าที่บันทึกไว้ ({sequence}): {e}")
+        self.date = today
+        self.sequence = sequence
+        print(f"✅ ตั้งค่าเลขที่ใบเสร็จวันที่ {today} เริ่มต่อจาก {sequence:03d}")
+
+    def read_saved(self, today):
+        """อ่านเลขล่าสุดที่บันทึกไว้ในไฟล์ (คืน 0 ถ้าเป็นของวันอื่นหรือไม่มีไฟล์)"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('date') == today:
+                return int(state.get('sequence', 0))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถอ่านไฟล์เลขที่ใบเสร็จได้: {e}")
+        return 0
+
+    def save(self):
+        """บันทึกเลขล่าสุดลงไฟล์แบบ atomic"""
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'date': self.date, 'sequence': self.sequence}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            print(f"❌ ไม่สามารถบันทึกไฟล์เลขที่ใบเสร็จได้: {e}")
@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS carts (
+    user_id TEXT PRIMARY KEY,
+    items TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class CartStore:
+    """เก็บรถเข็นของผู้ใช้ลง SQLite ในเครื่อง เพื่อไม่ให้รถเข็นหายเมื่อรีสตาร์ท bot
+
+    save() เก็บสำเนารายการลงคิวในหน่วยความจำเท่านั้น (write-behind) thread เบื้องหลังจะเขียนลงฐานข้อมูล
+    ทุก flush_interval วินาที (รถเข็นว่างจะถูกลบแถว) และเขียนที่เหลือตอน close()
+    load() อ่านรถเข็นของผู้ใช้คนเดียวเมื่อถูกเรียกใช้ครั้งแรก ไม่โหลดทั้งหมดตอนเริ่มต้น
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = {}  # user_id -> รายการสินค้าที่ยังไม่ได้เขียน
+        self.conn = None
+        self.lock = threading.Lock()  # ป้องกัน pending
+        self.db_lock = threading.Lock()  # ป้องกันการเชื่อมต่อฐานข้อมูล
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def connection(self):
+        """เปิดฐานข้อมูลเมื่อใช้ครั้งแรก (ต้องถือ db_lock)"""
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+        return self.conn
+
+    def start(self):
+        if self.thread is None and self.flush_interval > 0:
+            self.thread = threading.Thread(target=self.run, name='cart-store', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def save(self, user_id, items):
+        """บันทึกรายการในรถเข็นของผู้ใช้ (เขียนลงฐานข้อมูลภายหลัง)"""
+        with self.lock:
+            self.pending[user_id] = [dict(item) for item in items]
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self.start()
+
+    def load(self, user_id):
+        """รายการในรถเข็นที่บันทึกไว้ของผู้ใช้ ([] ถ้าไม่มีหรืออ่านไม่ได้)"""
+        with self.lock:
+            if user_id in self.pending:
+                return [dict(item) for item in self.pending[user_id]]
+        try:
+            with self.db_lock:
+                row = self.connection().execute(
+                    'SELECT items FROM carts WHERE user_id = ?', (user_id,)
+                ).fetchone()
+            return json.loads(row[0]) if row else []
+        except Exception as e:
+            print(f"❌ ไม่สามารถโหลดรถเข็นของผู้ใช้ {user_id} ได้: {e}")
+            return []
+
+    def flush(self):
+        """เขียนรถเข็นที่เปลี่ยนทั้งหมดใน transaction เดียว คืนจำนวนรถเข็นที่เขียน"""
+        with self.lock:
+            carts, self.pending = self.pending, {}
+        if not carts:
+            return 0
+        try:
+            with self.db_lock:
+                conn = self.connection()
+                now = time.time()
+                conn.execute('BEGIN')
+                try:
+                    conn.executemany(
+                        'DELETE FROM carts WHERE user_id = ?',
+                        [(user_id,) for user_id, items in carts.items() if not items]
+                    )
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO carts (user_id, items, updated_at) VALUES (?, ?, ?)',
+                        [
+                            (user_id, json.dumps(items, ensure_ascii=False, separators=(',', ':')), now)
+                            for user_id, items in carts.items() if items
+                        ]
+                    )
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+            return len(carts)
+        except Exception as e:
+            # คืนรถเข็นกลับเข้าคิว (ไม่ทับการเปลี่ยนแปลงที่ใหม่กว่า) เพื่อลองใหม่ในรอบถัดไป
+            with self.lock:
+                for user_id, items in carts.items():
+                    self.pending.setdefault(user_id, items)
+            print(f"❌ เกิดข้อผิดพลาดในการบันทึกรถเข็น: {e}")
+            return 0
+
+    def close(self):
+        """หยุด thread เขียนรถเข็นที่เหลือ และปิดฐานข้อมูล (เรียกตอนปิด bot)"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_interval + 1)
+            self.thread = None
+        self.flush()
+        with self.db_lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
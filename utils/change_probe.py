@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class ChangeProbe:
+    """ตรวจว่า spreadsheet ถูกแก้ไขจากภายนอกหรือไม่ โดยไม่ต้องดาวน์โหลดข้อมูล
+
+    fetch() คืนค่า (version, แก้ไขล่าสุดโดย bot เองหรือไม่) ของไฟล์ใน Google Drive
+    ซึ่งเป็นคำขอเล็กๆ หนึ่งครั้ง และ changed() จะเรียกไม่เกินหนึ่งครั้งทุก interval วินาที
+
+    version ของ Drive เพิ่มขึ้นทุกครั้งที่ไฟล์ถูกแก้ไข SheetsClient เรียก record_write() ก่อนส่งคำขอเขียน
+    ทุกครั้ง (นับในหน่วยความจำ ไม่มีคำขอเพิ่ม) ถ้า version เพิ่มขึ้นมากกว่าจำนวนคำขอเขียนของ bot ตั้งแต่
+    ตรวจครั้งก่อน หรือผู้แก้ไขล่าสุดไม่ใช่ bot ถือว่ามีการแก้ไขจากภายนอก การแก้ไขของพนักงานจึงไม่ถูกบัง
+    แม้ bot เขียนตามทันที (คำขอเขียนที่ล้มเหลวยังนับเป็นของ bot การแก้ไขจากภายนอกในจำนวนเท่ากันอาจถูกบัง
+    และจะเห็นผลเมื่อแคตตาล็อกหมดอายุตาม ttl)
+    """
+
+    def __init__(self, fetch, interval=5.0):
+        self.fetch = fetch
+        self.interval = interval
+        self.version = None  # version ล่าสุดที่ข้อมูลในหน่วยความจำรู้จักแล้ว
+        self.own_writes = 0  # จำนวนคำขอเขียนของ bot ตั้งแต่ version นั้น
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """บันทึก version ปัจจุบันเป็นจุดเริ่มต้น (เรียกก่อนโหลดข้อมูลจากชีต)"""
+        with self.lock:
+            self.own_writes = 0
+        version, by_me = self.fetch()
+        with self.lock:
+            self.version = version
+            self.checked_at = time.monotonic()
+
+    def record_write(self):
+        """เรียกก่อน bot ส่งคำขอเขียนชีตแต่ละครั้ง"""
+        with self.lock:
+            self.own_writes += 1
+
+    def changed(self):
+        """คืน True ถ้ามีการแก้ไขจากภายนอกตั้งแต่ตรวจครั้งก่อน (ถ้ายังไม่ถึงเวลาตรวจจะคืน False)"""
+        with self.lock:
+            if self.checked_at is not None and time.monotonic() - self.checked_at < self.interval:
+                return False
+            self.checked_at = time.monotonic()
+            known_version = self.version
+            own_writes, self.own_writes = self.own_writes, 0
+        try:
+            version, by_me = self.fetch()
+        except Exception:
+            with self.lock:
+                self.own_writes += own_writes
+            raise
+        with self.lock:
+            self.version = version
+        if version == known_version:
+            return False
+        return known_version is None or not by_me or version - known_version > own_writes
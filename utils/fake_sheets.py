@@ -0,0 +1,321 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import gspread
+import requests
+from gspread.exceptions import APIError
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+from .sheets_client import SheetsClient
+
+
+class FakeSheetsClient(SheetsClient):
+    """Google Sheets จำลองในหน่วยความจำ สำหรับทดสอบและวัดประสิทธิภาพโดยไม่ใช้เครือข่าย
+
+    ใช้แทน SheetsClient ได้ทันที: คำขอทุกครั้งผ่าน request() ของ SheetsClient จึงถูกนับ
+    รอคิวโควตา และลองใหม่เหมือนของจริง ต่างกันที่ send() จะหน่วงเวลา latency วินาที
+    และตอบ error_status (ค่าเริ่มต้น 429) ตามสัดส่วน error_rate แทนการส่งคำขอจริง
+
+    method_counts นับจำนวนการเรียกแยกตามเมธอดของ gspread (เช่น append_rows, batch_update)
+    รวมครั้งที่ลองใหม่ด้วย ถ้าเปิด count_bytes จะนับขนาดข้อมูลที่ส่งและรับ (ขนาด JSON ของค่าในเซลล์)
+    ไว้ใน bytes_sent และ bytes_received
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=429, seed=None, count_bytes=False, **kwargs):
+        super().__init__(None, **kwargs)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.method_counts = Counter()
+        self.count_bytes = count_bytes
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.spreadsheets = {}
+        self.lock = threading.Lock()
+
+    def send(self, method, endpoint, *args, apply=None, **kwargs):
+        with self.lock:
+            self.method_counts[endpoint.split(':')[0]] += 1
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if failed:
+            response = requests.Response()
+            response.status_code = self.error_status
+            response._content = json.dumps({'error': {
+                'code': self.error_status,
+                'message': 'Fake Sheets: Quota exceeded',
+                'status': 'RESOURCE_EXHAUSTED'
+            }}).encode()
+            raise APIError(response)
+        if apply is not None:
+            return apply()
+
+    def call(self, name, method='get', apply=None):
+        """ส่งคำขอจำลองของเมธอด name (เรียกก่อนอ่านข้อมูลในหน่วยความจำ)
+
+        การเขียนส่ง apply (ฟังก์ชันที่แก้ข้อมูล) ซึ่งจะถูกเรียกใน send() เหมือนคำขอจริงที่ถูกบันทึก
+        ก่อนได้รับคำตอบ คืนค่าที่ apply คืน
+        """
+        # append_rows ลงท้ายด้วย :append เหมือน endpoint จริง เพื่อให้กติกาการลองใหม่ของ 5xx ตรงกัน
+        endpoint = f'{name}:append' if name == 'append_rows' else name
+        if apply is not None:
+            return self.request(method, endpoint, apply=apply)
+        # Drive API มีโควตาแยกจาก Google Sheets API
+        return self.request(method, endpoint, sheets_quota=name != 'file_version')
+
+    def transfer(self, sent=None, received=None):
+        """บันทึกขนาดข้อมูลที่ส่งไปและได้รับกลับของคำขอหนึ่งครั้ง"""
+        if not self.count_bytes:
+            return
+        sent_bytes = len(json.dumps(sent, ensure_ascii=False, default=str).encode()) if sent is not None else 0
+        received_bytes = len(json.dumps(received, ensure_ascii=False, default=str).encode()) if received is not None else 0
+        with self.lock:
+            self.bytes_sent += sent_bytes
+            self.bytes_received += received_bytes
+
+    def file_version(self, file_id):
+        self.call('file_version')
+        spreadsheet = self.spreadsheets[file_id]
+        with spreadsheet.lock:
+            return spreadsheet.version, spreadsheet.modified_by_me
+
+    def open_by_key(self, key):
+        self.call('open_by_key')
+        with self.lock:
+            if key not in self.spreadsheets:
+                self.spreadsheets[key] = FakeSpreadsheet(self, key)
+            return self.spreadsheets[key]
+
+    def open(self, title, folder_id=None):
+        return self.open_by_key(title)
+
+    def reset_counts(self):
+        with self.lock:
+            self.method_counts.clear()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+
+class FakeSpreadsheet:
+    """spreadsheet จำลอง เก็บแต่ละแท็บเป็นตารางของค่าในหน่วยความจำ
+
+    version และ modified_by_me จำลอง version และ lastModifyingUser ของ Drive API
+    ใช้ edit() เพื่อจำลองการแก้ไขชีตด้วยมือของพนักงาน
+    """
+
+    def __init__(self, client, key, title='CatBot-Stock-Management'):
+        self.client = client
+        self.id = key
+        self.title = title
+        self.sheets = {}
+        self.lock = threading.RLock()
+        self.version = 1
+        self.modified_by_me = False
+
+    def touch(self, by_me=True):
+        """บันทึกว่ามีการแก้ไข (ต้องถือ lock) version เพิ่มขึ้นหนึ่งต่อการแก้ไขหนึ่งครั้ง"""
+        self.version += 1
+        self.modified_by_me = by_me
+
+    def edit(self, title, range_name, values):
+        """จำลองการแก้ไขชีตโดยผู้ใช้อื่น (ไม่นับเป็นคำขอ)"""
+        with self.lock:
+            sheet = self.sheets[title]
+            start_row, _, start_col, _ = sheet.bounds(range_name)
+            sheet.write(start_row, start_col, values)
+            self.touch(by_me=False)
+
+    def load(self, title, values):
+        """ใส่ข้อมูลตั้งต้นให้แท็บ (สร้างแท็บถ้ายังไม่มี) โดยไม่นับเป็นคำขอ"""
+        with self.lock:
+            sheet = self.sheets.get(title)
+            if sheet is None:
+                sheet = self.sheets[title] = FakeWorksheet(self, title, len(self.sheets))
+            sheet.grid = [list(row) for row in values]
+            return sheet
+
+    def worksheets(self):
+        self.client.call('worksheets')
+        with self.lock:
+            return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self.client.call('worksheet')
+        with self.lock:
+            if title not in self.sheets:
+                raise gspread.WorksheetNotFound(title)
+            return self.sheets[title]
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        def apply():
+            with self.lock:
+                sheet = self.sheets[title] = FakeWorksheet(self, title, len(self.sheets))
+                self.touch()
+                return sheet
+        return self.client.call('add_worksheet', 'post', apply)
+
+    def values_batch_get(self, ranges, params=None):
+        self.client.call('values_batch_get')
+        value_ranges = []
+        with self.lock:
+            for name in ranges:
+                title, _, cells = name.rpartition('!')
+                sheet = self.sheets[title.strip("'")]
+                value_ranges.append({'range': name, 'values': sheet.read(cells)})
+        self.client.transfer(received=value_ranges)
+        return {'spreadsheetId': self.id, 'valueRanges': value_ranges}
+
+
+class FakeWorksheet:
+    """worksheet จำลองที่รองรับเมธอดของ gspread ที่ bot ใช้ (แถวว่างท้ายตารางถูกตัดออกเหมือน API จริง)"""
+
+    def __init__(self, spreadsheet, title, index=0):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self.index = index
+        self.grid = []
+
+    # ---------- ตัวช่วยอ่าน/เขียนตาราง (ต้องถือ lock ของ spreadsheet) ----------
+
+    def bounds(self, name):
+        """แปลงช่วง A1 เป็น (แถวเริ่ม, แถวจบ, คอลัมน์เริ่ม, คอลัมน์จบ) แบบเริ่มที่ 0 และไม่รวมตัวท้าย"""
+        grid_range = a1_range_to_grid_range(name)
+        return (
+            grid_range.get('startRowIndex', 0),
+            grid_range.get('endRowIndex', len(self.grid)),
+            grid_range.get('startColumnIndex', 0),
+            grid_range.get('endColumnIndex', None)
+        )
+
+    def read(self, name):
+        start_row, end_row, start_col, end_col = self.bounds(name)
+        values = [list(row[start_col:end_col]) for row in self.grid[start_row:end_row]]
+        for row in values:
+            while row and row[-1] in ('', None):
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, start_row, start_col, values):
+        for r, row in enumerate(values):
+            while len(self.grid) <= start_row + r:
+                self.grid.append([])
+            target = self.grid[start_row + r]
+            if len(target) < start_col + len(row):
+                target.extend([''] * (start_col + len(row) - len(target)))
+            target[start_col:start_col + len(row)] = list(row)
+
+    def last_row(self):
+        rows = len(self.grid)
+        while rows and not any(value not in ('', None) for value in self.grid[rows - 1]):
+            rows -= 1
+        return rows
+
+    # ---------- เมธอดของ gspread ----------
+
+    def get_all_values(self, **kwargs):
+        self.client.call('get_all_values')
+        with self.spreadsheet.lock:
+            values = self.read('A1:ZZ')
+        self.client.transfer(received=values)
+        return values
+
+    def get_all_records(self, **kwargs):
+        self.client.call('get_all_records')
+        with self.spreadsheet.lock:
+            values = self.read('A1:ZZ')
+        self.client.transfer(received=values)
+        if not values:
+            return []
+        headers = values[0]
+        return [dict(zip(headers, row + [''] * (len(headers) - len(row)))) for row in values[1:]]
+
+    def get(self, range_name=None, **kwargs):
+        self.client.call('get')
+        with self.spreadsheet.lock:
+            values = self.read(range_name or 'A1:ZZ')
+        self.client.transfer(received=values)
+        return values
+
+    def row_values(self, row, **kwargs):
+        self.client.call('row_values')
+        with self.spreadsheet.lock:
+            values = self.read(f'{row}:{row}')
+        self.client.transfer(received=values)
+        return values[0] if values else []
+
+    def col_values(self, col, **kwargs):
+        self.client.call('col_values')
+        letter = rowcol_to_a1(1, col)[:-1]
+        with self.spreadsheet.lock:
+            values = self.read(f'{letter}:{letter}')
+        self.client.transfer(received=values)
+        return [row[0] if row else '' for row in values]
+
+    def update(self, range_name, values=None, **kwargs):
+        def apply():
+            with self.spreadsheet.lock:
+                start_row, _, start_col, _ = self.bounds(range_name)
+                self.write(start_row, start_col, values)
+                self.spreadsheet.touch()
+        self.client.call('update', 'put', apply)
+        self.client.transfer(sent=values)
+        return {'updatedRange': f"'{self.title}'!{range_name}"}
+
+    def batch_update(self, data, **kwargs):
+        def apply():
+            with self.spreadsheet.lock:
+                for item in data:
+                    start_row, _, start_col, _ = self.bounds(item['range'])
+                    self.write(start_row, start_col, item['values'])
+                self.spreadsheet.touch()
+        self.client.call('batch_update', 'post', apply)
+        self.client.transfer(sent=data)
+        return {'totalUpdatedCells': sum(len(row) for item in data for row in item['values'])}
+
+    def append_rows(self, values, value_input_option='RAW', table_range=None, **kwargs):
+        def apply():
+            with self.spreadsheet.lock:
+                first_row = self.last_row() + 1
+                self.write(first_row - 1, 0, values)
+                self.spreadsheet.touch()
+                return first_row
+        first_row = self.client.call('append_rows', 'post', apply)
+        self.client.transfer(sent=values)
+        last_row = first_row + len(values) - 1
+        width = max((len(row) for row in values), default=1)
+        updated_range = f"'{self.title}'!A{first_row}:{rowcol_to_a1(last_row, width)}"
+        return {'updates': {'updatedRange': updated_range, 'updatedRows': len(values)}}
+
+    def delete_rows(self, start_index, end_index=None):
+        def apply():
+            with self.spreadsheet.lock:
+                del self.grid[start_index - 1:end_index or start_index]
+                self.spreadsheet.touch()
+        self.client.call('delete_rows', 'post', apply)
+
+    def clear(self):
+        def apply():
+            with self.spreadsheet.lock:
+                self.grid = []
+                self.spreadsheet.touch()
+        self.client.call('clear', 'post', apply)
+
+    def batch_clear(self, ranges):
+        def apply():
+            with self.spreadsheet.lock:
+                for name in ranges:
+                    start_row, end_row, start_col, end_col = self.bounds(name)
+                    for row in self.grid[start_row:end_row]:
+                        stop = len(row) if end_col is None else min(end_col, len(row))
+                        row[start_col:stop] = [''] * max(stop - start_col, 0)
+                self.spreadsheet.touch()
+        self.client.call('batch_clear', 'post', apply)
+        self.client.transfer(sent=ranges)
@@ -0,0 +1,71 @@
+import threading
+
+HISTORY_HEADERS = ['วันที่', 'ชื่อผู้ใช้', 'การทำรายการ', 'ชื่อสินค้า', 'จำนวน', 'หมายเหตุ']
+
+
+class HistoryWriter:
+    """ตัวเขียนชีต History แบบต่อท้ายอย่างเดียว (append-only) พร้อมบัฟเฟอร์
+
+    ไม่อ่านชีตก่อนเขียน: แถวที่รอเขียนจะถูกส่งด้วย append_rows ครั้งเดียว
+    เมื่อครบ batch_size แถว, ทุก flush_interval วินาที หรือเมื่อเรียก close()
+    """
+
+    def __init__(self, get_sheet, flush_interval=2.0, batch_size=20):
+        self.get_sheet = get_sheet  # ฟังก์ชันที่คืน worksheet History
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """เริ่ม thread สำหรับ flush ตามช่วงเวลา"""
+        if self.thread is None and self.flush_interval > 0:
+            self.thread = threading.Thread(target=self.run, name='history-writer', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def add(self, row):
+        """เพิ่มแถวประวัติเข้าคิว และ flush ทันทีเมื่อครบ batch_size"""
+        with self.lock:
+            self.pending.append(list(row))
+            should_flush = len(self.pending) >= self.batch_size or self.flush_interval <= 0
+        if should_flush:
+            self.flush()
+
+    def pending_records(self):
+        """แถวที่ยังไม่ได้เขียนลงชีต ในรูปแบบเดียวกับ get_all_records()"""
+        with self.lock:
+            return [dict(zip(HISTORY_HEADERS, row)) for row in self.pending]
+
+    def flush(self):
+        """เขียนแถวที่รออยู่ทั้งหมดด้วย append_rows ครั้งเดียว คืนจำนวนแถวที่เขียน"""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return 0
+            try:
+                history_sheet = self.get_sheet()
+                history_sheet.append_rows(rows, value_input_option='RAW', table_range='A1')
+                print(f"✅ บันทึกประวัติลงชีต History {len(rows)} รายการ")
+                return len(rows)
+            except Exception as e:
+                # คืนแถวกลับเข้าคิวเพื่อลองใหม่ในรอบถัดไป
+                with self.lock:
+                    self.pending = rows + self.pending
+                print(f"❌ เกิดข้อผิดพลาดในการบันทึกประวัติลงชีต History: {e}")
+                return 0
+
+    def close(self):
+        """หยุด thread และเขียนแถวที่เหลือทั้งหมด (เรียกตอนปิด bot)"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.flush_interval + 1)
+            self.thread = None
+        self.flush()
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+
+class IdempotencyCache:
+    """ตารางกันคำขอซ้ำที่มีอายุสั้น (ในหน่วยความจำ ใช้ภายใน event loop ของ bot)
+
+    run(คีย์, func) เรียก func ครั้งเดียวต่อคีย์ คำขอซ้ำที่มาระหว่างที่ครั้งแรกยังทำงานอยู่จะรอผลเดียวกัน
+    และคำขอซ้ำภายใน ttl วินาทีหลังสำเร็จจะได้ผลเดิมทันทีโดยไม่เรียก func อีก
+    ผลที่ไม่สำเร็จ (is_success คืน False) จะไม่ถูกจำ จึงลองใหม่ได้
+    """
+
+    def __init__(self, ttl=600, is_success=bool):
+        self.ttl = ttl
+        self.is_success = is_success
+        self.results = {}  # คีย์ -> (เวลาหมดอายุ, ผลลัพธ์)
+        self.pending = {}  # คีย์ -> task ที่กำลังทำงาน
+
+    def purge_expired(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self.results.items() if expires_at <= now]:
+            del self.results[key]
+
+    async def run(self, key, func):
+        """คืนค่า (ผลลัพธ์, เป็นคำขอซ้ำหรือไม่)"""
+        self.purge_expired()
+        if key in self.results:
+            return self.results[key][1], True
+        task = self.pending.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        def finished(task):
+            self.pending.pop(key, None)
+            if not task.cancelled() and task.exception() is None and self.is_success(task.result()):
+                self.results[key] = (time.monotonic() + self.ttl, task.result())
+
+        # shield: ถ้า interaction ที่รออยู่ถูกยกเลิก การขายยังทำต่อจนเสร็จและถูกบันทึกในตาราง
+        task = asyncio.ensure_future(func())
+        self.pending[key] = task
+        task.add_done_callback(finished)
+        return await asyncio.shield(task), False
@@ -0,0 +1,119 @@
+import time
+import unicodedata
+
+STOCK_HEADERS = ['ID', 'ชื่อสินค้า', 'จำนวน', 'หน่วย', 'ราคา', 'คำอธิบาย', 'รูปภาพURL', 'วันที่อัปเดตล่าสุด']
+
+# อักขระความกว้างศูนย์ที่มักติดมากับข้อความภาษาไทยเมื่อคัดลอก/พิมพ์
+_ZERO_WIDTH_CHARS = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff'))
+
+
+def normalize_product_name(name):
+    """แปลงชื่อสินค้าเป็นคีย์สำหรับค้นหา
+
+    ใช้ Unicode NFC, casefold, ตัดอักขระความกว้างศูนย์, รวมช่องว่างให้เหลือช่องเดียว
+    และรวมสระอำที่พิมพ์แยก (นิคหิต + สระอา) ให้เป็นตัวเดียวกัน
+    """
+    key = unicodedata.normalize('NFC', str(name)).translate(_ZERO_WIDTH_CHARS)
+    key = key.replace('\u0e4d\u0e32', '\u0e33')
+    return ' '.join(key.casefold().split())
+
+
+class ProductCatalog:
+    """แคตตาล็อกสินค้าในหน่วยความจำสำหรับชีต Stock (write-through)
+
+    โหลดข้อมูลจากชีตครั้งเดียวแล้วตอบการอ่านทั้งหมดจากหน่วยความจำ
+    การเขียนของ StockManager จะอัปเดตแคตตาล็อกทันที ส่วนการแก้ไขชีตด้วยมือ
+    จะเห็นผลเมื่อแคตตาล็อกหมดอายุตาม ttl (วินาที)
+
+    index เก็บคีย์ชื่อสินค้าที่ normalize แล้ว -> ตำแหน่งใน products
+    (เลขแถวในชีตคือตำแหน่ง + 2) เพื่อค้นหาสินค้าได้ใน O(1)
+
+    การอ่านจาก thread อื่นไม่ถือ lock ของ backend จึงเก็บ products และ index คู่กันใน state
+    การโหลดใหม่หรือลบสินค้าจะสร้างทั้งคู่ให้เสร็จก่อนแล้วแทนที่ state ด้วยการกำหนดค่าครั้งเดียว
+    ผู้อ่านจึงเห็นข้อมูลชุดเก่าหรือชุดใหม่ทั้งชุด ไม่เห็น index ที่สร้างไม่เสร็จ
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.state = ([], {})  # (products เรียงตามแถวในชีต: index 0 คือแถวที่ 2, index)
+        self.loaded_at = None
+
+    @property
+    def products(self):
+        return self.state[0]
+
+    @property
+    def index(self):
+        return self.state[1]
+
+    def is_stale(self):
+        """ตรวจสอบว่าต้องโหลดข้อมูลจากชีตใหม่หรือไม่"""
+        if self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    def invalidate(self):
+        """บังคับให้โหลดข้อมูลใหม่ในการอ่านครั้งถัดไป"""
+        self.loaded_at = None
+
+    def load(self, records):
+        """แทนที่ข้อมูลทั้งหมดด้วยข้อมูลจาก get_all_records()"""
+        products = [dict(record) for record in records]
+        self.state = (products, self.build_index(products))
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def build_index(products):
+        """สร้าง index ชื่อสินค้าของ products (ชื่อซ้ำจะใช้แถวแรก เหมือนการค้นหาในชีต)"""
+        index = {}
+        for i, product in enumerate(products):
+            index.setdefault(normalize_product_name(product.get('ชื่อสินค้า', '')), i)
+        return index
+
+    def rebuild_index(self):
+        """สร้าง index ชื่อสินค้าใหม่ทั้งหมดแล้วแทนที่ของเดิม"""
+        products = self.products
+        self.state = (products, self.build_index(products))
+
+    def get_all(self):
+        """คืนสำเนาของรายการสินค้าทั้งหมด"""
+        return [dict(product) for product in self.products]
+
+    def find(self, product_name):
+        """ค้นหาสินค้าตามชื่อ คืนค่า (index, product) หรือ (None, None)"""
+        products, index = self.state
+        i = index.get(normalize_product_name(product_name))
+        if i is None:
+            return None, None
+        return i, products[i]
+
+    def next_id(self):
+        """ID สำหรับสินค้าใหม่: มากกว่า ID สูงสุดที่มีอยู่ (ไม่ซ้ำแม้เคยลบสินค้าไปแล้ว)"""
+        ids = [int(product['ID']) for product in self.products if str(product.get('ID', '')).strip().isdigit()]
+        return max(ids, default=0) + 1
+
+    @staticmethod
+    def row_number(index):
+        """แปลง index ในแคตตาล็อกเป็นเลขแถวในชีต (+2 เพราะแถว 1 เป็นหัวตาราง)"""
+        return index + 2
+
+    def update(self, index, fields):
+        """อัปเดตข้อมูลสินค้าหลังเขียนลงชีตแล้ว"""
+        product = self.products[index]
+        old_name = product.get('ชื่อสินค้า', '')
+        product.update(fields)
+        if normalize_product_name(product.get('ชื่อสินค้า', '')) != normalize_product_name(old_name):
+            self.rebuild_index()
+
+    def append(self, product):
+        """เพิ่มสินค้าใหม่ต่อท้ายหลังเขียนลงชีตแล้ว"""
+        self.products.append(dict(product))
+        self.index.setdefault(normalize_product_name(product.get('ชื่อสินค้า', '')), len(self.products) - 1)
+
+    def remove(self, index):
+        """ลบสินค้าหลังลบแถวในชีตแล้ว (แถวถัดไปจะเลื่อนขึ้นเหมือนในชีต)"""
+        products = self.products[:index] + self.products[index + 1:]
+        self.state = (products, self.build_index(products))
+
+    def __len__(self):
+        return len(self.products)
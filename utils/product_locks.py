@@ -0,0 +1,55 @@
+import asyncio
+import contextlib
+
+from .product_catalog import normalize_product_name
+
+
+class ProductLocks:
+    """lock แบบ async แยกตามสินค้า สำหรับการเขียนข้อมูลจาก command และ view
+
+    hold(ชื่อสินค้า) ให้คำสั่งที่แก้ไขสินค้าต่างกันทำงานพร้อมกันได้ ส่วนคำสั่งที่แก้ไขสินค้าเดียวกัน
+    จะทำทีละคำสั่ง (จอง lock ตามลำดับคีย์ชื่อสินค้าเพื่อไม่ให้ deadlock)
+
+    exclusive() ใช้กับการเปลี่ยนโครงสร้างแคตตาล็อก (เพิ่ม ลบ หรือเปลี่ยนชื่อสินค้า ซึ่งทำให้แถวเลื่อน)
+    จะรอให้ทุกคำสั่งที่ถือ lock อยู่เสร็จก่อน และคำสั่งใหม่จะรอจนการเปลี่ยนโครงสร้างเสร็จ
+    """
+
+    def __init__(self):
+        self.locks = {}  # คีย์ชื่อสินค้า -> [asyncio.Lock, จำนวนผู้ใช้]
+        self.active = 0  # จำนวนคำสั่งที่อยู่ใน hold()
+        self.gate = asyncio.Lock()  # ถือไว้ระหว่าง exclusive()
+        self.idle = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, product_names):
+        keys = sorted({normalize_product_name(name) for name in product_names})
+        async with self.gate:
+            self.active += 1
+        waiting = []  # คีย์ที่นับเป็นผู้ใช้แล้ว
+        held = []  # คีย์ที่ได้ lock แล้ว
+        try:
+            for key in keys:
+                entry = self.locks.setdefault(key, [asyncio.Lock(), 0])
+                entry[1] += 1
+                waiting.append(key)
+                await entry[0].acquire()
+                held.append(key)
+            yield
+        finally:
+            for key in reversed(waiting):
+                entry = self.locks[key]
+                if key in held:
+                    entry[0].release()
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
+            self.active -= 1
+            async with self.idle:
+                self.idle.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        async with self.gate:
+            async with self.idle:
+                await self.idle.wait_for(lambda: self.active == 0)
+            yield
@@ -0,0 +1,37 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """ตัวจำกัดอัตราคำขอแบบ token bucket (ใช้ร่วมกันได้หลาย thread)
+
+    เติม token ตามอัตรา rate_per_minute และสะสมได้ไม่เกิน capacity (ค่าเริ่มต้นเท่ากับอัตราต่อนาที)
+    เมื่อ token หมด ผู้เรียกจะจองคิวแล้วรอจนถึงเวลาของตัวเอง แทนที่จะส่งคำขอไปแล้วโดนปฏิเสธ
+    ถ้า rate_per_minute <= 0 จะไม่จำกัดอัตรา
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.throttled_count = 0  # จำนวนครั้งที่ต้องรอคิว
+        self.throttled_seconds = 0.0  # เวลารอรวม (วินาที)
+
+    def acquire(self):
+        """ใช้ token 1 ตัว (รอถ้ายังไม่มี) คืนเวลาที่ต้องรอเป็นวินาที"""
+        if self.rate <= 0:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            if wait:
+                self.throttled_count += 1
+                self.throttled_seconds += wait
+        if wait:
+            time.sleep(wait)
+        return wait
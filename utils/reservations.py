@@ -0,0 +1,123 @@
+import itertools
+import threading
+import time
+
+from .product_catalog import normalize_product_name
+
+
+class InsufficientStock(ValueError):
+    """จำนวนสินค้าที่พร้อมขาย (สต็อกหักจำนวนที่ถูกจองไว้) ไม่พอ"""
+
+    def __init__(self, product_name, available, requested):
+        super().__init__(f"สต็อก {product_name} ไม่เพียงพอ (พร้อมขาย {available} ต้องการ {requested})")
+        self.product_name = product_name
+        self.available = available
+        self.requested = requested
+
+
+class ReservationLedger:
+    """บันทึกจำนวนสินค้าที่ถูกจองไว้แต่ยังไม่ได้ตัดสต็อก (ในหน่วยความจำ ใช้ร่วมกันได้หลาย thread)
+
+    จำนวนที่พร้อมขายคือสต็อกหักจำนวนที่ถูกจองไว้ reserve() ตรวจสอบและจองทุกสินค้าพร้อมกัน
+    ภายใต้ lock เดียว ผู้ซื้อสองคนที่ซื้อชิ้นสุดท้ายพร้อมกันจึงจองได้เพียงคนเดียว
+    ส่วนอีกคนจะได้ InsufficientStock แทนที่สต็อกจะถูกปัดเป็นศูนย์
+
+    นอกจากการจองระหว่างตัดสต็อกแล้ว ยังมีการกันสินค้าในรถเข็น (hold) ของผู้ใช้แต่ละคน
+    ซึ่งหมดอายุเองหลัง hold_ttl วินาทีนับจากการเพิ่มสินค้าครั้งล่าสุด
+    """
+
+    def __init__(self, hold_ttl=900):
+        self.reserved = {}  # คีย์ชื่อสินค้า -> จำนวนที่ถูกจองรวม (รวมสินค้าที่กันไว้ในรถเข็น)
+        self.reservations = {}  # เลขที่การจอง -> {คีย์ชื่อสินค้า: จำนวน}
+        self.holds = {}  # เจ้าของรถเข็น -> {'items': {คีย์ชื่อสินค้า: จำนวน}, 'expires_at': เวลา}
+        self.hold_ttl = hold_ttl
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add_reserved(self, items, sign=1):
+        """เพิ่ม (หรือลดเมื่อ sign=-1) จำนวนที่ถูกจองรวม (ต้องถือ lock)"""
+        for key, quantity in items.items():
+            remaining = self.reserved.get(key, 0) + sign * quantity
+            if remaining > 0:
+                self.reserved[key] = remaining
+            else:
+                self.reserved.pop(key, None)
+
+    def purge_expired(self):
+        """คืนสินค้าที่กันไว้ในรถเข็นที่หมดอายุแล้ว (ต้องถือ lock)"""
+        now = time.monotonic()
+        for owner in [owner for owner, hold in self.holds.items() if hold['expires_at'] <= now]:
+            self.add_reserved(self.holds.pop(owner)['items'], -1)
+
+    def reserved_quantity(self, product_name):
+        with self.lock:
+            self.purge_expired()
+            return self.reserved.get(normalize_product_name(product_name), 0)
+
+    def held_quantity(self, owner, product_name):
+        """จำนวนสินค้าที่ owner กันไว้ในรถเข็น"""
+        with self.lock:
+            self.purge_expired()
+            hold = self.holds.get(owner)
+            return hold['items'].get(normalize_product_name(product_name), 0) if hold else 0
+
+    def hold(self, owner, product_name, quantity, stock_quantity):
+        """กันสินค้าเพิ่ม quantity ชิ้นในรถเข็นของ owner และต่ออายุการกันทั้งรถเข็น
+
+        คืนจำนวนที่พร้อมขายก่อนกัน หรือส่ง InsufficientStock ถ้าจำนวนพร้อมขายไม่พอ
+        """
+        key = normalize_product_name(product_name)
+        with self.lock:
+            self.purge_expired()
+            available = int(stock_quantity) - self.reserved.get(key, 0)
+            if available < quantity:
+                raise InsufficientStock(product_name, available, quantity)
+            hold = self.holds.setdefault(owner, {'items': {}, 'expires_at': 0})
+            hold['items'][key] = hold['items'].get(key, 0) + quantity
+            hold['expires_at'] = time.monotonic() + self.hold_ttl
+            self.add_reserved({key: quantity})
+            return available
+
+    def release_hold(self, owner):
+        """คืนสินค้าทั้งหมดที่ owner กันไว้ (เมื่อล้างรถเข็นหรือขายสำเร็จ) เรียกซ้ำได้"""
+        with self.lock:
+            hold = self.holds.pop(owner, None)
+            if hold is not None:
+                self.add_reserved(hold['items'], -1)
+
+    def available(self, product_name, stock_quantity):
+        """จำนวนที่พร้อมขายของสินค้าที่มีสต็อก stock_quantity"""
+        return int(stock_quantity) - self.reserved_quantity(product_name)
+
+    def reserve(self, quantities, stock, owner=None):
+        """จองสินค้าตาม quantities (ชื่อสินค้า -> จำนวน) โดยเทียบกับ stock (ชื่อสินค้า -> สต็อกปัจจุบัน)
+
+        สินค้าที่ owner กันไว้ในรถเข็นนับเป็นของผู้จองแล้ว จึงจองเพิ่มเฉพาะส่วนที่เกินจากที่กันไว้
+        คืนเลขที่การจอง หรือส่ง InsufficientStock โดยไม่จองสินค้าใดเลย
+        """
+        with self.lock:
+            self.purge_expired()
+            hold = self.holds.get(owner) if owner is not None else None
+            held = hold['items'] if hold else {}
+
+            items = {}
+            for product_name, quantity in quantities.items():
+                key = normalize_product_name(product_name)
+                available = int(stock[product_name]) - self.reserved.get(key, 0) + held.get(key, 0)
+                if available < quantity:
+                    raise InsufficientStock(product_name, available, quantity)
+                extra = quantity - held.get(key, 0)
+                if extra > 0:
+                    items[key] = items.get(key, 0) + extra
+
+            reservation_id = next(self.ids)
+            self.add_reserved(items)
+            self.reservations[reservation_id] = items
+            return reservation_id
+
+    def release(self, reservation_id):
+        """ยกเลิกการจอง (เรียกหลังตัดสต็อกสำเร็จหรือไม่สำเร็จ) เรียกซ้ำได้"""
+        with self.lock:
+            items = self.reservations.pop(reservation_id, None)
+            if items is not None:
+                self.add_reserved(items, -1)
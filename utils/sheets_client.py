@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+
+import gspread
+from gspread.exceptions import APIError
+from gspread.urls import DRIVE_FILES_API_V3_URL
+
+
+class SheetsClient(gspread.Client):
+    """gspread Client ที่นับจำนวนคำขอ Google Sheets/Drive API
+
+    ทุกคำขอของ gspread ผ่าน request() จึงใช้นับได้ครบทุกการเรียก
+    แยกเป็นคำขออ่าน (GET) และคำขอเขียน (POST/PUT/PATCH/DELETE)
+
+    ถ้ากำหนด read_limiter/write_limiter (TokenBucket) คำขอจะรอคิวตามโควตาก่อนส่ง
+    และคำขอที่โดน 429 หรือ 5xx จะถูกส่งใหม่สูงสุด max_retries ครั้ง
+    โดยรอแบบ exponential backoff พร้อม jitter
+
+    on_missing_range ถูกเรียกเมื่อ Google ตอบว่าอ่านช่วงข้อมูลไม่ได้ (แท็บถูกลบหรือเปลี่ยนชื่อ)
+    เพื่อให้ผู้เรียกล้าง cache ของ worksheet
+
+    write_observer (เช่น ChangeProbe) ถูกเรียก record_write() ก่อนส่งทุกคำขอเขียน
+    เพื่อแยกการแก้ไขของ bot เองออกจากการแก้ไขชีตด้วยมือ (ไม่มีคำขอเพิ่ม)
+
+    คำขอ Drive API (sheets_quota=False) นับแยกไว้ใน drive_count ไม่รวมกับคำขออ่าน/เขียนของ Google Sheets
+    """
+
+    def __init__(self, auth, session=None, read_limiter=None, write_limiter=None,
+                 max_retries=0, base_backoff=1.0, max_backoff=32.0):
+        super().__init__(auth, session)
+        self.read_limiter = read_limiter
+        self.write_limiter = write_limiter
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.read_count = 0
+        self.write_count = 0
+        self.drive_count = 0
+        self.retry_count = 0
+        self.rate_limited_count = 0  # จำนวนครั้งที่ Google ตอบ 429
+        self.stats_lock = threading.Lock()
+        self.on_missing_range = None
+        self.write_observer = None
+
+    @property
+    def request_count(self):
+        return self.read_count + self.write_count
+
+    def throttle_stats(self):
+        """สถิติการรอคิวและการลองใหม่ทั้งหมดตั้งแต่เริ่มทำงาน"""
+        stats = {'retries': self.retry_count, 'rate_limited': self.rate_limited_count}
+        for name, limiter in (('read', self.read_limiter), ('write', self.write_limiter)):
+            if limiter is not None:
+                stats[f'{name}_throttled'] = limiter.throttled_count
+                stats[f'{name}_throttled_seconds'] = round(limiter.throttled_seconds, 2)
+        return stats
+
+    def file_version(self, file_id):
+        """อ่าน version ของไฟล์จาก Drive API คืนค่า (version, แก้ไขล่าสุดโดยบัญชีนี้หรือไม่)"""
+        response = self.request('get', f'{DRIVE_FILES_API_V3_URL}/{file_id}', params={
+            'supportsAllDrives': True,
+            'fields': 'version,lastModifyingUser(me)'
+        }, sheets_quota=False)
+        metadata = response.json()
+        return int(metadata['version']), metadata.get('lastModifyingUser', {}).get('me', False)
+
+    def should_retry(self, method, endpoint, status):
+        """429 ลองใหม่ได้เสมอ ส่วน 5xx ไม่ลองใหม่กับ values:append
+        เพราะคำขออาจถูกบันทึกไปแล้ว และการส่งซ้ำจะทำให้ได้แถวซ้ำ"""
+        if status == 429:
+            return True
+        if status >= 500:
+            return not (method.lower() == 'post' and ':append' in endpoint)
+        return False
+
+    def send(self, method, endpoint, *args, **kwargs):
+        """ส่งคำขอหนึ่งครั้งโดยไม่ลองใหม่ (FakeSheetsClient แทนที่เมธอดนี้เพื่อไม่ต้องใช้เครือข่าย)"""
+        return super().request(method, endpoint, *args, **kwargs)
+
+    def request(self, method, endpoint, *args, sheets_quota=True, **kwargs):
+        """ส่งคำขอพร้อมรอคิวโควตาและลองใหม่ (sheets_quota=False สำหรับคำขอ Drive API ที่มีโควตาแยก)"""
+        is_read = method.lower() == 'get'
+        if not sheets_quota:
+            limiter = None
+            counter = 'drive_count'
+        elif is_read:
+            limiter = self.read_limiter
+            counter = 'read_count'
+        else:
+            limiter = self.write_limiter
+            counter = 'write_count'
+            if self.write_observer is not None:
+                self.write_observer.record_write()
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            with self.stats_lock:
+                setattr(self, counter, getattr(self, counter) + 1)
+            try:
+                return self.send(method, endpoint, *args, **kwargs)
+            except APIError as e:
+                status = getattr(e.response, 'status_code', 0)
+                if status == 400 and 'Unable to parse range' in str(e) and self.on_missing_range:
+                    self.on_missing_range()
+                if attempt >= self.max_retries or not self.should_retry(method, endpoint, status):
+                    raise
+                delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                attempt += 1
+                with self.stats_lock:
+                    self.retry_count += 1
+                    if status == 429:
+                        self.rate_limited_count += 1
+                print(f"⚠️ Google Sheets API ตอบกลับ {status} ลองใหม่ใน {delay:.1f} วินาที "
+                      f"(ครั้งที่ {attempt}/{self.max_retries})")
+                time.sleep(delay)
@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_FORMAT = 1
+
+
+class SnapshotWriter:
+    """บันทึกข้อมูลในหน่วยความจำลงไฟล์ snapshot (JSON บีบอัด gzip) เพื่อให้รีสตาร์ทได้เร็ว
+
+    collect() คืนค่า (version, data): version เปลี่ยนเมื่อข้อมูลเปลี่ยน ถ้า version เท่าเดิม
+    จะไม่เขียนไฟล์ซ้ำ thread เบื้องหลังจะบันทึกทุก interval วินาที และบันทึกอีกครั้งตอน close()
+    """
+
+    def __init__(self, path, collect, interval=60.0):
+        self.path = path
+        self.collect = collect
+        self.interval = interval
+        self.saved_version = None
+        self.save_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def load(self):
+        """อ่าน snapshot จากไฟล์ คืน None ถ้าไม่มีไฟล์ อ่านไม่ได้ หรือเป็นรูปแบบอื่น"""
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if snapshot.get('format') != SNAPSHOT_FORMAT:
+                return None
+            return snapshot
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ ไม่สามารถอ่าน snapshot ได้: {e}")
+            return None
+
+    def start(self):
+        if self.thread is None and self.interval > 0:
+            self.thread = threading.Thread(target=self.run, name='snapshot-writer', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.save()
+
+    def save(self):
+        """เขียน snapshot แบบ atomic ถ้าข้อมูลเปลี่ยนตั้งแต่ครั้งก่อน คืน True ถ้าเขียนไฟล์"""
+        with self.save_lock:
+            try:
+                version, data = self.collect()
+                if data is None or version == self.saved_version:
+                    return False
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'wb') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+                        f.write(json.dumps(
+                            dict(data, format=SNAPSHOT_FORMAT, saved_at=time.time()),
+                            ensure_ascii=False, separators=(',', ':')
+                        ).encode('utf-8'))
+                    raw.flush()
+                    os.fsync(raw.fileno())
+                os.replace(tmp_path, self.path)
+                self.saved_version = version
+                return True
+            except Exception as e:
+                print(f"❌ ไม่สามารถบันทึก snapshot ได้: {e}")
+                return False
+
+    def close(self):
+        """หยุด thread และบันทึกข้อมูลล่าสุด"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 1)
+            self.thread = None
+        self.save()
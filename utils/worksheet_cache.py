@@ -0,0 +1,48 @@
+import threading
+
+import gspread
+
+
+class WorksheetCache:
+    """cache ของ worksheet ใน spreadsheet
+
+    spreadsheet.worksheet(title) ของ gspread อ่าน metadata ของ spreadsheet ทุกครั้งที่เรียก
+    cache นี้ดึง worksheet ทุกแท็บด้วย worksheets() ครั้งเดียวแล้วใช้ซ้ำ
+    และจะดึงใหม่เมื่อหาแท็บไม่พบ หรือเมื่อถูก invalidate() (เช่น แท็บถูกลบหรือเปลี่ยนชื่อ)
+    """
+
+    def __init__(self, get_spreadsheet):
+        self.get_spreadsheet = get_spreadsheet  # ฟังก์ชันที่คืน spreadsheet ปัจจุบัน
+        self.worksheets = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """ดึง worksheet ทั้งหมดใหม่ด้วยคำขอเดียว"""
+        worksheets = {sheet.title: sheet for sheet in self.get_spreadsheet().worksheets()}
+        with self.lock:
+            self.worksheets = worksheets
+
+    def invalidate(self):
+        """ล้าง cache เพื่อให้ดึง worksheet ใหม่ในการใช้งานครั้งถัดไป"""
+        with self.lock:
+            self.worksheets = {}
+
+    def find(self, title):
+        """คืน worksheet จาก cache หรือ None (ไม่เรียก API)"""
+        with self.lock:
+            return self.worksheets.get(title)
+
+    def add(self, sheet):
+        """เพิ่ม worksheet ที่เพิ่งสร้างเข้า cache"""
+        with self.lock:
+            self.worksheets[sheet.title] = sheet
+
+    def get(self, title):
+        """คืน worksheet ตามชื่อ (ดึงใหม่หนึ่งครั้งถ้าไม่มีใน cache)"""
+        sheet = self.find(title)
+        if sheet is None:
+            self.refresh()
+            sheet = self.find(title)
+            if sheet is None:
+                raise gspread.WorksheetNotFound(title)
+        return sheet